@@ -0,0 +1,426 @@
+"""
+Load test the webhook end to end against local Groq and Graph API stubs.
+
+Each scenario starts a fresh server process (its own temporary database and
+ingest log) wired to in-process stubs, replays generated Facebook and
+Instagram deliveries at it, waits until every accepted delivery has been
+classified and stored, then reports:
+
+  ack latency     p50/p95/p99/max of the webhook response, i.e. what Meta sees
+  ack throughput  deliveries acknowledged per second
+  processing      leads stored per second, from first request to drained queue
+  memory          peak and final RSS of the server process (Linux only)
+
+Open-loop scenarios send on a fixed schedule and measure latency from the
+scheduled send time, so a stalled server shows up as latency instead of a
+slower request rate.
+
+Baselines: --save-baseline writes the results to JSON; --compare fails
+(exit code 1) when throughput drops or latency/memory grows by more than
+--tolerance against a saved baseline. Baselines are machine-specific, so
+record one on the machine that runs the comparison.
+
+Usage:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --scenario batched --scenario redeliveries --scale 0.2
+    python benchmarks/load_test.py --groq-latency-ms 800 --groq-throttle-rate 0.05
+    python benchmarks/load_test.py --save-baseline benchmarks/baselines/local.json
+    python benchmarks/load_test.py --compare benchmarks/baselines/local.json --tolerance 0.25
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from payloads import PayloadFactory
+from preclassifier_bench import percentile
+from stubs import StubServer, add_behavior_arguments, behaviors_from_args, create_graph_app, create_groq_app
+from webhook_security import SIGNATURE_HEADER, sign
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+API_KEY = "benchmark-api-key"
+# Deliveries are signed like Meta signs them, so verification is part of the measured path
+APP_SECRET = "benchmark-app-secret"
+
+# closed loop: `concurrency` senders back to back; open loop: `rates` steps of (deliveries/s, seconds)
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "facebook_single": {
+        "description": "One Facebook comment per delivery",
+        "deliveries": 2000, "changes": 1, "instagram_share": 0.0, "concurrency": 32,
+    },
+    "instagram_single": {
+        "description": "One Instagram comment per delivery",
+        "deliveries": 2000, "changes": 1, "instagram_share": 1.0, "concurrency": 32,
+    },
+    "batched": {
+        "description": "Meta-style batches of 25 changes, mixed sources",
+        "deliveries": 200, "changes": 25, "instagram_share": 0.5, "concurrency": 16,
+    },
+    "redeliveries": {
+        "description": "30% of deliveries are retries of earlier ones",
+        "deliveries": 2000, "changes": 2, "instagram_share": 0.5, "concurrency": 32, "duplicate_share": 0.3,
+    },
+    "steady_rate": {
+        "description": "Open loop at a fixed 100 deliveries/s",
+        "changes": 1, "instagram_share": 0.5, "rates": [(100, 15)],
+    },
+    "ramp": {
+        "description": "Open loop stepping 50 -> 200 -> 500 deliveries/s",
+        "changes": 1, "instagram_share": 0.5, "rates": [(50, 5), (200, 5), (500, 5)],
+    },
+}
+
+# metric -> direction that counts as a regression
+COMPARED_METRICS = {
+    "ack_per_second": "lower",
+    "leads_per_second": "lower",
+    "p95_ms": "higher",
+    "p99_ms": "higher",
+    "peak_rss_mb": "higher",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def proc_memory_mb(pid: int, field: str) -> Optional[float]:
+    """VmRSS / VmHWM (peak) of a process in MB, from /proc; None where unavailable"""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+class ServerProcess:
+    """The app under test, run by uvicorn in a child process with an isolated data directory"""
+
+    def __init__(self, module: str, env: Dict[str, str]):
+        self.module = module
+        self.port = free_port()
+        self.data_dir = tempfile.mkdtemp(prefix="lead-agent-bench-")
+        self.env = {
+            **os.environ,
+            "API_KEY": API_KEY,
+            "APP_SECRET": APP_SECRET,
+            "LEADS_DB_FILE": os.path.join(self.data_dir, "leads.db"),
+            "LEADS_CSV_FILE": os.path.join(self.data_dir, "leads.csv"),
+            "INGEST_LOG_DIR": os.path.join(self.data_dir, "ingest_log"),
+            "CLASSIFICATION_CACHE_DB": "",
+            "LOG_LEVEL": "WARNING",
+            "LOG_FORMAT": "json",
+            "LOG_PAYLOAD_SAMPLE_RATE": "0",
+            **env,
+        }
+        self.env.pop("REPLY_OUTBOX_DB", None)
+        self.process: Optional[subprocess.Popen] = None
+        self.log_path = os.path.join(self.data_dir, "server.log")
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def spawn(self):
+        self._log = open(self.log_path, "wb")
+        self.spawned_at = time.perf_counter()
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", f"{self.module}:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--log-level", "warning", "--no-access-log"],
+            cwd=BACKEND_DIR, env=self.env, stdout=self._log, stderr=subprocess.STDOUT,
+        )
+
+    async def wait_for(
+        self, client: httpx.AsyncClient, path: str = "/readyz", timeout: float = 30.0, poll_interval: float = 0.1
+    ) -> float:
+        """Poll `path` until it answers 200, returns seconds since the process was spawned"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with {self.process.returncode}; see {self.log_path}")
+            try:
+                if (await client.get(f"{self.url}{path}")).status_code == 200:
+                    return time.perf_counter() - self.spawned_at
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(poll_interval)
+        raise RuntimeError(f"Server did not answer {path} in {timeout}s; see {self.log_path}")
+
+    async def start(self, client: httpx.AsyncClient, timeout: float = 30.0):
+        self.spawn()
+        await self.wait_for(client, "/readyz", timeout)
+
+    def stop(self, keep_data: bool = False):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self._log.close()
+        if not keep_data:
+            shutil.rmtree(self.data_dir, ignore_errors=True)
+
+
+class LoadRun:
+    """Sends one scenario's deliveries and records per-request latency and status"""
+
+    def __init__(self, client: httpx.AsyncClient, url: str, scenario: Dict[str, Any], scale: float, seed: int):
+        self.client = client
+        self.url = url
+        self.scenario = scenario
+        self.scale = scale
+        self.factory = PayloadFactory(seed=seed)
+        self.sent: List[bytes] = []
+        self.latencies_ms: List[float] = []
+        self.statuses: Counter = Counter()
+        self.leads_sent = 0
+
+    def _next_body(self) -> bytes:
+        duplicate_share = self.scenario.get("duplicate_share", 0.0)
+        if self.sent and self.factory.rng.random() < duplicate_share:
+            # Meta redelivers the exact same bytes
+            return self.factory.rng.choice(self.sent)
+        payload = self.factory.delivery(self.scenario["changes"], self.scenario["instagram_share"])
+        body = json.dumps(payload).encode("utf-8")
+        self.sent.append(body)
+        self.leads_sent += self.scenario["changes"]
+        return body
+
+    async def _send(self, body: bytes, scheduled: float):
+        try:
+            response = await self.client.post(
+                f"{self.url}/webhook",
+                content=body,
+                headers={"Content-Type": "application/json", SIGNATURE_HEADER: sign(body, APP_SECRET)}
+            )
+            status = str(response.status_code)
+            if response.status_code == 200:
+                status = response.json().get("status", status)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.latencies_ms.append((time.perf_counter() - scheduled) * 1000)
+        self.statuses[status] += 1
+
+    async def closed_loop(self):
+        remaining = max(1, int(self.scenario["deliveries"] * self.scale))
+
+        async def sender():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                await self._send(self._next_body(), time.perf_counter())
+
+        await asyncio.gather(*(sender() for _ in range(self.scenario["concurrency"])))
+
+    async def open_loop(self):
+        tasks = []
+        for rate, seconds in self.scenario["rates"]:
+            interval = 1.0 / rate
+            step_start = time.perf_counter()
+            for index in range(max(1, int(rate * seconds * self.scale))):
+                scheduled = step_start + index * interval
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(self._send(self._next_body(), scheduled)))
+        await asyncio.gather(*tasks)
+
+    async def run(self):
+        if "rates" in self.scenario:
+            await self.open_loop()
+        else:
+            await self.closed_loop()
+
+
+async def wait_until_drained(client: httpx.AsyncClient, url: str, timeout: float) -> bool:
+    """True once every logged delivery is committed and no worker is busy"""
+    headers = {"X-API-Key": API_KEY}
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        ingest = (await client.get(f"{url}/ingest/stats", headers=headers)).json()
+        queue = (await client.get(f"{url}/queue/stats", headers=headers)).json()
+        if ingest["uncommitted"] == 0 and queue["depth"] == 0 and queue["in_flight"] == 0:
+            return True
+        await asyncio.sleep(0.05)
+    return False
+
+
+async def run_scenario(name: str, scenario: Dict[str, Any], args, stub_urls: Dict[str, str]) -> Dict[str, Any]:
+    env = {
+        "GROQ_API_KEY": "benchmark",
+        "GROQ_BASE_URL": stub_urls["groq"],
+        "PAGE_ACCESS_TOKEN": "benchmark",
+        "GRAPH_API_BASE_URL": f"{stub_urls['graph']}/v18.0",
+    }
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(limits=limits, timeout=args.request_timeout) as client:
+        server = ServerProcess(args.app, env)
+        try:
+            await server.start(client)
+            load = LoadRun(client, server.url, scenario, args.scale, args.seed)
+            started = time.perf_counter()
+            await load.run()
+            send_seconds = time.perf_counter() - started
+            drained = await wait_until_drained(client, server.url, args.drain_timeout)
+            total_seconds = time.perf_counter() - started
+
+            headers = {"X-API-Key": API_KEY}
+            lead_stats = (await client.get(f"{server.url}/leads/stats", headers=headers)).json()
+            queue_stats = (await client.get(f"{server.url}/queue/stats", headers=headers)).json()
+            classifier_stats = (await client.get(f"{server.url}/classifier/stats", headers=headers)).json()
+            peak_rss_mb = proc_memory_mb(server.process.pid, "VmHWM")
+            rss_mb = proc_memory_mb(server.process.pid, "VmRSS")
+        finally:
+            server.stop(keep_data=args.keep_data)
+
+    deliveries = len(load.latencies_ms)
+    stored = lead_stats["total"]
+    return {
+        "description": scenario["description"],
+        "deliveries": deliveries,
+        "leads_sent": load.leads_sent,
+        "leads_stored": stored,
+        "statuses": dict(load.statuses),
+        "send_seconds": round(send_seconds, 3),
+        "total_seconds": round(total_seconds, 3),
+        "drained": drained,
+        "ack_per_second": round(deliveries / send_seconds, 1) if send_seconds else 0.0,
+        "leads_per_second": round(stored / total_seconds, 1) if total_seconds else 0.0,
+        "p50_ms": round(percentile(load.latencies_ms, 50), 2),
+        "p95_ms": round(percentile(load.latencies_ms, 95), 2),
+        "p99_ms": round(percentile(load.latencies_ms, 99), 2),
+        "max_ms": round(max(load.latencies_ms, default=0.0), 2),
+        "peak_rss_mb": peak_rss_mb,
+        "rss_mb": rss_mb,
+        "queue_high_water_mark": queue_stats["high_water_mark"],
+        "groq_requests": classifier_stats["requests"],
+        "classifier_tiers": classifier_stats["tiers"],
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Human-readable regressions beyond `tolerance` (0.25 = 25%) against a saved baseline"""
+    regressions = []
+    for name, row in results.items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        for metric, worse in COMPARED_METRICS.items():
+            old, new = previous.get(metric), row.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (worse == "higher" and change > tolerance) or (worse == "lower" and -change > tolerance):
+                regressions.append(f"{name}: {metric} {old} -> {new} ({change:+.1%})")
+    return regressions
+
+
+def print_report(results: Dict[str, Dict[str, Any]]):
+    print(
+        f"{'scenario':<18}{'deliv':>7}{'ack/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        f"{'stored':>8}{'leads/s':>9}{'peak MB':>9}  statuses"
+    )
+    for name, row in results.items():
+        peak = f"{row['peak_rss_mb']:.1f}" if row["peak_rss_mb"] is not None else "-"
+        statuses = " ".join(f"{status}={count}" for status, count in sorted(row["statuses"].items()))
+        print(
+            f"{name:<18}{row['deliveries']:>7}{row['ack_per_second']:>9.1f}{row['p50_ms']:>9.2f}"
+            f"{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}{row['leads_stored']:>8}"
+            f"{row['leads_per_second']:>9.1f}{peak:>9}  {statuses}"
+        )
+        if not row["drained"]:
+            print(f"{'':<18}warning: queue not drained within the timeout; processing figures are partial")
+
+
+async def run(args) -> Dict[str, Dict[str, Any]]:
+    behaviors = behaviors_from_args(args)
+    stubs = {
+        "groq": StubServer(create_groq_app(behaviors["groq"]), free_port()),
+        "graph": StubServer(create_graph_app(behaviors["graph"]), free_port()),
+    }
+    for stub in stubs.values():
+        await stub.start()
+    results = {}
+    try:
+        for name in args.scenario or list(SCENARIOS):
+            print(f"Running {name}: {SCENARIOS[name]['description']}", file=sys.stderr)
+            results[name] = await run_scenario(name, SCENARIOS[name], args, {k: s.url for k, s in stubs.items()})
+    finally:
+        for stub in stubs.values():
+            await stub.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="main_production", help="Module exposing the FastAPI `app`")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="Repeatable (default: all)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every scenario's request count")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-connections", type=int, default=256, help="Client connection pool size")
+    parser.add_argument("--request-timeout", type=float, default=30)
+    parser.add_argument("--drain-timeout", type=float, default=300, help="Seconds to wait for processing to finish")
+    parser.add_argument("--keep-data", action="store_true", help="Keep each run's database, ingest log and server log")
+    add_behavior_arguments(parser)
+    parser.add_argument("--json", dest="json_path", help="Also write the full results to this file")
+    parser.add_argument("--save-baseline", help="Write the results as a baseline JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative change before failing")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_report(results)
+
+    document = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {
+            key: getattr(args, key) for key in (
+                "app", "scale", "seed", "groq_latency_ms", "groq_error_rate", "groq_throttle_rate",
+                "graph_latency_ms", "graph_error_rate", "graph_throttle_rate",
+            )
+        },
+        "scenarios": results,
+    }
+    for path in (args.json_path, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(document, f, indent=2)
+            print(f"\nResults written to {path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != document["settings"]:
+            print(f"\nwarning: baseline settings differ: {baseline.get('settings')}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
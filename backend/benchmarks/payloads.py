@@ -0,0 +1,110 @@
+"""
+Realistic Meta webhook payloads for benchmarks.
+
+Builds Facebook Page `feed` and Instagram `comments` deliveries shaped like
+the ones Meta sends, with one or many changes per delivery and unique
+comment ids, so scenarios can replay them (and redeliver some of them)
+against the webhook.
+"""
+import itertools
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+# Roughly the mix seen on giveaway and product posts
+SAMPLE_COMMENTS = [
+    "price?", "Price plz", "how much", "How much is this?? 😍", "info pls", "details please",
+    "dm me the price", "cuánto cuesta?", "prix?", "quanto custa", "kitne ka hai?", "قیمت؟",
+    "is it available in blue?", "do you ship to Canada?", "where can I buy this",
+    "😍😍😍", "🔥🔥", "❤️", "@maria", "@john @sarah look!", "@alex this one",
+    "follow me for free followers", "check my profile for crypto tips", "http://bit.ly/win-now",
+    "Love it!", "So beautiful", "Amazing work", "wow", "Need this in my life",
+    "The price was a scam and I want a refund", "my order never arrived, terrible service",
+    "Does it come with a warranty and how long does delivery usually take to Lahore?",
+    "I bought one last year and it still works great, would recommend to anyone",
+    "Is this the same model my sister has?", "what material is it made of",
+]
+
+
+class PayloadFactory:
+    """Generates deliveries with unique comment ids from a comment corpus"""
+
+    def __init__(
+        self,
+        comments: Optional[List[str]] = None,
+        page_ids: int = 3,
+        posts_per_page: int = 5,
+        users: int = 5000,
+        seed: int = 42,
+    ):
+        self.comments = comments or SAMPLE_COMMENTS
+        self.rng = random.Random(seed)
+        self.page_ids = [f"10{index:013d}" for index in range(1, page_ids + 1)]
+        self.posts_per_page = posts_per_page
+        self.users = users
+        self._ids = itertools.count(1)
+
+    def _comment(self) -> Dict[str, Any]:
+        number = next(self._ids)
+        return {
+            "id": f"{number:016d}",
+            "user_id": str(self.rng.randint(1, self.users) + 20000000),
+            "post": self.rng.randrange(self.posts_per_page),
+            "text": self.rng.choice(self.comments),
+        }
+
+    def facebook(self, changes: int = 1) -> Dict[str, Any]:
+        page_id = self.rng.choice(self.page_ids)
+        now = int(time.time())
+        return {
+            "object": "page",
+            "entry": [{
+                "id": page_id,
+                "time": now,
+                "changes": [
+                    {
+                        "field": "feed",
+                        "value": {
+                            "item": "comment",
+                            "verb": "add",
+                            "from": {"id": comment["user_id"], "name": f"User {comment['user_id']}"},
+                            "post_id": f"{page_id}_{comment['post']}",
+                            "comment_id": f"{page_id}_{comment['id']}",
+                            "parent_id": f"{page_id}_{comment['post']}",
+                            "message": comment["text"],
+                            "created_time": now,
+                        },
+                    }
+                    for comment in (self._comment() for _ in range(changes))
+                ],
+            }],
+        }
+
+    def instagram(self, changes: int = 1) -> Dict[str, Any]:
+        account_id = self.rng.choice(self.page_ids)
+        now = int(time.time())
+        return {
+            "object": "instagram",
+            "entry": [{
+                "id": account_id,
+                "time": now,
+                "changes": [
+                    {
+                        "field": "comments",
+                        "value": {
+                            "from": {"id": comment["user_id"], "username": f"user{comment['user_id']}"},
+                            "media": {"id": f"17{account_id}{comment['post']:03d}", "media_product_type": "FEED"},
+                            "id": f"18{comment['id']}",
+                            "text": comment["text"],
+                        },
+                    }
+                    for comment in (self._comment() for _ in range(changes))
+                ],
+            }],
+        }
+
+    def delivery(self, changes: int = 1, instagram_share: float = 0.5) -> Dict[str, Any]:
+        """A Facebook or Instagram delivery, picked at random by `instagram_share`"""
+        if self.rng.random() < instagram_share:
+            return self.instagram(changes)
+        return self.facebook(changes)
@@ -0,0 +1,124 @@
+"""
+Benchmark the classification tiers: rules, cache and LLM.
+
+Replays a comment corpus through GroqClassifier and reports the share of
+traffic each tier answers plus p50/p99 latency per tier. The LLM tier is
+simulated with a fixed latency unless --live is given (needs GROQ_API_KEY).
+
+Usage:
+    python benchmarks/preclassifier_bench.py
+    python benchmarks/preclassifier_bench.py --corpus comments.txt --count 20000
+    python benchmarks/preclassifier_bench.py --live
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classification_cache import ClassificationCache  # noqa: E402
+from classifier import GroqClassifier  # noqa: E402
+from preclassifier import IntentMatcher, load_lexicon  # noqa: E402
+
+from payloads import SAMPLE_COMMENTS  # noqa: E402
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def load_corpus(path: str, count: int, seed: int) -> List[str]:
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            base = [line.strip() for line in f if line.strip()]
+    else:
+        base = SAMPLE_COMMENTS
+    rng = random.Random(seed)
+    return [rng.choice(base) for _ in range(count)]
+
+
+async def run(args) -> Dict[str, Dict[str, float]]:
+    matcher = IntentMatcher(load_lexicon(args.lexicon), threshold=args.threshold)
+    cache = ClassificationCache(max_entries=args.cache_size)
+    classifier = GroqClassifier(
+        api_key=os.getenv("GROQ_API_KEY") if args.live else "benchmark",
+        cache=cache,
+        max_concurrency=args.concurrency,
+        batch_size=1,
+        matcher=matcher,
+    )
+    if not args.live:
+        async def simulated_completion(messages, max_tokens, tenant=""):
+            await asyncio.sleep(args.llm_latency_ms / 1000)
+            return json.dumps({"ai_response_text": "Thanks! Check your DMs.", "priority_score": "Medium"})
+        classifier._complete = simulated_completion
+
+    comments = load_corpus(args.corpus, args.count, args.seed)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def classify_one(comment: str):
+        async with semaphore:
+            started = time.perf_counter()
+            _, tier = await classifier.classify_with_tier(comment)
+            latencies[tier].append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(classify_one(comment) for comment in comments))
+    wall_seconds = time.perf_counter() - started
+    await classifier.close()
+
+    report = {}
+    for tier, samples in sorted(latencies.items()):
+        report[tier] = {
+            "count": len(samples),
+            "share": round(len(samples) / len(comments), 4),
+            "p50_ms": round(percentile(samples, 50), 4),
+            "p99_ms": round(percentile(samples, 99), 4),
+        }
+    report["overall"] = {
+        "count": len(comments),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_per_second": round(len(comments) / wall_seconds, 1) if wall_seconds else 0.0,
+        "llm_avoided_share": round(1 - len(latencies.get("llm", [])) / len(comments), 4),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Text file with one comment per line (default: built-in sample)")
+    parser.add_argument("--count", type=int, default=5000, help="Comments to classify")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("PRECLASSIFIER_THRESHOLD", 0.85)))
+    parser.add_argument("--lexicon", default=os.getenv("INTENT_LEXICON_FILE") or None)
+    parser.add_argument("--cache-size", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency-ms", type=float, default=400, help="Simulated Groq latency")
+    parser.add_argument("--live", action="store_true", help="Call the real Groq API for the LLM tier")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(f"{'tier':<10}{'count':>8}{'share':>9}{'p50 ms':>12}{'p99 ms':>12}")
+    for tier, row in report.items():
+        if tier == "overall":
+            continue
+        print(f"{tier:<10}{row['count']:>8}{row['share']:>9.1%}{row['p50_ms']:>12.3f}{row['p99_ms']:>12.3f}")
+    overall = report["overall"]
+    print(
+        f"\n{overall['count']} comments in {overall['wall_seconds']}s "
+        f"({overall['throughput_per_second']}/s), {overall['llm_avoided_share']:.1%} never reached the LLM"
+    )
+
+
+if __name__ == "__main__":
+    main()
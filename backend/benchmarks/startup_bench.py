@@ -0,0 +1,132 @@
+"""
+Benchmark cold start: how long a fresh server process takes to answer.
+
+For each store size, each run spawns a new server process with a
+pre-filled lead store and records:
+
+  import     seconds to import the app module in a bare interpreter
+  live       spawn until GET /healthz answers 200 (what a liveness probe sees)
+  ready      spawn until GET /readyz answers 200 (webhooks accepted)
+  warm-up    the server's own lifespan-start-to-ready time, from /readyz
+
+On autoscaled containers `ready` decides how long Meta's deliveries are
+refused with 503 (and retried) after a scale-up. Startup work that grows
+with the data set (dedup seeding, stats rebuild) shows up in the gap
+between `live` and `ready`.
+
+Usage:
+    python benchmarks/startup_bench.py
+    python benchmarks/startup_bench.py --leads 0 --leads 200000 --runs 5
+    python benchmarks/startup_bench.py --app main --json startup.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lead_store import SQLiteLeadStore
+from load_test import BACKEND_DIR, ServerProcess
+from payloads import SAMPLE_COMMENTS
+from preclassifier_bench import percentile
+
+
+def fill_store(db_path: str, count: int, batch_size: int = 10000):
+    """Write `count` synthetic leads straight into a fresh SQLite store"""
+    store = SQLiteLeadStore(db_path)
+    store.init()
+    for start in range(0, count, batch_size):
+        store.add_many(
+            {
+                "timestamp": f"2026-01-01T00:{(index // 60) % 60:02d}:{index % 60:02d}",
+                "source": "facebook" if index % 3 else "instagram",
+                "user_id": str(20000000 + index % 5000),
+                "comment_text": SAMPLE_COMMENTS[index % len(SAMPLE_COMMENTS)],
+                "post_id": f"100000000000001_{index % 50}",
+                "priority": ("High", "Normal", "Low")[index % 3],
+                "ai_response": "Thanks!",
+                "comment_id": f"seed_{index}",
+            }
+            for index in range(start, min(count, start + batch_size))
+        )
+    store.close()
+
+
+def measure_import(module: str, env: Dict[str, str]) -> float:
+    code = f"import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+async def run_once(app: str, template_db: str) -> Dict[str, float]:
+    server = ServerProcess(app, {})
+    shutil.copy(template_db, server.env["LEADS_DB_FILE"])
+    try:
+        imported = measure_import(app, server.env)
+        async with httpx.AsyncClient(timeout=5) as client:
+            server.spawn()
+            live = await server.wait_for(client, "/healthz", timeout=120, poll_interval=0.005)
+            ready = await server.wait_for(client, "/readyz", timeout=600, poll_interval=0.005)
+            warm_up = (await client.get(f"{server.url}/readyz")).json().get("startup_seconds") or 0.0
+    finally:
+        server.stop()
+    return {"import": imported, "live": live, "ready": ready, "warm_up": warm_up}
+
+
+async def run(args) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for count in args.leads:
+        template_dir = tempfile.mkdtemp(prefix="lead-agent-startup-")
+        try:
+            template_db = os.path.join(template_dir, "leads.db")
+            print(f"Filling a store with {count} leads...")
+            fill_store(template_db, count)
+            samples: Dict[str, List[float]] = {"import": [], "live": [], "ready": [], "warm_up": []}
+            for _ in range(args.runs):
+                for key, value in (await run_once(args.app, template_db)).items():
+                    samples[key].append(value)
+        finally:
+            shutil.rmtree(template_dir, ignore_errors=True)
+        results[str(count)] = {
+            key: {"p50": round(percentile(values, 50), 4), "max": round(max(values), 4)}
+            for key, values in samples.items()
+        }
+    return results
+
+
+def print_report(results: Dict[str, Any]):
+    print(f"\n{'leads':>10} " + " ".join(f"{key + ' p50/max s':>20}" for key in ("import", "live", "ready", "warm_up")))
+    for count, row in results.items():
+        cells = " ".join(f"{row[key]['p50']:>10.3f}/{row[key]['max']:<9.3f}" for key in ("import", "live", "ready", "warm_up"))
+        print(f"{count:>10} {cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="main_production", help="Module exposing the FastAPI `app`")
+    parser.add_argument("--leads", type=int, action="append", help="Store size to start with (repeatable, default: 0 and 100000)")
+    parser.add_argument("--runs", type=int, default=3, help="Cold starts per store size")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file")
+    args = parser.parse_args()
+    args.leads = args.leads or [0, 100000]
+
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"app": args.app, "runs": args.runs, "results": results}, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
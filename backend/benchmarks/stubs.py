@@ -0,0 +1,232 @@
+"""
+Local stand-ins for the Groq chat completions API and the Meta Graph API.
+
+Both answer like the real services (same paths, response shapes and error
+formats) after a configurable latency, and fail or throttle a configurable
+fraction of calls, so load tests exercise retries, backoff and rate-limit
+handling without network access or API costs.
+
+Usage (standalone, e.g. against a manually started server):
+    python benchmarks/stubs.py --groq-port 9100 --graph-port 9200 --groq-latency-ms 300
+    GROQ_BASE_URL=http://127.0.0.1:9100 GRAPH_API_BASE_URL=http://127.0.0.1:9200/v18.0 python main_production.py
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import random
+import re
+import time
+from collections import Counter
+from typing import Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+_NUMBERED_LINE_RE = re.compile(r"^(\d+)\.\s", re.MULTILINE)
+
+_PRIORITIES = ("High", "Medium", "Low")
+
+
+class StubBehavior:
+    """Latency and failure injection shared by both stubs"""
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter: float = 0.2,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        seed: int = 7,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rng = random.Random(seed)
+        self.calls: Counter = Counter()
+
+    async def delay(self):
+        if self.latency_ms > 0:
+            spread = self.latency_ms * self.jitter
+            await asyncio.sleep(max(0.0, self.rng.uniform(self.latency_ms - spread, self.latency_ms + spread)) / 1000)
+
+    def outcome(self) -> str:
+        """ok, error or throttled, drawn from the configured rates"""
+        roll = self.rng.random()
+        if roll < self.throttle_rate:
+            outcome = "throttled"
+        elif roll < self.throttle_rate + self.error_rate:
+            outcome = "error"
+        else:
+            outcome = "ok"
+        self.calls[outcome] += 1
+        return outcome
+
+
+def _verdict(comment: str) -> Dict[str, str]:
+    # Deterministic per comment so repeated text gets the same answer
+    priority = _PRIORITIES[hashlib.blake2b(comment.encode("utf-8"), digest_size=1).digest()[0] % 3]
+    return {"ai_response_text": "Thanks for your interest! Check your DMs for details.", "priority_score": priority}
+
+
+def create_groq_app(behavior: StubBehavior) -> FastAPI:
+    """OpenAI-compatible /openai/v1/chat/completions that answers single and batched prompts"""
+    app = FastAPI(title="Groq stub")
+    ids = itertools.count(1)
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await behavior.delay()
+        outcome = behavior.outcome()
+        if outcome == "throttled":
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after": "1", "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "1s"},
+            )
+        if outcome == "error":
+            return JSONResponse(
+                {"error": {"message": "Internal server error", "type": "internal_server_error"}}, status_code=500
+            )
+
+        prompt = body["messages"][-1]["content"]
+        if prompt.startswith("Comments:\n"):
+            lines = prompt[len("Comments:\n"):].splitlines()
+            content = json.dumps([
+                {"index": index, **_verdict(line.split(". ", 1)[-1])}
+                for index, line in enumerate(lines, start=1)
+                if _NUMBERED_LINE_RE.match(line)
+            ])
+        else:
+            content = json.dumps(_verdict(prompt))
+        prompt_tokens = sum(len(message["content"]) for message in body["messages"]) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-stub-{next(ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    return app
+
+
+def create_graph_app(behavior: StubBehavior) -> FastAPI:
+    """Graph API comment reply edges: POST /{version}/{comment_id}/comments|replies"""
+    app = FastAPI(title="Graph API stub")
+    ids = itertools.count(1)
+
+    @app.post("/{version}/{object_id}/{edge}")
+    async def create_reply(version: str, object_id: str, edge: str):
+        await behavior.delay()
+        if edge not in ("comments", "replies"):
+            return JSONResponse(
+                {"error": {"message": f"Unknown path components: /{edge}", "type": "OAuthException", "code": 2500}},
+                status_code=400,
+            )
+        outcome = behavior.outcome()
+        if outcome == "throttled":
+            return JSONResponse(
+                {"error": {"message": "(#4) Application request limit reached", "type": "OAuthException", "code": 4}},
+                status_code=400,
+                headers={"x-app-usage": json.dumps({"call_count": 100, "total_cputime": 40, "total_time": 40})},
+            )
+        if outcome == "error":
+            return JSONResponse(
+                {"error": {"message": "An unexpected error has occurred.", "type": "OAuthException",
+                           "code": 2, "is_transient": True}},
+                status_code=500,
+            )
+        return {"id": f"{object_id}_{next(ids)}"}
+
+    return app
+
+
+class StubServer:
+    """Serves an ASGI app with uvicorn inside the current event loop"""
+
+    def __init__(self, app: FastAPI, port: int, host: str = "127.0.0.1"):
+        self.host = host
+        self.port = port
+        self._server = uvicorn.Server(
+            uvicorn.Config(app, host=host, port=port, log_level="warning", access_log=False, lifespan="off")
+        )
+        self._task = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            if self._task.done():
+                # Surface bind errors instead of waiting forever
+                self._task.result()
+            await asyncio.sleep(0.01)
+
+    async def stop(self):
+        if self._task is not None:
+            self._server.should_exit = True
+            await self._task
+            self._task = None
+
+
+def add_behavior_arguments(parser: argparse.ArgumentParser):
+    """Latency and failure flags for both stubs, shared with the load test CLI"""
+    parser.add_argument("--groq-latency-ms", type=float, default=300, help="Simulated Groq completion latency")
+    parser.add_argument("--groq-error-rate", type=float, default=0.0, help="Share of Groq calls answered with 500")
+    parser.add_argument("--groq-throttle-rate", type=float, default=0.0, help="Share of Groq calls answered with 429")
+    parser.add_argument("--graph-latency-ms", type=float, default=150, help="Simulated Graph reply latency")
+    parser.add_argument("--graph-error-rate", type=float, default=0.0, help="Share of replies answered with a transient error")
+    parser.add_argument("--graph-throttle-rate", type=float, default=0.0, help="Share of replies answered with code 4")
+
+
+def behaviors_from_args(args) -> Dict[str, StubBehavior]:
+    return {
+        "groq": StubBehavior(args.groq_latency_ms, error_rate=args.groq_error_rate, throttle_rate=args.groq_throttle_rate),
+        "graph": StubBehavior(args.graph_latency_ms, error_rate=args.graph_error_rate, throttle_rate=args.graph_throttle_rate),
+    }
+
+
+async def serve_forever(args):
+    behaviors = behaviors_from_args(args)
+    servers: List[StubServer] = [
+        StubServer(create_groq_app(behaviors["groq"]), args.groq_port),
+        StubServer(create_graph_app(behaviors["graph"]), args.graph_port),
+    ]
+    for server in servers:
+        await server.start()
+    print(f"Groq stub:  {servers[0].url}")
+    print(f"Graph stub: {servers[1].url}/v18.0")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for server in servers:
+            await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groq-port", type=int, default=9100)
+    parser.add_argument("--graph-port", type=int, default=9200)
+    add_behavior_arguments(parser)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve_forever(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark per-tenant fairness: how long quiet pages wait while one page goes viral.
+
+One viral tenant floods the webhook queue while quiet tenants keep sending
+a delivery now and then. Each delivery is processed like a worker job: one
+simulated Groq call per comment under the classifier's concurrency limit.
+The run is repeated with the old single FIFO queue and global semaphore,
+and with per-tenant lanes and fair-share LLM slots. Reported: the time
+from publish to processed for quiet and viral deliveries (p50/p99).
+The queue is drained completely before reporting; deliveries it still
+held when --drain-timeout ran out are counted as left.
+
+Usage:
+    python benchmarks/tenant_fairness_bench.py
+    python benchmarks/tenant_fairness_bench.py --viral 2000 --quiet-tenants 10 --llm-latency-ms 300
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fair_share import FairShareLimiter  # noqa: E402
+from lead_queue import LeadQueue, QueueFullError  # noqa: E402
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run(args, fair: bool) -> Dict[str, List[float]]:
+    waits: Dict[str, List[float]] = {"quiet": [], "viral": []}
+    rejected = {"quiet": 0, "viral": 0}
+    accepted = {"quiet": 0, "viral": 0}
+    limiter = FairShareLimiter(args.concurrency, quota=lambda tenant: args.tenant_llm if fair and tenant == "viral" else None)
+    latency = args.llm_latency_ms / 1000
+
+    async def handle(job: Tuple[str, float, int]):
+        tenant, published, comments = job
+        # Comments of a delivery are classified concurrently, like classify_leads
+        async def call():
+            async with limiter.slot(tenant if fair else ""):
+                await asyncio.sleep(latency * random.uniform(0.8, 1.2))
+        await asyncio.gather(*(call() for _ in range(comments)))
+        waits["quiet" if tenant != "viral" else "viral"].append(time.perf_counter() - published)
+
+    queue = LeadQueue(
+        handle,
+        max_size=args.queue_size,
+        worker_count=args.workers,
+        lane=(lambda job: job[0]) if fair else None,
+        lane_max_size=(lambda tenant: max(1, int(args.queue_size * args.queue_share))) if fair else None,
+        drain_timeout=args.drain_timeout
+    )
+    await queue.start()
+
+    async def publish(tenant: str, comments: int):
+        kind = "quiet" if tenant != "viral" else "viral"
+        try:
+            await queue.publish({}, (tenant, time.perf_counter(), comments))
+        except QueueFullError:
+            # Meta would redeliver later; counted, not retried here
+            rejected[kind] += 1
+            return
+        accepted[kind] += 1
+
+    async def viral():
+        for _ in range(args.viral):
+            await publish("viral", args.comments)
+            await asyncio.sleep(args.viral_interval_ms / 1000)
+
+    async def quiet(tenant: str):
+        for _ in range(args.quiet_deliveries):
+            await asyncio.sleep(random.expovariate(1000 / args.quiet_interval_ms))
+            await publish(tenant, args.comments)
+
+    await asyncio.gather(viral(), *(quiet(f"quiet-{index}") for index in range(args.quiet_tenants)))
+    await queue.stop()
+    waits["rejected"] = [rejected["quiet"], rejected["viral"]]
+    # Accepted but never processed, so missing from the percentiles
+    waits["left"] = [accepted["quiet"] - len(waits["quiet"]), accepted["viral"] - len(waits["viral"])]
+    return waits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--viral", type=int, default=1000, help="Deliveries sent by the viral tenant")
+    parser.add_argument("--viral-interval-ms", type=float, default=1, help="Gap between viral deliveries")
+    parser.add_argument("--quiet-tenants", type=int, default=5)
+    parser.add_argument("--quiet-deliveries", type=int, default=20, help="Deliveries per quiet tenant")
+    parser.add_argument("--quiet-interval-ms", type=float, default=200, help="Mean gap between quiet deliveries")
+    parser.add_argument("--comments", type=int, default=2, help="Comments per delivery")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument("--queue-share", type=float, default=0.5, help="TENANT_QUEUE_SHARE for the fair run")
+    parser.add_argument("--concurrency", type=int, default=8, help="GROQ_MAX_CONCURRENCY")
+    parser.add_argument("--tenant-llm", type=int, default=4, help="TENANT_LLM_CONCURRENCY of the viral tenant (fair run)")
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="Simulated Groq latency")
+    parser.add_argument("--drain-timeout", type=float, default=3600, help="Seconds to wait for the queue to drain at the end")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(
+        f"{'mode':<6} {'quiet p50':>10} {'quiet p99':>10} {'viral p50':>10} {'viral p99':>10} "
+        f"{'rejected q/v':>13} {'left q/v':>13}"
+    )
+    for fair in (False, True):
+        random.seed(args.seed)
+        waits = asyncio.run(run(args, fair))
+        quiet_rejected, viral_rejected = waits["rejected"]
+        quiet_left, viral_left = waits["left"]
+        print(
+            f"{'fair' if fair else 'fifo':<6} "
+            f"{percentile(waits['quiet'], 50):>9.3f}s {percentile(waits['quiet'], 99):>9.3f}s "
+            f"{percentile(waits['viral'], 50):>9.3f}s {percentile(waits['viral'], 99):>9.3f}s "
+            f"{quiet_rejected:>6}/{viral_rejected:<6} {quiet_left:>6}/{viral_left:<6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
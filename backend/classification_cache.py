@@ -0,0 +1,262 @@
+"""
+Cache of AI classification results keyed on normalized comment text.
+
+Giveaway and pricing posts attract thousands of near-identical comments
+("price?", "Price??", "PRICE 😍"). Normalizing the text before lookup lets
+them share one LLM verdict. The in-memory tier is a bounded LRU with a TTL;
+an optional SQLite tier keeps verdicts across restarts, or, with
+RedisClassificationCache, a Redis tier shares them across processes and nodes.
+Verdicts are shared per scope: tenants with their own prompt get their own.
+"""
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_REPEATED_PUNCT_RE = re.compile(r"([^\w\s])\1+")
+
+
+def normalize_comment(text: str) -> str:
+    """Case-fold, drop emoji/symbols and collapse whitespace and repeated punctuation"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    kept = []
+    for char in text:
+        category = unicodedata.category(char)
+        # So/Sk: emoji, symbols and skin tones; Cf: zero-width joiners; plus emoji variation selectors
+        if category in ("So", "Sk", "Cs", "Co", "Cf") or "\ufe00" <= char <= "\ufe0f":
+            kept.append(" ")
+        else:
+            kept.append(char)
+    text = _REPEATED_PUNCT_RE.sub(r"\1", "".join(kept))
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def cache_key(comment_text: str, scope: str = "") -> str:
+    """Normalized comment, prefixed by its scope if any (\x1f is whitespace, so never part of a normalized comment)"""
+    key = normalize_comment(comment_text)
+    return f"{scope}\x1f{key}" if scope else key
+
+
+class ClassificationCache:
+    """Thread-safe LRU+TTL cache with an optional persistent SQLite tier
+
+    aget/aset serve the memory tier inline and run SQLite in a worker thread,
+    so a cold lookup or a write never blocks the event loop.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 86400, persist_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Guards the SQLite connection only, so memory lookups never wait on disk I/O
+        self._db_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def init(self):
+        """Open the persistent tier, if configured; until then the cache is memory-only. Safe to call more than once"""
+        if not self.persist_path:
+            return
+        with self._db_lock:
+            if self._conn is not None:
+                return
+            db_dir = os.path.dirname(self.persist_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            conn = sqlite3.connect(self.persist_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS classification_cache "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+            self._conn = conn
+
+    def _memory_get(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        """In-memory tier lookup; caller holds the lock"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at > now:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(value)
+        del self._entries[key]
+        self.expirations += 1
+        return None
+
+    def _persistent_get(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        """SQLite tier lookup, promoted into memory on a hit; blocking, so async callers run it in a thread"""
+        with self._db_lock:
+            row = None
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM classification_cache WHERE key = ?", (key,)
+                ).fetchone()
+        with self._lock:
+            if row and row[1] > now:
+                value = json.loads(row[0])
+                self._put(key, value, row[1])
+                self.persistent_hits += 1
+                return dict(value)
+            self.misses += 1
+            return None
+
+    def _persistent_set(self, key: str, value: Dict[str, Any], expires_at: float):
+        """SQLite tier write; blocking, so async callers run it in a thread"""
+        with self._db_lock:
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO classification_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), expires_at)
+                    )
+
+    def get(self, comment_text: str, scope: str = "") -> Optional[Dict[str, Any]]:
+        key = cache_key(comment_text, scope)
+        now = time.time()
+        with self._lock:
+            value = self._memory_get(key, now)
+        if value is not None:
+            return value
+        return self._persistent_get(key, now)
+
+    def set(self, comment_text: str, value: Dict[str, Any], scope: str = ""):
+        key = cache_key(comment_text, scope)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._put(key, dict(value), expires_at)
+        self._persistent_set(key, value, expires_at)
+
+    async def aget(self, comment_text: str, scope: str = "") -> Optional[Dict[str, Any]]:
+        """Awaitable get: memory hits return inline, the SQLite tier is read in a worker thread"""
+        key = cache_key(comment_text, scope)
+        now = time.time()
+        with self._lock:
+            value = self._memory_get(key, now)
+            if value is None and self._conn is None:
+                self.misses += 1
+                return None
+        if value is not None:
+            return value
+        return await asyncio.to_thread(self._persistent_get, key, now)
+
+    async def aset(self, comment_text: str, value: Dict[str, Any], scope: str = ""):
+        """Awaitable set: the memory tier is updated inline, the SQLite write runs in a worker thread"""
+        key = cache_key(comment_text, scope)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._put(key, dict(value), expires_at)
+        if self._conn is not None:
+            await asyncio.to_thread(self._persistent_set, key, dict(value), expires_at)
+
+    def _put(self, key: str, value: Dict[str, Any], expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def purge_expired(self) -> int:
+        """Drop expired rows from the persistent tier, returns rows removed"""
+        if self._conn is None:
+            return 0
+        with self._db_lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM classification_cache WHERE expires_at <= ?", (time.time(),)
+            ).rowcount
+
+    def warm(self, limit: int) -> int:
+        """Preload the most recently written verdicts from the persistent tier, returns entries loaded"""
+        if self._conn is None or limit <= 0:
+            return 0
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT key, value, expires_at FROM classification_cache WHERE expires_at > ? "
+                "ORDER BY expires_at DESC LIMIT ?",
+                (time.time(), min(limit, self.max_entries))
+            ).fetchall()
+        with self._lock:
+            # Oldest first, so the newest end up most recently used
+            for key, value, expires_at in reversed(rows):
+                self._put(key, json.loads(value), expires_at)
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.persistent_hits + self.misses
+        return {
+            "backend": "local",
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "persistent": bool(self.persist_path),
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round((self.hits + self.persistent_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class RedisClassificationCache(ClassificationCache):
+    """In-memory LRU in front of a Redis tier shared by every process and node"""
+
+    def __init__(self, client: Any, prefix: str = "lead_agent", max_entries: int = 10000, ttl_seconds: float = 86400):
+        from redis_support import key_prefix
+
+        super().__init__(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._client = client
+        self.prefix = key_prefix(prefix)
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:verdict:{key}"
+
+    async def aget(self, comment_text: str, scope: str = "") -> Optional[Dict[str, Any]]:
+        key = cache_key(comment_text, scope)
+        with self._lock:
+            value = self._memory_get(key, time.time())
+        if value is not None:
+            return value
+        raw = await self._client.get(self._key(key))
+        if raw is None:
+            self.misses += 1
+            return None
+        value = json.loads(raw)
+        with self._lock:
+            self._put(key, value, time.time() + self.ttl_seconds)
+        self.persistent_hits += 1
+        return dict(value)
+
+    async def aset(self, comment_text: str, value: Dict[str, Any], scope: str = ""):
+        key = cache_key(comment_text, scope)
+        with self._lock:
+            self._put(key, dict(value), time.time() + self.ttl_seconds)
+        await self._client.set(self._key(key), json.dumps(value), ex=max(1, int(self.ttl_seconds)))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["backend"] = "redis"
+        stats["persistent"] = True
+        return stats
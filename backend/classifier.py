@@ -0,0 +1,546 @@
+"""
+AI comment classifier backed by the async Groq client.
+
+One shared HTTP connection pool, a semaphore capping in-flight requests,
+per-call deadlines and jittered exponential retries limited by a retry
+budget. Groq's rate-limit headers pause new calls before we trip the
+limit. Under burst load comments are micro-batched into one numbered-list
+prompt per request. Obvious comments are answered by the local
+pre-classifier tier and never reach Groq. Anything that cannot be
+classified by the LLM falls back to the keyword rules so a lead is never lost.
+
+Calls are made on behalf of a tenant: in-flight requests are shared out
+between tenants (fair_share.FairShareLimiter, with optional per-tenant
+caps), each tenant's comments are batched separately, and a tenant may
+bring its own prompt instructions.
+"""
+import asyncio
+import inspect
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from classification_cache import ClassificationCache
+from fair_share import FairShareLimiter, Quota
+from preclassifier import IntentMatcher
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = """You are a professional Sales Assistant. Analyze this comment and provide:
+        1. A short, helpful response (max 20 words) if the user is asking about price, location, or availability
+        2. Suggest they check their DMs for a special offer
+        3. Categorize as 'High', 'Medium', or 'Low' priority
+
+        Format your response as JSON:
+        {
+            "ai_response_text": "your response here",
+            "priority_score": "High/Medium/Low"
+        }"""
+
+BATCH_SYSTEM_PROMPT = """You are a professional Sales Assistant. You will receive a numbered list of comments.
+        For each comment provide:
+        1. A short, helpful response (max 20 words) if the user is asking about price, location, or availability
+        2. Suggest they check their DMs for a special offer
+        3. Categorize as 'High', 'Medium', or 'Low' priority
+
+        Respond with ONLY a JSON array containing exactly one object per comment, in the same order:
+        [
+            {"index": 1, "ai_response_text": "your response here", "priority_score": "High/Medium/Low"}
+        ]"""
+
+# Answer formats appended to a tenant's own instructions; the verdict parsers rely on them
+SINGLE_FORMAT = """Format your response as JSON:
+        {
+            "ai_response_text": "your response here",
+            "priority_score": "High/Medium/Low"
+        }"""
+
+BATCH_FORMAT = """You will receive a numbered list of comments; answer each of them.
+        Respond with ONLY a JSON array containing exactly one object per comment, in the same order:
+        [
+            {"index": 1, "ai_response_text": "your response here", "priority_score": "High/Medium/Low"}
+        ]"""
+
+_DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def system_prompts(instructions: Optional[str] = None) -> Tuple[str, str]:
+    """(single, batch) system prompts: the defaults, or a tenant's instructions followed by the fixed formats"""
+    if not instructions:
+        return SYSTEM_PROMPT, BATCH_SYSTEM_PROMPT
+    instructions = instructions.strip()
+    return f"{instructions}\n\n        {SINGLE_FORMAT}", f"{instructions}\n\n        {BATCH_FORMAT}"
+
+
+def strip_code_fences(result_text: str) -> str:
+    """Clean up the response if it has markdown code blocks"""
+    return result_text.replace("```json", "").replace("```", "").strip()
+
+
+def parse_verdict(result_data: Any) -> Optional[Dict[str, Any]]:
+    """Validate one LLM verdict object; None if it is unusable"""
+    if not isinstance(result_data, dict):
+        return None
+    return {
+        "ai_response_text": result_data.get("ai_response_text", "Thank you for your interest!"),
+        "priority_score": result_data.get("priority_score", "Normal")
+    }
+
+
+def parse_batch_verdicts(result_text: str, count: int) -> List[Optional[Dict[str, Any]]]:
+    """Map a JSON array response back to `count` comments; unparseable slots are None"""
+    verdicts: List[Optional[Dict[str, Any]]] = [None] * count
+    try:
+        result_data = json.loads(strip_code_fences(result_text))
+    except ValueError:
+        return verdicts
+    if isinstance(result_data, dict):
+        # Some completions wrap the array, e.g. {"results": [...]}
+        result_data = next((value for value in result_data.values() if isinstance(value, list)), None)
+    if not isinstance(result_data, list):
+        return verdicts
+
+    for position, item in enumerate(result_data):
+        index = position
+        if isinstance(item, dict) and isinstance(item.get("index"), int):
+            index = item["index"] - 1
+        if 0 <= index < count and verdicts[index] is None:
+            verdicts[index] = parse_verdict(item)
+    return verdicts
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse Groq reset/retry headers ('7.66s', '2m59.56s', '120ms', '3') into seconds"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART_RE.findall(value)
+    if not parts:
+        return None
+    scale = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of recent requests
+    Every request deposits `ratio` tokens and every retry spends one, so a
+    Groq outage cannot multiply our traffic by the retry count
+    """
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 20.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def record_request(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class MicroBatcher:
+    """
+    Gathers submitted items for up to `max_items` or `max_wait` seconds,
+    then hands them to `process_batch` as one list
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_items: int = 10,
+        max_wait: float = 0.05,
+    ):
+        self.process_batch = process_batch
+        self.max_items = max_items
+        self.max_wait = max_wait
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        self.batches += 1
+        self.items += len(batch)
+        task = asyncio.create_task(self._run(batch))
+        # Keep a reference so the task is not garbage collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        try:
+            results = await self.process_batch([item for item, _ in batch])
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "pending": len(self._pending),
+        }
+
+
+class GroqClassifier:
+    """Async, concurrency-limited Groq chat client with retries and fallback"""
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        model: str = "llama3-8b-8192",
+        cache: Optional[ClassificationCache] = None,
+        max_concurrency: int = 8,
+        timeout: float = 10.0,
+        max_retries: int = 3,
+        retry_budget_ratio: float = 0.2,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 8.0,
+        batch_size: int = 10,
+        batch_wait: float = 0.05,
+        matcher: Optional[IntentMatcher] = None,
+        rules_tier: bool = True,
+        base_url: Optional[str] = None,
+        tenant_concurrency: Optional[Quota] = None,
+    ):
+        self.api_key = api_key if api_key and api_key != "your_groq_api_key_here" else None
+        self.model = model
+        # Alternate API endpoint, e.g. a local stub for load tests; None uses the Groq default
+        self.base_url = base_url
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retry_budget = RetryBudget(ratio=retry_budget_ratio)
+        # Local intent rules: answer confident comments directly, and serve as the fallback
+        self.matcher = matcher if matcher is not None else IntentMatcher()
+        self.rules_tier = rules_tier
+        # Many comments per prompt under burst load, one batcher per tenant; batch_size 1 disables batching
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.batchers: Dict[str, MicroBatcher] = {}
+        # In-flight requests, shared fairly between tenants; `tenant_concurrency` caps single tenants
+        self.limiter = FairShareLimiter(max_concurrency, quota=tenant_concurrency)
+
+        self._client = None
+        self._http_client = None
+        # Set from rate-limit headers: no new request starts before this monotonic time
+        self._paused_until = 0.0
+
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.batch_parse_misses = 0
+        self.fallbacks: Counter = Counter()
+        # LLM usage reported by Groq: prompt and completion tokens
+        self.tokens: Counter = Counter()
+        # Which tier produced each verdict: cache, rules, llm or fallback
+        self.tiers: Counter = Counter()
+
+    @property
+    def configured(self) -> bool:
+        return self.api_key is not None
+
+    def _get_client(self):
+        if self._client is None:
+            import httpx
+            from groq import AsyncGroq
+
+            # One pooled HTTP client shared by every classification call
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                ),
+                timeout=self.timeout
+            )
+            # Retries are handled here, within the retry budget
+            self._client = AsyncGroq(
+                api_key=self.api_key, base_url=self.base_url, http_client=self._http_client, max_retries=0
+            )
+        return self._client
+
+    def _batcher(self, tenant: str, prompt: Optional[str]) -> MicroBatcher:
+        batcher = self.batchers.get(tenant)
+        if batcher is None:
+            # Comments of different tenants never share a prompt, nor a request charged to one of them
+            batcher = self.batchers[tenant] = MicroBatcher(
+                lambda comments: self._classify_batch(comments, tenant, prompt),
+                max_items=self.batch_size,
+                max_wait=self.batch_wait
+            )
+        return batcher
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: spreads out retries from concurrent workers
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _observe_rate_limits(self, headers):
+        remaining = headers.get("x-ratelimit-remaining-requests")
+        if remaining is not None and remaining.strip() == "0":
+            reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+            if reset:
+                self._pause(reset)
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if remaining_tokens is not None and remaining_tokens.strip() == "0":
+            reset = parse_duration(headers.get("x-ratelimit-reset-tokens"))
+            if reset:
+                self._pause(reset)
+
+    def _pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def _wait_for_rate_limit(self):
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _complete(self, messages, max_tokens: int, tenant: str = "") -> str:
+        """One chat completion with retries, holding one of `tenant`'s fair-share slots; returns the message content"""
+        import groq
+
+        client = self._get_client()
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
+            await self._wait_for_rate_limit()
+            try:
+                async with self.limiter.slot(tenant):
+                    self.requests += 1
+                    raw = await asyncio.wait_for(
+                        client.chat.completions.with_raw_response.create(
+                            model=self.model,
+                            messages=messages,
+                            temperature=0.7,
+                            max_tokens=max_tokens
+                        ),
+                        timeout=self.timeout
+                    )
+                self._observe_rate_limits(raw.headers)
+                completion = raw.parse()
+                if inspect.isawaitable(completion):
+                    completion = await completion
+                usage = getattr(completion, "usage", None)
+                if usage is not None:
+                    self.tokens["prompt"] += getattr(usage, "prompt_tokens", 0) or 0
+                    self.tokens["completion"] += getattr(usage, "completion_tokens", 0) or 0
+                return completion.choices[0].message.content.strip()
+            except (asyncio.TimeoutError, groq.APITimeoutError, groq.APIConnectionError,
+                    groq.RateLimitError, groq.InternalServerError) as e:
+                retry_after = None
+                if isinstance(e, groq.RateLimitError):
+                    self.rate_limited += 1
+                    retry_after = parse_duration(e.response.headers.get("retry-after"))
+                    if retry_after:
+                        self._pause(retry_after)
+                if attempt >= self.max_retries or not self.retry_budget.try_spend():
+                    raise
+                self.retries += 1
+                delay = self._backoff(attempt)
+                if retry_after:
+                    delay = max(delay, retry_after)
+                attempt += 1
+                logger.warning("Groq call failed, retrying", extra={"error": type(e).__name__, "attempt": attempt, "delay_seconds": round(delay, 3)})
+                await asyncio.sleep(delay)
+
+    async def classify(self, comment_text: str, refresh: bool = False) -> Dict[str, Any]:
+        """
+        Analyze a comment with the LLM; `refresh` skips cached verdicts (e.g. after a prompt change)
+        Returns: {'ai_response_text': str, 'priority_score': str}
+        """
+        ai_result, _ = await self.classify_with_tier(comment_text, refresh=refresh)
+        return ai_result
+
+    async def classify_with_tier(
+        self,
+        comment_text: str,
+        refresh: bool = False,
+        allow_llm: bool = True,
+        tenant: str = "",
+        prompt: Optional[str] = None,
+    ) -> Tuple[Dict[str, Any], str]:
+        """
+        Like classify, also naming the tier that answered: cache, rules, llm or fallback
+        With allow_llm=False (throttled spam bursts) an uncached comment gets the keyword verdict
+        LLM calls count against `tenant`'s share; a tenant `prompt` replaces the default instructions
+        and keeps its verdicts apart in the cache
+        """
+        scope = tenant if prompt else ""
+        if self.cache is not None and not refresh:
+            cached = await self.cache.aget(comment_text, scope)
+            if cached is not None:
+                self.tiers["cache"] += 1
+                return cached, "cache"
+
+        rules = self.matcher.match(comment_text)
+        if self.rules_tier and self.matcher.confident(rules):
+            self.tiers["rules"] += 1
+            return self._verdict(rules), "rules"
+
+        if not self.configured:
+            self.fallbacks["no_client"] += 1
+            return self._fallback(rules), "fallback"
+        if not allow_llm:
+            self.fallbacks["throttled"] += 1
+            return self._fallback(rules), "fallback"
+
+        if self.batch_size > 1:
+            ai_result = await self._batcher(tenant, prompt).submit(comment_text)
+        else:
+            ai_result = await self._classify_single(comment_text, tenant, prompt)
+        if ai_result is None:
+            return self._fallback(rules), "fallback"
+
+        self.tiers["llm"] += 1
+        # Only real LLM verdicts are cached, never the keyword fallback
+        if self.cache is not None:
+            await self.cache.aset(comment_text, ai_result, scope)
+        return ai_result, "llm"
+
+    @staticmethod
+    def _verdict(rules: Dict[str, Any]) -> Dict[str, Any]:
+        return {"ai_response_text": rules["ai_response_text"], "priority_score": rules["priority_score"]}
+
+    def _fallback(self, rules: Dict[str, Any]) -> Dict[str, Any]:
+        """Keyword verdict regardless of confidence, used when the LLM cannot answer"""
+        self.tiers["fallback"] += 1
+        return self._verdict(rules)
+
+    def _record_api_error(self, e: Exception):
+        if isinstance(e, asyncio.TimeoutError):
+            logger.warning("Groq API error: request timed out")
+            self.fallbacks["timeout"] += 1
+        else:
+            logger.warning("Groq API error", extra={"error": str(e)})
+            self.fallbacks["api_error"] += 1
+
+    async def _classify_single(
+        self, comment_text: str, tenant: str = "", prompt: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """One comment per request; None means use the keyword fallback"""
+        try:
+            result_text = await self._complete(
+                [
+                    {"role": "system", "content": system_prompts(prompt)[0]},
+                    {"role": "user", "content": f"Comment: {comment_text}"}
+                ],
+                max_tokens=150,
+                tenant=tenant
+            )
+        except Exception as e:
+            self._record_api_error(e)
+            return None
+
+        try:
+            ai_result = parse_verdict(json.loads(strip_code_fences(result_text)))
+        except ValueError:
+            ai_result = None
+        if ai_result is None:
+            self.fallbacks["parse_error"] += 1
+        return ai_result
+
+    async def _classify_batch(
+        self, comments: List[str], tenant: str = "", prompt: Optional[str] = None
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Many comments in one numbered-list prompt, mapped back from a JSON array"""
+        if len(comments) == 1:
+            return [await self._classify_single(comments[0], tenant, prompt)]
+
+        # One line per comment so the numbering stays unambiguous
+        numbered = "\n".join(
+            f"{number}. {' '.join(comment.split())}" for number, comment in enumerate(comments, start=1)
+        )
+        try:
+            result_text = await self._complete(
+                [
+                    {"role": "system", "content": system_prompts(prompt)[1]},
+                    {"role": "user", "content": f"Comments:\n{numbered}"}
+                ],
+                max_tokens=min(4096, 150 * len(comments)),
+                tenant=tenant
+            )
+        except Exception as e:
+            self._record_api_error(e)
+            return [None] * len(comments)
+
+        verdicts = parse_batch_verdicts(result_text, len(comments))
+        # Retry only the items the model skipped or garbled, one request each
+        missing = [index for index, verdict in enumerate(verdicts) if verdict is None]
+        if missing:
+            self.batch_parse_misses += len(missing)
+            retried = await asyncio.gather(*(self._classify_single(comments[index], tenant, prompt) for index in missing))
+            for index, verdict in zip(missing, retried):
+                verdicts[index] = verdict
+        return verdicts
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "configured": self.configured,
+            "model": self.model,
+            "max_concurrency": self.max_concurrency,
+            "requests": self.requests,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "retry_budget_tokens": round(self.retry_budget.tokens, 2),
+            "paused_seconds": round(max(0.0, self._paused_until - time.monotonic()), 2),
+            "fallbacks": dict(self.fallbacks),
+            "tokens": dict(self.tokens),
+            "tiers": dict(self.tiers),
+            "batching": self._batching_stats(),
+            "batch_parse_misses": self.batch_parse_misses,
+            "fair_share": self.limiter.stats(),
+        }
+
+    def _batching_stats(self) -> Optional[Dict[str, Any]]:
+        if self.batch_size <= 1:
+            return None
+        batches = sum(batcher.batches for batcher in self.batchers.values())
+        items = sum(batcher.items for batcher in self.batchers.values())
+        return {
+            "batches": batches,
+            "items": items,
+            "avg_batch_size": round(items / batches, 2) if batches else 0.0,
+            "pending": sum(len(batcher._pending) for batcher in self.batchers.values()),
+        }
+
+    async def close(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+            self._client = None
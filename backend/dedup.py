@@ -0,0 +1,208 @@
+"""
+Idempotent ingestion by platform comment ID.
+
+Facebook and Instagram retry webhook deliveries that time out or fail, so
+the same comment can arrive several times. Before any LLM work a delivery's
+comment ids are checked against an exact LRU of recently seen ids and a
+Bloom filter of every id in the lead store. A Bloom miss proves the id is
+new; only a Bloom hit outside the LRU costs a store lookup. The store's
+unique index on comment_id remains the final guard.
+
+RedisDedupIndex replaces both with claims in Redis, shared by every process
+and node, that expire after Meta's redelivery window.
+"""
+import asyncio
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Set
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter using blake2b double hashing"""
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.added = 0
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.added += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class DedupIndex:
+    """Recent-id LRU in front of a Bloom filter of stored comment ids"""
+
+    def __init__(self, recent_size: int = 100000, bloom_capacity: int = 1_000_000, bloom_error_rate: float = 0.001):
+        self.recent_size = recent_size
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self._bloom = BloomFilter(bloom_capacity, bloom_error_rate)
+        self._lock = threading.Lock()
+
+        self.checked = 0
+        self.duplicates = 0
+        self.store_lookups = 0
+        self.bloom_false_positives = 0
+
+    def seed(self, comment_ids: Iterable[str]) -> int:
+        """Load ids already in the lead store, returns the number added"""
+        count = 0
+        with self._lock:
+            for comment_id in comment_ids:
+                self._bloom.add(comment_id)
+                count += 1
+        return count
+
+    def _remember(self, comment_id: str):
+        self._recent[comment_id] = None
+        self._recent.move_to_end(comment_id)
+        while len(self._recent) > self.recent_size:
+            self._recent.popitem(last=False)
+
+    async def filter_new(self, comment_ids: List[str], lookup: Callable[[List[str]], Set[str]]) -> List[bool]:
+        """
+        Flag which ids are new and claim them, so a concurrent redelivery is
+        rejected too. `lookup` is the store's sync existing_comment_ids.
+        Empty ids are always treated as new.
+        """
+        flags: List[bool] = []
+        maybe_stored: List[str] = []
+        seen: Set[str] = set()
+        with self._lock:
+            for comment_id in comment_ids:
+                self.checked += 1
+                if not comment_id:
+                    flags.append(True)
+                    continue
+                if comment_id in seen or comment_id in self._recent:
+                    flags.append(False)
+                    continue
+                seen.add(comment_id)
+                if comment_id in self._bloom:
+                    maybe_stored.append(comment_id)
+                flags.append(True)
+                # Claim before awaiting the store so concurrent deliveries see it
+                self._remember(comment_id)
+
+        stored: Set[str] = set()
+        if maybe_stored:
+            self.store_lookups += 1
+            stored = await asyncio.to_thread(lookup, maybe_stored)
+            self.bloom_false_positives += len(maybe_stored) - len(stored)
+
+        with self._lock:
+            for index, comment_id in enumerate(comment_ids):
+                if flags[index] and comment_id in stored:
+                    flags[index] = False
+                elif flags[index] and comment_id:
+                    self._bloom.add(comment_id)
+        # Repeats inside one delivery count too
+        self.duplicates += flags.count(False)
+        return flags
+
+    def forget(self, comment_ids: Iterable[str]):
+        """Release claimed ids whose delivery failed so a retry is accepted"""
+        with self._lock:
+            for comment_id in comment_ids:
+                self._recent.pop(comment_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "local",
+            "recent_entries": len(self._recent),
+            "recent_size": self.recent_size,
+            "bloom_capacity": self._bloom.capacity,
+            "bloom_error_rate": self._bloom.error_rate,
+            "bloom_entries": self._bloom.added,
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "store_lookups": self.store_lookups,
+            "bloom_false_positives": self.bloom_false_positives,
+        }
+
+
+class RedisDedupIndex:
+    """
+    Cluster-wide claims: one SET NX key per comment id, expiring after `ttl_seconds`
+
+    Meta stops redelivering after about a day and a half, so claims outlive the
+    retry window without growing forever; the lead store's unique comment_id
+    remains the final guard for anything older.
+    """
+
+    def __init__(self, client: Any, prefix: str = "lead_agent", ttl_seconds: float = 7 * 86400):
+        from redis_support import key_prefix
+
+        self._client = client
+        self.prefix = key_prefix(prefix)
+        self.ttl_seconds = ttl_seconds
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.checked = 0
+        self.duplicates = 0
+        self.claims = 0
+
+    def _key(self, comment_id: str) -> str:
+        return f"{self.prefix}:dedup:{comment_id}"
+
+    def seed(self, comment_ids: Iterable[str]) -> int:
+        """Nothing to load: claims already live in Redis"""
+        return 0
+
+    async def filter_new(self, comment_ids: List[str], lookup: Callable[[List[str]], Set[str]]) -> List[bool]:
+        """Flag which ids are new, claiming them atomically across processes; empty ids are always new"""
+        self.checked += len(comment_ids)
+        claimed = list(dict.fromkeys(comment_id for comment_id in comment_ids if comment_id))
+        results: Dict[str, bool] = {}
+        if claimed:
+            pipe = self._client.pipeline(transaction=False)
+            for comment_id in claimed:
+                pipe.set(self._key(comment_id), "1", nx=True, ex=int(self.ttl_seconds))
+            results = {comment_id: bool(ok) for comment_id, ok in zip(claimed, await pipe.execute())}
+            self.claims += sum(results.values())
+
+        flags: List[bool] = []
+        seen: Set[str] = set()
+        for comment_id in comment_ids:
+            if not comment_id:
+                flags.append(True)
+            elif comment_id in seen:
+                # Repeats inside one delivery
+                flags.append(False)
+            else:
+                seen.add(comment_id)
+                flags.append(results[comment_id])
+        self.duplicates += flags.count(False)
+        return flags
+
+    def forget(self, comment_ids: Iterable[str]):
+        """Release claimed ids whose delivery failed; the delete runs in the background"""
+        keys = [self._key(comment_id) for comment_id in comment_ids if comment_id]
+        if keys:
+            task = asyncio.get_running_loop().create_task(self._client.delete(*keys))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "redis",
+            "ttl_seconds": self.ttl_seconds,
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "claims": self.claims,
+        }
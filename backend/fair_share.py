@@ -0,0 +1,221 @@
+"""
+Fair-share scheduling between tenants.
+
+One deployment serves many client pages, and a viral post on one of them
+must not starve the others. Two primitives share capacity out per tenant:
+
+- FairShareLimiter caps concurrent calls (LLM requests) globally and per
+  tenant. When a slot frees up it goes to the waiting tenant holding the
+  fewest slots, so every busy tenant converges on an equal share. An idle
+  tenant's share is lent to the busy ones (work-conserving).
+- FairQueue is a FIFO per tenant (a lane), served round robin. A tenant
+  with one queued delivery waits behind at most one delivery of each other
+  backlogged tenant, not behind the whole backlog of a viral one.
+
+Both are in-process and single-threaded (asyncio).
+"""
+import asyncio
+import itertools
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+
+# tenant -> its own concurrency cap, None for no cap beyond the global capacity
+Quota = Callable[[str], Optional[int]]
+
+
+class FairShareLimiter:
+    """Semaphore with per-tenant caps; freed slots go to the waiting tenant holding the fewest"""
+
+    def __init__(self, capacity: int, quota: Optional[Quota] = None):
+        self.capacity = capacity
+        self.quota = quota
+        self.active = 0
+        self._in_use: Counter = Counter()
+        # tenant -> (arrival number, future) of its waiters, oldest first
+        self._waiters: Dict[str, Deque[Tuple[int, asyncio.Future]]] = {}
+        self._arrivals = itertools.count()
+        self.granted: Counter = Counter()
+
+    def _cap(self, key: str) -> int:
+        cap = self.quota(key) if self.quota is not None else None
+        return self.capacity if cap is None else min(cap, self.capacity)
+
+    @asynccontextmanager
+    async def slot(self, key: str = "") -> AsyncIterator[None]:
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    async def acquire(self, key: str = ""):
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append((next(self._arrivals), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as the waiter was cancelled: hand the slot on
+                self.release(key)
+            raise
+
+    def release(self, key: str = ""):
+        self.active -= 1
+        self._in_use[key] -= 1
+        if self._in_use[key] <= 0:
+            del self._in_use[key]
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.active < self.capacity:
+            best: Optional[Tuple[int, int, str]] = None
+            for key in list(self._waiters):
+                waiters = self._waiters[key]
+                while waiters and waiters[0][1].done():
+                    # Cancelled while waiting
+                    waiters.popleft()
+                if not waiters:
+                    del self._waiters[key]
+                    continue
+                in_use = self._in_use[key]
+                if in_use >= self._cap(key):
+                    continue
+                # Fewest slots held first, then whoever has waited longest
+                rank = (in_use, waiters[0][0], key)
+                if best is None or rank < best:
+                    best = rank
+            if best is None:
+                return
+            key = best[2]
+            _, future = self._waiters[key].popleft()
+            self.active += 1
+            self._in_use[key] += 1
+            self.granted[key] += 1
+            future.set_result(None)
+
+    def waiting(self, key: str) -> int:
+        return sum(1 for _, future in self._waiters.get(key, ()) if not future.done())
+
+    def stats(self) -> Dict[str, Any]:
+        keys = set(self._in_use) | set(self._waiters) | set(self.granted)
+        return {
+            "capacity": self.capacity,
+            "in_use": self.active,
+            "waiting": sum(self.waiting(key) for key in self._waiters),
+            "tenants": {
+                key: {
+                    "in_use": self._in_use[key],
+                    "waiting": self.waiting(key),
+                    "cap": self._cap(key),
+                    "granted": self.granted[key],
+                }
+                for key in sorted(keys)
+            },
+        }
+
+
+class FairQueue:
+    """
+    asyncio.Queue look-alike with one FIFO lane per key, served round robin
+    `maxsize` bounds all lanes together (put waits for room); per-lane limits are left to the caller
+    """
+
+    def __init__(self, maxsize: int = 0):
+        self.maxsize = maxsize
+        # Lanes with queued items, in serving order; a served lane moves to the back
+        self._lanes: "OrderedDict[str, Deque[Any]]" = OrderedDict()
+        self._size = 0
+        self._getters: Deque[asyncio.Future] = deque()
+        self._putters: Deque[asyncio.Future] = deque()
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def qsize(self) -> int:
+        return self._size
+
+    def lane_size(self, key: str) -> int:
+        lane = self._lanes.get(key)
+        return len(lane) if lane is not None else 0
+
+    def lane_sizes(self) -> Dict[str, int]:
+        return {key: len(lane) for key, lane in self._lanes.items()}
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def full(self) -> bool:
+        return 0 < self.maxsize <= self._size
+
+    @staticmethod
+    def _wake(waiters: Deque[asyncio.Future]):
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def put_nowait(self, key: str, item: Any):
+        if self.full():
+            raise asyncio.QueueFull
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = deque()
+        lane.append(item)
+        self._size += 1
+        self._unfinished += 1
+        self._finished.clear()
+        self._wake(self._getters)
+
+    async def put(self, key: str, item: Any):
+        while self.full():
+            putter = asyncio.get_running_loop().create_future()
+            self._putters.append(putter)
+            try:
+                await putter
+            except asyncio.CancelledError:
+                putter.cancel()
+                if not self.full():
+                    # Pass the wake-up on rather than swallow it
+                    self._wake(self._putters)
+                raise
+        self.put_nowait(key, item)
+
+    def get_nowait(self) -> Any:
+        if not self._size:
+            raise asyncio.QueueEmpty
+        key, lane = next(iter(self._lanes.items()))
+        item = lane.popleft()
+        if lane:
+            self._lanes.move_to_end(key)
+        else:
+            del self._lanes[key]
+        self._size -= 1
+        self._wake(self._putters)
+        return item
+
+    async def get(self) -> Any:
+        while not self._size:
+            getter = asyncio.get_running_loop().create_future()
+            self._getters.append(getter)
+            try:
+                await getter
+            except asyncio.CancelledError:
+                getter.cancel()
+                if self._size:
+                    self._wake(self._getters)
+                raise
+        return self.get_nowait()
+
+    def task_done(self):
+        if self._unfinished <= 0:
+            raise ValueError("task_done() called too many times")
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._finished.set()
+
+    async def join(self):
+        if self._unfinished:
+            await self._finished.wait()
@@ -0,0 +1,44 @@
+"""
+JSON encoding for the hot paths: API responses, ingest log and queue
+records, and the live lead feed.
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise. Both produce compact UTF-8 bytes, so callers never care which
+one ran.
+"""
+import json
+from typing import Any, Union
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response encoded in one pass.
+
+    Returning it from a route skips FastAPI's response_model validation
+    and jsonable_encoder walk, so the content must already be plain JSON
+    types shaped like the route's documented model.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
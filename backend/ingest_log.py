@@ -0,0 +1,346 @@
+"""
+Durable write-ahead log for accepted webhook deliveries.
+
+The webhook handler appends each validated delivery here before it is
+acknowledged. Appends are group-committed: everything that arrives within
+one flush interval is written and fsynced together, so durability costs
+one fsync per batch instead of one per lead. Records live in size-bounded
+segment files named by their first offset. Workers commit offsets once a
+delivery is stored; on startup everything past the committed offset is
+replayed (at-least-once), and any time range can be re-read for
+reprocessing, e.g. after a prompt change. A delivery that keeps failing is
+copied to a dead-letter file and committed, so it cannot pin the committed
+offset (and every segment after it) forever.
+
+Record layout: <payload length:u32><crc32:u32><offset:u64><timestamp:f64><JSON payload>
+"""
+import asyncio
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from fast_json import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("<IIQd")
+_SEGMENT_SUFFIX = ".log"
+_OFFSETS_FILE = "committed.offset"
+_DEAD_LETTER_FILE = "dead_letter.ndjson"
+
+
+def _segment_name(base_offset: int) -> str:
+    return f"{base_offset:020d}{_SEGMENT_SUFFIX}"
+
+
+def _read_segment(path: str) -> Iterator[Tuple[int, float, bytes, int]]:
+    """Yield (offset, timestamp, payload, end position) until EOF or the first torn/corrupt record"""
+    with open(path, "rb") as f:
+        position = 0
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            length, crc, offset, timestamp = _HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(header[8:] + payload) != crc:
+                return
+            position += _HEADER.size + length
+            yield offset, timestamp, payload, position
+
+
+class IngestLog:
+    """Segmented, group-committed append-only log with committed consumer offsets"""
+
+    def __init__(
+        self,
+        directory: str = "ingest_log",
+        segment_bytes: int = 64 * 1024 * 1024,
+        flush_interval: float = 0.005,
+        retention_seconds: float = 7 * 86400,
+        fsync: bool = True,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.retention_seconds = retention_seconds
+        self.fsync = fsync
+
+        self.next_offset = 1
+        self.committed_offset = 0
+        self._done: Set[int] = set()
+        self._offsets_dirty = False
+        self._file = None
+        self._file_size = 0
+        self._reopen_last = True
+        self._skipped: List[int] = []
+        self._segments: List[int] = []
+        self._pending: List[Tuple[bytes, float, asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._closing = False
+        # Serializes file access between the writer thread and readers
+        self._lock = threading.Lock()
+
+        self.appended = 0
+        self.flushes = 0
+        self.truncated_bytes = 0
+        self.dead_lettered = 0
+
+    # Recovery
+
+    def open(self):
+        """Load segments and the committed offset, truncating a torn tail left by a crash"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._segments = sorted(
+            int(name[:-len(_SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(_SEGMENT_SUFFIX) and name[:-len(_SEGMENT_SUFFIX)].isdigit()
+        )
+        offsets_path = os.path.join(self.directory, _OFFSETS_FILE)
+        if os.path.exists(offsets_path):
+            with open(offsets_path, "r") as f:
+                self.committed_offset = int(f.read().strip() or 0)
+
+        if self._segments:
+            path = self._segment_path(self._segments[-1])
+            last_offset, valid_bytes = self._segments[-1] - 1, 0
+            for offset, _, _, end in _read_segment(path):
+                last_offset, valid_bytes = offset, end
+            size = os.path.getsize(path)
+            if size > valid_bytes:
+                # Partial write from a crash: the delivery was never acknowledged
+                self.truncated_bytes = size - valid_bytes
+                with open(path, "r+b") as f:
+                    f.truncate(valid_bytes)
+                logger.warning("Ingest log: truncated torn tail", extra={"bytes": self.truncated_bytes, "segment": path})
+            self.next_offset = last_offset + 1
+        self.committed_offset = min(self.committed_offset, self.next_offset - 1)
+
+    def _segment_path(self, base_offset: int) -> str:
+        return os.path.join(self.directory, _segment_name(base_offset))
+
+    def uncommitted(self) -> Iterator[Tuple[int, float, Dict[str, Any]]]:
+        """Records appended but not committed before the last shutdown"""
+        return self.read(after_offset=self.committed_offset)
+
+    def read(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        after_offset: int = 0,
+    ) -> Iterator[Tuple[int, float, Dict[str, Any]]]:
+        """Yield (offset, timestamp, record) for records in [start, end) with offset > after_offset"""
+        segments = list(self._segments) or sorted(
+            int(name[:-len(_SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(_SEGMENT_SUFFIX) and name[:-len(_SEGMENT_SUFFIX)].isdigit()
+        )
+        for index, base_offset in enumerate(segments):
+            # Skip whole segments that end before the requested offset
+            if index + 1 < len(segments) and segments[index + 1] <= after_offset + 1:
+                continue
+            path = self._segment_path(base_offset)
+            if not os.path.exists(path):
+                # Removed by retention while we were reading
+                continue
+            for offset, timestamp, payload, _ in _read_segment(path):
+                if offset <= after_offset:
+                    continue
+                if start is not None and timestamp < start:
+                    continue
+                if end is not None and timestamp >= end:
+                    continue
+                yield offset, timestamp, loads(payload)
+
+    def get(self, offset: int) -> Optional[Dict[str, Any]]:
+        """The record at `offset`, None if it is no longer retained"""
+        for found, _, record in self.read(after_offset=offset - 1):
+            return record if found == offset else None
+        return None
+
+    # Appends
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._run())
+
+    async def append(self, record: Dict[str, Any]) -> int:
+        """Durably append one record; returns its offset once it is on disk"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((dumps(record), time.time(), future))
+        self._wakeup.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=1.0)
+                # Let concurrent appends join this group commit
+                await asyncio.sleep(self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            batch, self._pending = self._pending, []
+            try:
+                first_offset = 0
+                if batch:
+                    first_offset = await asyncio.to_thread(self._write, [(payload, at) for payload, at, _ in batch])
+                    self.appended += len(batch)
+                    self.flushes += 1
+                if self._offsets_dirty:
+                    await asyncio.to_thread(self._persist_offsets)
+            except Exception as e:
+                # Offsets of a failed write left on disk are never acknowledged, so nothing waits on them
+                skipped, self._skipped = self._skipped, []
+                for offset in skipped:
+                    self.commit(offset)
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for offset, (_, _, future) in enumerate(batch, first_offset):
+                if not future.done():
+                    future.set_result(offset)
+            if self._closing and not self._pending:
+                return
+
+    def _write(self, records: List[Tuple[bytes, float]]) -> int:
+        """Write one group of (payload, timestamp), returns the first offset
+
+        Offsets are assigned here, under the lock, and only kept once the
+        group is on disk: a failed write is cut off the segment and its
+        offsets are handed out again, so the log never has a gap or a bad
+        frame in the middle. If it cannot be cut off, its offsets are
+        skipped (and committed by _run) and the next write starts a new
+        segment.
+        """
+        with self._lock:
+            first_offset = self.next_offset
+            frames = []
+            for offset, (payload, timestamp) in enumerate(records, first_offset):
+                body = struct.pack("<Qd", offset, timestamp) + payload
+                frames.append(struct.pack("<II", len(payload), zlib.crc32(body)) + body)
+            if self._file is None or self._file_size >= self.segment_bytes:
+                self._roll(first_offset)
+            data = memoryview(b"".join(frames))
+            try:
+                written = 0
+                while written < len(data):
+                    written += self._file.write(data[written:])
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            except Exception:
+                if not self._discard_tail():
+                    self.next_offset = first_offset + len(frames)
+                    self._skipped.extend(range(first_offset, self.next_offset))
+                raise
+            self._file_size += len(data)
+            self.next_offset = first_offset + len(frames)
+            return first_offset
+
+    def _discard_tail(self) -> bool:
+        """Cut a failed write off the active segment, returns False if that failed too"""
+        truncated = True
+        try:
+            os.ftruncate(self._file.fileno(), self._file_size)
+        except OSError:
+            # Records after a bad frame would be unreadable, so never append behind it
+            truncated = self._reopen_last = False
+            logger.error("Ingest log: could not truncate a failed write", extra={"segment": self._file.name})
+        self._file.close()
+        self._file = None
+        return truncated
+
+    def _roll(self, base_offset: int):
+        if self._file is None and self._segments and self._reopen_last:
+            # Reopen the last segment after a restart or a failed write, unless it is already full
+            last_path = self._segment_path(self._segments[-1])
+            if os.path.getsize(last_path) < self.segment_bytes:
+                self._file = open(last_path, "ab", buffering=0)
+                self._file_size = os.path.getsize(last_path)
+                return
+        if self._file is not None:
+            self._file.close()
+        # Unbuffered, so a failed write leaves nothing behind to be flushed later. A file already
+        # named after next_offset holds no acknowledged record, only a failed write that could not be cut off
+        self._file = open(self._segment_path(base_offset), "wb", buffering=0)
+        self._file_size = 0
+        self._reopen_last = True
+        if not self._segments or self._segments[-1] != base_offset:
+            self._segments.append(base_offset)
+        self._enforce_retention()
+
+    # Consumer offsets
+
+    def commit(self, offset: int):
+        """Mark one record processed; the committed offset advances over contiguous runs"""
+        if offset <= self.committed_offset:
+            return
+        self._done.add(offset)
+        while self.committed_offset + 1 in self._done:
+            self.committed_offset += 1
+            self._done.discard(self.committed_offset)
+            self._offsets_dirty = True
+        if self._offsets_dirty and self._wakeup is not None:
+            self._wakeup.set()
+
+    def dead_letter(self, offset: int, error: str):
+        """Copy a record that keeps failing to the dead-letter file (blocking, run in a thread); the caller commits it"""
+        record = self.get(offset)
+        entry = {"offset": offset, "dead_lettered_at": time.time(), "error": error[:500], "record": record}
+        with open(os.path.join(self.directory, _DEAD_LETTER_FILE), "ab") as f:
+            f.write(dumps(entry) + b"\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        self.dead_lettered += 1
+
+    def _persist_offsets(self):
+        self._offsets_dirty = False
+        path = os.path.join(self.directory, _OFFSETS_FILE)
+        with open(path + ".tmp", "w") as f:
+            f.write(str(self.committed_offset))
+        os.replace(path + ".tmp", path)
+
+    def _enforce_retention(self):
+        """Drop old segments that are fully committed, keeping the active one"""
+        cutoff = time.time() - self.retention_seconds
+        while len(self._segments) > 1:
+            oldest, following = self._segments[0], self._segments[1]
+            path = self._segment_path(oldest)
+            if following - 1 > self.committed_offset or os.path.getmtime(path) > cutoff:
+                return
+            os.remove(path)
+            self._segments.pop(0)
+
+    async def close(self):
+        """Flush pending appends and the committed offset, then close the active segment"""
+        if self._writer is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._writer
+            self._writer = None
+        if os.path.isdir(self.directory):
+            self._persist_offsets()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "segments": len(self._segments),
+            "next_offset": self.next_offset,
+            "committed_offset": self.committed_offset,
+            "uncommitted": self.next_offset - 1 - self.committed_offset,
+            "appended": self.appended,
+            "flushes": self.flushes,
+            "avg_group_size": round(self.appended / self.flushes, 2) if self.flushes else 0.0,
+            "pending": len(self._pending),
+            "dead_lettered": self.dead_lettered,
+        }
@@ -0,0 +1,123 @@
+"""
+In-process fan-out of newly stored leads to connected dashboards.
+
+Workers publish each batch right after it is committed to the lead store;
+every Server-Sent Events connection holds a small bounded queue. Idle
+dashboards cost nothing but an open socket and a periodic heartbeat.
+When several processes share one lead store, each process instead follows
+the store's delta feed, so its dashboards also see leads stored elsewhere.
+"""
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from fast_json import dumps
+
+logger = logging.getLogger(__name__)
+
+
+class LeadBroadcaster:
+    """Publish/subscribe hub for stored leads"""
+
+    def __init__(self, subscriber_queue_size: int = 256):
+        self.subscriber_queue_size = subscriber_queue_size
+        self._subscribers: Set[asyncio.Queue] = set()
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.subscriber_queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, leads: Iterable[Dict[str, Any]]):
+        """Push leads to every subscriber without ever blocking the publisher"""
+        for lead in leads:
+            self.published += 1
+            for queue in list(self._subscribers):
+                try:
+                    queue.put_nowait(lead)
+                except asyncio.QueueFull:
+                    # A stalled client: disconnect it, it will reconnect with Last-Event-ID
+                    self._subscribers.discard(queue)
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(None)
+                    self.dropped_subscribers += 1
+
+
+def format_sse(lead: Dict[str, Any]) -> str:
+    """Encode a lead as one SSE message; the id lets clients resume after a reconnect"""
+    return f"id: {lead['id']}\nevent: lead\ndata: {dumps(lead).decode('utf-8')}\n\n"
+
+
+async def stream_leads(
+    broadcaster: LeadBroadcaster,
+    load_backlog: Optional[Callable[[], Awaitable[List[Dict[str, Any]]]]] = None,
+    heartbeat_seconds: float = 15.0,
+    accept: Optional[Callable[[Dict[str, Any]], bool]] = None,
+) -> AsyncIterator[str]:
+    """
+    SSE body generator: replay the backlog since the client's last id, then push live leads
+    Subscribes before loading the backlog so nothing committed in between is missed
+    Live leads `accept` rejects (e.g. another tenant's) are not sent
+    """
+    queue = broadcaster.subscribe()
+    try:
+        last_id: Optional[int] = None
+        if load_backlog is not None:
+            for lead in await load_backlog():
+                last_id = lead["id"]
+                yield format_sse(lead)
+        while True:
+            try:
+                lead = await asyncio.wait_for(queue.get(), timeout=heartbeat_seconds)
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": ping\n\n"
+                continue
+            if lead is None:
+                return
+            if last_id is not None and lead["id"] <= last_id:
+                continue
+            if accept is not None and not accept(lead):
+                continue
+            yield format_sse(lead)
+    finally:
+        broadcaster.unsubscribe(queue)
+
+
+async def follow_store(
+    broadcaster: LeadBroadcaster,
+    load_since: Callable[[int], Awaitable[List[Dict[str, Any]]]],
+    start_id: int,
+    interval: float = 1.0,
+    record: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+):
+    """
+    Publish every lead stored after `start_id`, by any process, polling `load_since` each interval
+    `record` sees each page first, so in-process indexes can follow the store too
+    """
+    last_id = start_id
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            while True:
+                leads = await load_since(last_id)
+                if not leads:
+                    break
+                last_id = leads[-1]["id"]
+                if record is not None:
+                    record(leads)
+                broadcaster.publish(leads)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Following the lead store failed")
@@ -0,0 +1,144 @@
+"""
+Streaming lead export (CSV, NDJSON, Parquet).
+
+Rows are read from the lead store one keyset page at a time, in the same
+newest-first order and with the same filters as GET /leads, and encoded
+page by page, so memory stays constant however many leads match. Every
+row carries its id and timestamp, so an interrupted export resumes from
+the /leads cursor of the last row received (base64url of "timestamp|id").
+
+Parquet needs the optional pyarrow package; each page becomes one row group.
+"""
+import csv
+import io
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fast_json import dumps
+from lead_store import LEAD_FIELDS
+
+EXPORT_COLUMNS = ['id'] + LEAD_FIELDS
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Loads up to `limit` leads strictly after a (timestamp, id) cursor, newest first
+PageLoader = Callable[[Optional[Tuple[str, int]], int], Awaitable[List[Dict[str, Any]]]]
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands back whatever was written since the last take()"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _CsvEncoder:
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._writer = csv.DictWriter(self._buffer, fieldnames=EXPORT_COLUMNS, extrasaction='ignore')
+
+    def _take(self) -> bytes:
+        data = self._buffer.getvalue().encode('utf-8')
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def header(self) -> bytes:
+        self._writer.writeheader()
+        return self._take()
+
+    def page(self, rows: List[Dict[str, Any]]) -> bytes:
+        self._writer.writerows(rows)
+        return self._take()
+
+    def footer(self) -> bytes:
+        return b""
+
+
+class _NdjsonEncoder:
+    def header(self) -> bytes:
+        return b""
+
+    def page(self, rows: List[Dict[str, Any]]) -> bytes:
+        return b"".join(dumps({column: row.get(column) for column in EXPORT_COLUMNS}) + b"\n" for row in rows)
+
+    def footer(self) -> bytes:
+        return b""
+
+
+class _ParquetEncoder:
+    def __init__(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self._schema = pa.schema([('id', pa.int64())] + [(field, pa.string()) for field in LEAD_FIELDS])
+        self._sink = _ChunkSink()
+        self._writer = pq.ParquetWriter(self._sink, self._schema, compression='zstd')
+
+    def header(self) -> bytes:
+        return self._sink.take()
+
+    def page(self, rows: List[Dict[str, Any]]) -> bytes:
+        columns = {column: [row.get(column) for row in rows] for column in EXPORT_COLUMNS}
+        self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self._schema))
+        return self._sink.take()
+
+    def footer(self) -> bytes:
+        self._writer.close()
+        return self._sink.take()
+
+
+_ENCODERS = {"csv": _CsvEncoder, "ndjson": _NdjsonEncoder, "parquet": _ParquetEncoder}
+
+
+async def stream_export(
+    load_page: PageLoader,
+    fmt: str,
+    cursor: Optional[Tuple[str, int]] = None,
+    limit: Optional[int] = None,
+    page_size: int = 1000,
+) -> AsyncIterator[bytes]:
+    """Yield the encoded export one page at a time, stopping after `limit` rows when given"""
+    encoder = _ENCODERS[fmt]()
+    header = encoder.header()
+    if header:
+        yield header
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        rows = await load_page(cursor, size)
+        if not rows:
+            break
+        yield encoder.page(rows)
+        cursor = (rows[-1]["timestamp"], rows[-1]["id"])
+        if remaining is not None:
+            remaining -= len(rows)
+        if len(rows) < size:
+            break
+    footer = encoder.footer()
+    if footer:
+        yield footer
@@ -0,0 +1,267 @@
+"""
+Lead profiles merged per user and per post, with a decayed hot-lead score.
+
+A comment is one stored lead, but a user asking "price?" on five posts is
+one prospect. Every stored lead is folded into a profile for its user_id
+and one for its post_id. A profile holds comment counts, first and last
+seen times and a score. Each comment adds its priority weight, halved
+every `half_life_hours`.
+
+Scores use forward decay: a comment at time t adds
+weight * exp(rate * (t - landmark)) and reads divide by
+exp(rate * (now - landmark)). Stored scores therefore never change with
+the clock, only when a comment arrives, and they only ever grow. That
+keeps the top-N set exact with a min-heap updated on write, and
+/leads/hot reads it without touching the other profiles.
+
+Each stored lead (unique comment id) is counted once. Profiles live in
+memory and are rebuilt from the lead store at startup, like LeadStats.
+"""
+import heapq
+import math
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Score added per comment before decay
+PRIORITY_WEIGHTS = {"High": 3.0, "Medium": 1.5, "Normal": 1.0, "Low": 0.25}
+
+# Landmark is moved forward before exp() gets anywhere near float overflow
+_MAX_EXPONENT = 500.0
+
+
+def event_time(timestamp: str) -> Optional[float]:
+    """Epoch seconds of a lead's ISO timestamp, None when it does not parse"""
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class LeadProfile:
+    """Everything one user (or post) has said, merged"""
+
+    __slots__ = (
+        'key', 'source', 'comments', 'first_seen', 'last_seen', 'by_priority',
+        'related', 'last_comment', 'last_lead_id', 'weight',
+    )
+
+    def __init__(self, key: str):
+        self.key = key
+        self.source = ""
+        self.comments = 0
+        self.first_seen = ""
+        self.last_seen = ""
+        self.by_priority: Dict[str, int] = {}
+        # Most recent distinct posts of a user (or users of a post), oldest first
+        self.related: Dict[str, None] = {}
+        self.last_comment = ""
+        self.last_lead_id: Optional[int] = None
+        self.weight = 0.0
+
+
+class ProfileIndex:
+    """Profiles keyed on one lead field, with an exact top-N by score"""
+
+    def __init__(
+        self,
+        key_field: str,
+        related_field: str,
+        half_life_hours: float = 24.0,
+        top_n: int = 100,
+        max_profiles: int = 100000,
+        related_kept: int = 20,
+    ):
+        self.key_field = key_field
+        self.related_field = related_field
+        self.half_life_hours = half_life_hours
+        self.rate = math.log(2) / (half_life_hours * 3600)
+        self.top_n = top_n
+        self.max_profiles = max_profiles
+        self.related_kept = related_kept
+        self.reset()
+
+    def reset(self):
+        # Set by the first comment recorded; forward decay needs it no later than the events it scores
+        self.landmark: Optional[float] = None
+        self.profiles: Dict[str, LeadProfile] = {}
+        # Current top-N members -> score when last pushed; the heap may hold stale entries
+        self._top: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self.pruned = 0
+
+    def record(self, leads: Iterable[Dict[str, Any]]):
+        for lead in leads:
+            key = lead.get(self.key_field)
+            if not key:
+                continue
+            profile = self.profiles.get(key)
+            if profile is None:
+                profile = self.profiles[key] = LeadProfile(key)
+            self._merge(profile, lead)
+            self._rank(profile)
+        if len(self.profiles) > self.max_profiles:
+            self._prune()
+
+    def _merge(self, profile: LeadProfile, lead: Dict[str, Any]):
+        timestamp = lead.get("timestamp") or ""
+        priority = lead.get("priority") or "Normal"
+        profile.comments += 1
+        profile.by_priority[priority] = profile.by_priority.get(priority, 0) + 1
+        if not profile.first_seen or timestamp < profile.first_seen:
+            profile.first_seen = timestamp
+        if timestamp >= profile.last_seen:
+            profile.last_seen = timestamp
+            profile.source = lead.get("source") or profile.source
+            profile.last_comment = lead.get("comment_text") or ""
+            profile.last_lead_id = lead.get("id")
+        related = lead.get(self.related_field)
+        if related:
+            profile.related.pop(related, None)
+            profile.related[related] = None
+            if len(profile.related) > self.related_kept:
+                del profile.related[next(iter(profile.related))]
+        at = event_time(timestamp)
+        if self.landmark is None:
+            self.landmark = time.time() if at is None else at
+        if at is None:
+            # Unparseable (legacy CSV) timestamps count as old as the landmark
+            at = self.landmark
+        if self.rate * (at - self.landmark) > _MAX_EXPONENT:
+            self._rebase(at)
+        profile.weight += PRIORITY_WEIGHTS.get(priority, 1.0) * math.exp(self.rate * (at - self.landmark))
+
+    def _rank(self, profile: LeadProfile):
+        """Keep _top exact: scores only grow, so a profile can only enter by beating the minimum"""
+        key = profile.key
+        if key in self._top:
+            self._top[key] = profile.weight
+            heapq.heappush(self._heap, (profile.weight, key))
+            if len(self._heap) > 2 * self.top_n:
+                self._heap = [(weight, member) for member, weight in self._top.items()]
+                heapq.heapify(self._heap)
+            return
+        if len(self._top) < self.top_n:
+            self._top[key] = profile.weight
+            heapq.heappush(self._heap, (profile.weight, key))
+            return
+        weight, member = self._lowest()
+        if profile.weight > weight:
+            heapq.heappop(self._heap)
+            del self._top[member]
+            self._top[key] = profile.weight
+            heapq.heappush(self._heap, (profile.weight, key))
+
+    def _lowest(self) -> Tuple[float, str]:
+        while self._heap[0][0] != self._top.get(self._heap[0][1]):
+            heapq.heappop(self._heap)
+        return self._heap[0]
+
+    def _rebase(self, at: float):
+        """Move the landmark to `at`; every score shrinks by the same factor, so the ranking holds"""
+        factor = math.exp(-self.rate * (at - self.landmark))
+        self.landmark = at
+        for profile in self.profiles.values():
+            profile.weight *= factor
+        self._top = {key: self.profiles[key].weight for key in self._top}
+        self._heap = [(weight, key) for key, weight in self._top.items()]
+        heapq.heapify(self._heap)
+
+    def _prune(self):
+        """Forget the coldest profiles outside the top-N, down to 90% of max_profiles"""
+        excess = len(self.profiles) - int(self.max_profiles * 0.9)
+        candidates = (profile for key, profile in self.profiles.items() if key not in self._top)
+        for profile in heapq.nsmallest(excess, candidates, key=lambda profile: profile.weight):
+            del self.profiles[profile.key]
+        self.pruned += excess
+
+    def score(self, profile: LeadProfile, now: Optional[float] = None) -> float:
+        """Decayed score as of `now`: the weighted comment count, each halved per half-life of age"""
+        now = time.time() if now is None else now
+        return profile.weight * math.exp(-self.rate * (now - self.landmark))
+
+    def snapshot(self, profile: LeadProfile, now: Optional[float] = None) -> Dict[str, Any]:
+        top_priority = max(profile.by_priority, key=lambda priority: PRIORITY_WEIGHTS.get(priority, 1.0))
+        return {
+            self.key_field: profile.key,
+            "source": profile.source,
+            "score": round(self.score(profile, now), 4),
+            "comments": profile.comments,
+            "first_seen": profile.first_seen,
+            "last_seen": profile.last_seen,
+            "top_priority": top_priority,
+            "by_priority": dict(profile.by_priority),
+            f"{self.related_field}s": list(reversed(profile.related)),
+            "last_comment": profile.last_comment,
+            "last_lead_id": profile.last_lead_id,
+        }
+
+    def hot(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Highest-scoring profiles first; reads only the top-N members, never the whole index"""
+        now = time.time()
+        ranked = sorted(self._top, key=self._top.__getitem__, reverse=True)[:limit]
+        return [self.snapshot(self.profiles[key], now) for key in ranked]
+
+
+class LeadProfiles:
+    """The per-user and per-post indexes, fed together"""
+
+    def __init__(self, half_life_hours: float = 24.0, top_n: int = 100, max_profiles: int = 100000):
+        self.half_life_hours = half_life_hours
+        self.indexes = {
+            "user": ProfileIndex("user_id", "post_id", half_life_hours, top_n, max_profiles),
+            "post": ProfileIndex("post_id", "user_id", half_life_hours, top_n, max_profiles),
+        }
+        self.last_id = 0
+        # False while a rebuild runs in the background; live leads wait in _pending until it is adopted
+        self.ready = True
+        self._pending: List[Dict[str, Any]] = []
+
+    def record(self, leads: Iterable[Dict[str, Any]]):
+        leads = list(leads)
+        if not self.ready:
+            self._pending.extend(leads)
+            return
+        for index in self.indexes.values():
+            index.record(leads)
+        for lead in leads:
+            if (lead.get("id") or 0) > self.last_id:
+                self.last_id = lead["id"]
+
+    def load(self, pages: Iterable[List[Dict[str, Any]]]):
+        """Rebuild from pages of stored leads, oldest first"""
+        for index in self.indexes.values():
+            index.reset()
+        self.last_id = 0
+        for page in pages:
+            self.record(page)
+
+    def start_rebuild(self):
+        """Stop serving and buffer live leads until adopt() installs a rebuilt copy"""
+        self.ready = False
+        self._pending = []
+
+    def rebuilt(self, pages: Iterable[List[Dict[str, Any]]]) -> "LeadProfiles":
+        """Fresh profiles built from `pages` without touching this instance, so it can run in a thread"""
+        top_n = self.indexes["user"].top_n
+        max_profiles = self.indexes["user"].max_profiles
+        fresh = LeadProfiles(self.half_life_hours, top_n, max_profiles)
+        fresh.load(pages)
+        return fresh
+
+    def adopt(self, fresh: "LeadProfiles"):
+        """Install a rebuilt copy, then apply the live leads buffered meanwhile that it does not cover"""
+        self.indexes = fresh.indexes
+        self.last_id = fresh.last_id
+        pending, self._pending = self._pending, []
+        self.ready = True
+        self.record(lead for lead in pending if (lead.get("id") or 0) > fresh.last_id)
+
+    def hot(self, kind: str = "user", limit: int = 20) -> List[Dict[str, Any]]:
+        return self.indexes[kind].hot(limit)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            kind: {"profiles": len(index.profiles), "pruned": index.pruned}
+            for kind, index in self.indexes.items()
+        }
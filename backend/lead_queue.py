@@ -0,0 +1,448 @@
+"""
+Bounded work queue for webhook processing.
+
+The webhook handler only validates the payload and publishes the extracted
+work; a pool of async workers drains the queue in the background so Meta
+gets its 200 within milliseconds.
+
+LeadQueue is in-process: each delivery is appended to the local ingest log
+before it is queued, committed once handled, and replayed from the log
+after a crash. A failing delivery is retried with backoff and, after
+`max_attempts`, dead-lettered and committed. Deliveries wait in one lane
+per tenant, served round robin (see fair_share.FairQueue), and each lane
+may be capped below the queue size, so one tenant's backlog neither
+delays nor locks out the others.
+RedisLeadQueue keeps deliveries in a Redis stream consumed by every
+process and node, so work is shared out across the cluster.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from fair_share import FairQueue
+from fast_json import dumps, loads
+from ingest_log import IngestLog
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the queue is at capacity (backpressure) or shutting down"""
+
+
+class LeadQueue:
+    """Bounded asyncio queue drained by a fixed pool of async workers, optionally backed by an ingest log"""
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[None]],
+        max_size: int = 1000,
+        worker_count: int = 4,
+        drain_timeout: float = 30.0,
+        log: Optional[IngestLog] = None,
+        decode: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        lane: Optional[Callable[[Any], str]] = None,
+        lane_max_size: Optional[Callable[[str], int]] = None,
+        max_attempts: int = 5,
+        retry_delay: float = 1.0,
+    ):
+        self.handler = handler
+        self.max_size = max_size
+        self.worker_count = worker_count
+        self.drain_timeout = drain_timeout
+        # Durable log of published records, and how to rebuild a work item from one
+        self.log = log
+        self.decode = decode
+        # Which lane (tenant) an item waits in, and how many items that lane may hold
+        self.lane = lane
+        self.lane_max_size = lane_max_size
+        # Handler attempts per delivery before it is dead-lettered; retries back off exponentially
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        self._queue: Optional[FairQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._retries: Set[asyncio.Task] = set()
+        self._accepting = False
+        # Slots promised to publishes still waiting on the log, overall and per lane
+        self._reserved = 0
+        self._lane_reserved: Counter = Counter()
+
+        # Backpressure metrics
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.rejected = 0
+        self.lane_rejected: Counter = Counter()
+        self.in_flight = 0
+        self.high_water_mark = 0
+        self.total_wait_seconds = 0.0
+        self.last_wait_seconds = 0.0
+
+    def _lane_of(self, item: Any) -> str:
+        return self.lane(item) if self.lane is not None else ""
+
+    async def start(self):
+        """Open the log, create the queue and spawn the worker pool"""
+        if self._workers:
+            return
+        if self.log is not None:
+            self.log.open()
+            await self.log.start()
+        self._queue = FairQueue(maxsize=self.max_size)
+        self._accepting = True
+        for worker_id in range(self.worker_count):
+            self._workers.append(asyncio.create_task(self._worker(worker_id)))
+        logger.info("Lead queue started", extra={"workers": self.worker_count, "max_size": self.max_size})
+
+    def _check_capacity(self, lane: str):
+        if not self._accepting or self._queue is None:
+            self.rejected += 1
+            raise QueueFullError("Queue is not accepting work")
+        if self._queue.qsize() + self._reserved >= self.max_size:
+            self.rejected += 1
+            self.lane_rejected[lane] += 1
+            raise QueueFullError(f"Queue is full ({self.max_size} items)")
+        if self.lane_max_size is not None:
+            limit = self.lane_max_size(lane)
+            if self._queue.lane_size(lane) + self._lane_reserved[lane] >= limit:
+                # Only this lane is refused; the rest of the queue stays open to everyone else
+                self.rejected += 1
+                self.lane_rejected[lane] += 1
+                raise QueueFullError(f"Queue share of tenant {lane!r} is full ({limit} items)")
+
+    def _enqueued(self):
+        self.enqueued += 1
+        self.high_water_mark = max(self.high_water_mark, self._queue.qsize())
+
+    async def publish(self, record: Dict[str, Any], item: Any = None) -> Optional[int]:
+        """
+        Durably accept one delivery: append `record` to the log, then queue `item`
+        (decoded from the record when omitted). Raises QueueFullError before
+        anything is logged when saturated. Returns the log offset.
+        """
+        if item is None:
+            item = self.decode(record)
+        lane = self._lane_of(item)
+        self._check_capacity(lane)
+        self._reserved += 1
+        self._lane_reserved[lane] += 1
+        try:
+            offset = await self.log.append(record) if self.log is not None else None
+        finally:
+            self._reserved -= 1
+            self._lane_reserved[lane] -= 1
+        await self._queue.put(lane, (time.monotonic(), offset, item, 1))
+        self._enqueued()
+        return offset
+
+    async def put(self, item: Any, offset: Optional[int] = None, attempt: int = 1):
+        """Enqueue an item, waiting for space; used for internal backlogs such as crash recovery and retries"""
+        if not self._accepting or self._queue is None:
+            raise QueueFullError("Queue is not accepting work")
+        await self._queue.put(self._lane_of(item), (time.monotonic(), offset, item, attempt))
+        self._enqueued()
+
+    async def recover(self) -> int:
+        """Requeue records logged but not processed before the last shutdown, returns how many"""
+        if self.log is None:
+            return 0
+        records = await asyncio.to_thread(lambda: list(self.log.uncommitted()))
+        for offset, _, record in records:
+            await self.put(self.decode(record), offset)
+        return len(records)
+
+    async def _worker(self, worker_id: int):
+        while True:
+            enqueued_at, offset, item, attempt = await self._queue.get()
+            self.last_wait_seconds = time.monotonic() - enqueued_at
+            self.total_wait_seconds += self.last_wait_seconds
+            self.in_flight += 1
+            try:
+                await self.handler(item)
+                self.processed += 1
+                # Fully handled: a restart no longer needs to replay this delivery
+                if offset is not None:
+                    self.log.commit(offset)
+            except Exception as e:
+                self.failed += 1
+                logger.exception("Worker failed to process item", extra={"worker": worker_id, "offset": offset, "attempt": attempt})
+                await self._failed(offset, item, attempt, f"{type(e).__name__}: {e}")
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+
+    async def _failed(self, offset: Optional[int], item: Any, attempt: int, error: str):
+        if not self._accepting:
+            # Shutting down: left uncommitted, replayed on the next start
+            return
+        if attempt < self.max_attempts:
+            # Retried in the background, so the worker moves on while the item backs off
+            self.retried += 1
+            task = asyncio.create_task(self._retry(offset, item, attempt + 1))
+            self._retries.add(task)
+            task.add_done_callback(self._retries.discard)
+            return
+        self.dead_lettered += 1
+        logger.error("Delivery dead-lettered", extra={"offset": offset, "attempts": attempt, "error": error})
+        if offset is not None:
+            # Commit it, otherwise the committed offset and retention stall behind it for good
+            await asyncio.to_thread(self.log.dead_letter, offset, error)
+            self.log.commit(offset)
+
+    async def _retry(self, offset: Optional[int], item: Any, attempt: int):
+        await asyncio.sleep(self.retry_delay * 2 ** (attempt - 2))
+        try:
+            await self.put(item, offset, attempt)
+        except QueueFullError:
+            # Stopped while backing off: the log replays it on the next start
+            pass
+
+    async def stop(self):
+        """Stop accepting work, drain what is queued, cancel the workers and close the log"""
+        if self._queue is None:
+            return
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self.drain_timeout)
+            logger.info("Lead queue drained")
+        except asyncio.TimeoutError:
+            logger.warning("Lead queue drain timed out", extra={"items_left": self._queue.qsize()})
+        for task in [*self._workers, *self._retries]:
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._retries, return_exceptions=True)
+        self._workers = []
+        # Anything still queued stays uncommitted and is replayed on the next start
+        if self.log is not None:
+            await self.log.close()
+
+    def stats(self) -> Dict[str, Any]:
+        depth = self._queue.qsize() if self._queue is not None else 0
+        dequeued = self.processed + self.failed + self.in_flight
+        return {
+            "backend": "local",
+            "accepting": self._accepting,
+            "workers": len(self._workers),
+            "depth": depth,
+            "max_size": self.max_size,
+            "utilization": round(depth / self.max_size, 4) if self.max_size else 0.0,
+            "high_water_mark": self.high_water_mark,
+            "in_flight": self.in_flight,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "dead_lettered": self.dead_lettered,
+            "avg_wait_seconds": round(self.total_wait_seconds / dequeued, 4) if dequeued else 0.0,
+            "last_wait_seconds": round(self.last_wait_seconds, 4),
+            "lanes": self._queue.lane_sizes() if self._queue is not None else {},
+        }
+
+
+class RedisLeadQueue:
+    """
+    Deliveries in a Redis stream read through one consumer group by every process and node
+
+    An entry is acknowledged and deleted only after its handler succeeds.
+    Entries left pending by a crashed or failing consumer are claimed by
+    another consumer after `claim_idle` seconds, and moved to a dead-letter
+    stream after `max_deliveries` attempts.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[None]],
+        client: Any,
+        decode: Callable[[Dict[str, Any]], Any],
+        prefix: str = "lead_agent",
+        max_size: int = 1000,
+        worker_count: int = 4,
+        drain_timeout: float = 30.0,
+        claim_idle: float = 120.0,
+        max_deliveries: int = 5,
+        block_seconds: float = 1.0,
+    ):
+        from redis_support import key_prefix
+
+        self.handler = handler
+        self._client = client
+        self.decode = decode
+        self.stream = f"{key_prefix(prefix)}:webhooks"
+        self.dead_letter_stream = f"{key_prefix(prefix)}:webhooks:dead"
+        self.group = "lead-workers"
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self.max_size = max_size
+        self.worker_count = worker_count
+        self.drain_timeout = drain_timeout
+        self.claim_idle = claim_idle
+        self.max_deliveries = max_deliveries
+        self.block_seconds = block_seconds
+
+        self._workers: List[asyncio.Task] = []
+        self._reclaimer: Optional[asyncio.Task] = None
+        self._accepting = False
+        self._stopping = False
+        # Stream length as of the last publish or reclaim pass; stats() must not block on Redis
+        self._depth = 0
+
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.reclaimed = 0
+        self.dead_lettered = 0
+        self.in_flight = 0
+        self.high_water_mark = 0
+        self.total_wait_seconds = 0.0
+        self.last_wait_seconds = 0.0
+
+    async def start(self):
+        """Create the stream and consumer group if missing, then spawn consumers"""
+        if self._workers:
+            return
+        try:
+            await self._client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._accepting = True
+        self._stopping = False
+        for worker_id in range(self.worker_count):
+            self._workers.append(asyncio.create_task(self._worker(worker_id)))
+        self._reclaimer = asyncio.create_task(self._reclaim())
+        logger.info("Redis lead queue started", extra={"workers": self.worker_count, "consumer": self.consumer})
+
+    async def publish(self, record: Dict[str, Any], item: Any = None) -> str:
+        """Append one delivery to the stream; raises QueueFullError when the cluster-wide backlog is full"""
+        if not self._accepting:
+            self.rejected += 1
+            raise QueueFullError("Queue is not accepting work")
+        self._depth = await self._client.xlen(self.stream)
+        if self._depth >= self.max_size:
+            self.rejected += 1
+            raise QueueFullError(f"Queue is full ({self.max_size} items)")
+        entry_id = await self._client.xadd(self.stream, {"record": dumps(record)})
+        self.enqueued += 1
+        self.high_water_mark = max(self.high_water_mark, self._depth + 1)
+        return entry_id
+
+    async def recover(self) -> int:
+        """Nothing to do locally: entries a dead consumer left pending are claimed by the reclaimer"""
+        return 0
+
+    async def _worker(self, worker_id: int):
+        while not self._stopping:
+            try:
+                response = await self._client.xreadgroup(
+                    self.group, self.consumer, {self.stream: ">"}, count=1, block=int(self.block_seconds * 1000)
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Redis queue read failed", extra={"worker": worker_id})
+                await asyncio.sleep(self.block_seconds)
+                continue
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    await self._handle(entry_id, fields, worker_id)
+
+    async def _handle(self, entry_id: str, fields: Dict[str, str], worker_id: int):
+        # Stream ids start with the append time in milliseconds
+        self.last_wait_seconds = max(0.0, time.time() - int(entry_id.split("-")[0]) / 1000)
+        self.total_wait_seconds += self.last_wait_seconds
+        self.in_flight += 1
+        try:
+            await self.handler(self.decode(loads(fields["record"])))
+        except Exception:
+            # Left pending: another consumer claims it after claim_idle
+            self.failed += 1
+            logger.exception("Worker failed to process item", extra={"worker": worker_id, "entry_id": entry_id})
+            return
+        finally:
+            self.in_flight -= 1
+        pipe = self._client.pipeline(transaction=False)
+        pipe.xack(self.stream, self.group, entry_id)
+        pipe.xdel(self.stream, entry_id)
+        await pipe.execute()
+        self.processed += 1
+
+    async def _reclaim(self):
+        idle_ms = int(self.claim_idle * 1000)
+        while not self._stopping:
+            await asyncio.sleep(self.claim_idle / 2)
+            try:
+                self._depth = await self._client.xlen(self.stream)
+                pending = await self._client.xpending_range(
+                    self.stream, self.group, min="-", max="+", count=100, idle=idle_ms
+                )
+                for entry in pending:
+                    entry_id = entry["message_id"]
+                    if entry["times_delivered"] >= self.max_deliveries:
+                        await self._dead_letter(entry_id, entry["times_delivered"])
+                        continue
+                    claimed = await self._client.xclaim(
+                        self.stream, self.group, self.consumer, min_idle_time=idle_ms, message_ids=[entry_id]
+                    )
+                    for claimed_id, fields in claimed:
+                        if fields:
+                            self.reclaimed += 1
+                            await self._handle(claimed_id, fields, -1)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Redis queue reclaim failed")
+
+    async def _dead_letter(self, entry_id: str, deliveries: int):
+        entries = await self._client.xrange(self.stream, min=entry_id, max=entry_id)
+        pipe = self._client.pipeline(transaction=True)
+        for _, fields in entries:
+            pipe.xadd(self.dead_letter_stream, {**fields, "entry_id": entry_id, "deliveries": str(deliveries)})
+        pipe.xack(self.stream, self.group, entry_id)
+        pipe.xdel(self.stream, entry_id)
+        await pipe.execute()
+        self.dead_lettered += 1
+        logger.error("Delivery moved to the dead-letter stream", extra={"entry_id": entry_id, "deliveries": deliveries})
+
+    async def stop(self):
+        """Stop accepting work and let consumers finish the entry in hand; unread entries stay for other processes"""
+        if not self._workers:
+            return
+        self._accepting = False
+        self._stopping = True
+        _, still_running = await asyncio.wait(self._workers, timeout=self.drain_timeout + self.block_seconds)
+        if still_running:
+            logger.warning("Redis lead queue stop timed out", extra={"workers_left": len(still_running)})
+        tasks = self._workers + ([self._reclaimer] if self._reclaimer is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._reclaimer = None
+
+    def stats(self) -> Dict[str, Any]:
+        dequeued = self.processed + self.failed + self.in_flight
+        return {
+            "backend": "redis",
+            "consumer": self.consumer,
+            "accepting": self._accepting,
+            "workers": len(self._workers),
+            "depth": self._depth,
+            "max_size": self.max_size,
+            "utilization": round(self._depth / self.max_size, 4) if self.max_size else 0.0,
+            "high_water_mark": self.high_water_mark,
+            "in_flight": self.in_flight,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "reclaimed": self.reclaimed,
+            "dead_lettered": self.dead_lettered,
+            "avg_wait_seconds": round(self.total_wait_seconds / dequeued, 4) if dequeued else 0.0,
+            "last_wait_seconds": round(self.last_wait_seconds, 4),
+        }
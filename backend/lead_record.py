@@ -0,0 +1,61 @@
+"""
+Compact internal representation of a lead.
+
+Pydantic models validate requests and document responses at the API
+boundary. Inside the pipeline (extraction, dedup, classification,
+queueing, storage) a lead is a LeadRecord instead: a __slots__ object
+with no per-instance __dict__ and no validation on construction or
+assignment. It is converted to a dict once, when it is logged or stored.
+"""
+from typing import Any, Dict, Optional
+
+from lead_store import LEAD_FIELDS
+
+
+class LeadRecord:
+    """One comment moving through the pipeline"""
+
+    __slots__ = (
+        'source', 'user_id', 'comment_text', 'post_id', 'timestamp',
+        'priority', 'ai_response', 'comment_id', 'page_id',
+    )
+
+    def __init__(
+        self,
+        source: str,
+        user_id: str,
+        comment_text: str,
+        post_id: str,
+        timestamp: str,
+        priority: str = "Normal",
+        ai_response: str = "",
+        comment_id: str = "",
+        page_id: str = "",
+    ):
+        self.source = source
+        self.user_id = user_id
+        self.comment_text = comment_text
+        self.post_id = post_id
+        self.timestamp = timestamp
+        self.priority = priority
+        self.ai_response = ai_response
+        self.comment_id = comment_id
+        self.page_id = page_id
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LeadRecord":
+        """Rebuild a record from to_dict() output (ingest log, queue); unknown keys are ignored"""
+        return cls(**{field: data[field] for field in cls.__slots__ if field in data})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def to_row(self, lead_id: Optional[int] = None) -> Dict[str, Any]:
+        """The stored-lead shape served by the API: id plus the persisted fields"""
+        row: Dict[str, Any] = {"id": lead_id}
+        for field in LEAD_FIELDS:
+            row[field] = getattr(self, field)
+        return row
+
+    def __repr__(self) -> str:
+        return f"LeadRecord(source={self.source!r}, comment_id={self.comment_id!r}, priority={self.priority!r})"
@@ -0,0 +1,96 @@
+"""
+Aggregate lead counters maintained on write.
+
+Workers record every stored batch, so /leads/stats is served from memory in
+O(1) instead of scanning the lead table. The counters are rebuilt from the
+lead store once at startup. Tenant pages are also counted on their own, so
+a tenant's stats are summed from its pages rather than recounted per request.
+"""
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def hour_bucket(timestamp: str) -> str:
+    """ISO timestamp -> 'YYYY-MM-DDTHH' bucket"""
+    return timestamp[:13]
+
+
+class LeadStats:
+    """Incremental counters by source, priority, post and hour"""
+
+    def __init__(self, hours_kept: int = 168):
+        self.hours_kept = hours_kept
+        self.reset()
+
+    def reset(self):
+        self.total = 0
+        self.ai_responses = 0
+        self.by_source: Counter = Counter()
+        self.by_priority: Counter = Counter()
+        self.by_post: Counter = Counter()
+        self.by_hour: Counter = Counter()
+        # Per-page counters, only for the pages passed to load()
+        self.pages: Dict[str, "LeadStats"] = {}
+
+    def record(self, leads: Iterable[Dict[str, Any]]):
+        by_page: Dict[str, List[Dict[str, Any]]] = {}
+        for lead in leads:
+            self.total += 1
+            if (lead.get("ai_response") or "").strip():
+                self.ai_responses += 1
+            self.by_source[lead.get("source") or ""] += 1
+            self.by_priority[lead.get("priority") or ""] += 1
+            if lead.get("post_id"):
+                self.by_post[lead["post_id"]] += 1
+            self.by_hour[hour_bucket(lead.get("timestamp") or "")] += 1
+            if lead.get("page_id") in self.pages:
+                by_page.setdefault(lead["page_id"], []).append(lead)
+        self._trim_hours()
+        for page_id, page_leads in by_page.items():
+            self.pages[page_id].record(page_leads)
+
+    def _trim_hours(self):
+        if len(self.by_hour) > self.hours_kept:
+            for bucket in sorted(self.by_hour)[:len(self.by_hour) - self.hours_kept]:
+                del self.by_hour[bucket]
+
+    def load(self, aggregates: Dict[str, Any], pages: Optional[Dict[str, Dict[str, Any]]] = None):
+        """Replace the counters with aggregates computed by the lead store, and those of `pages` (page id -> aggregates)"""
+        self.reset()
+        self.total = aggregates.get("total", 0)
+        self.ai_responses = aggregates.get("ai_responses", 0)
+        self.by_source.update(aggregates.get("by_source", {}))
+        self.by_priority.update(aggregates.get("by_priority", {}))
+        self.by_post.update(aggregates.get("by_post", {}))
+        self.by_hour.update(aggregates.get("by_hour", {}))
+        self._trim_hours()
+        for page_id, page_aggregates in (pages or {}).items():
+            self.pages[page_id] = LeadStats(self.hours_kept)
+            self.pages[page_id].load(page_aggregates)
+
+    def for_pages(self, page_ids: Iterable[str]) -> "LeadStats":
+        """Counters of just these pages, summed from the per-page counters"""
+        merged = LeadStats(self.hours_kept)
+        for page_id in set(page_ids):
+            page = self.pages.get(page_id)
+            if page is None:
+                continue
+            merged.total += page.total
+            merged.ai_responses += page.ai_responses
+            merged.by_source.update(page.by_source)
+            merged.by_priority.update(page.by_priority)
+            merged.by_post.update(page.by_post)
+            merged.by_hour.update(page.by_hour)
+        merged._trim_hours()
+        return merged
+
+    def snapshot(self, hours: int = 24, top_posts: int = 10) -> Dict[str, Any]:
+        recent_hours = sorted(self.by_hour)[-hours:] if hours > 0 else []
+        return {
+            "total": self.total,
+            "ai_responses": self.ai_responses,
+            "by_source": dict(self.by_source),
+            "by_priority": dict(self.by_priority),
+            "by_hour": {bucket: self.by_hour[bucket] for bucket in recent_hours},
+            "top_posts": dict(self.by_post.most_common(top_posts)),
+        }
@@ -0,0 +1,686 @@
+"""
+Lead storage backends.
+
+The app talks to a small repository interface (LeadStore). The default
+backend is an embedded SQLite database in WAL mode with indexes on the
+columns the API filters on, so reads cost O(page) rather than O(total leads).
+RedisLeadStore keeps leads in Redis so several processes and nodes share
+one store.
+
+Leads keep the page (or Instagram account) they came in on, and page_id is
+the tenant partition key: every read takes an optional `page_ids` list and
+then only sees those pages' leads. Multi-page partitions are read one page
+at a time and merged, so each read still walks a single index range.
+"""
+import base64
+import csv
+import heapq
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+LEAD_FIELDS = ['timestamp', 'source', 'user_id', 'comment_text', 'post_id', 'priority', 'ai_response', 'comment_id', 'page_id']
+
+
+def encode_cursor(timestamp: str, lead_id: int) -> str:
+    """Opaque keyset cursor pointing just past (timestamp, id)"""
+    return base64.urlsafe_b64encode(f"{timestamp}|{lead_id}".encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        timestamp, lead_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+        return timestamp, int(lead_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def merge_newest(pages: Iterable[List[Dict[str, Any]]], limit: int) -> List[Dict[str, Any]]:
+    """Merge per-partition pages, each newest first, into one page of at most `limit`"""
+    merged = heapq.merge(*pages, key=lambda lead: (lead["timestamp"], lead["id"]), reverse=True)
+    return [lead for _, lead in zip(range(limit), merged)]
+
+
+def merge_oldest(pages: Iterable[List[Dict[str, Any]]], limit: int) -> List[Dict[str, Any]]:
+    """Merge per-partition pages, each in id order, into one page of at most `limit`"""
+    merged = heapq.merge(*pages, key=lambda lead: lead["id"])
+    return [lead for _, lead in zip(range(limit), merged)]
+
+
+class LeadStore(ABC):
+    """Repository interface for persisted leads"""
+
+    # True when other processes write to the same store, so in-process views of it go stale
+    shared = False
+
+    @abstractmethod
+    def init(self):
+        """Create the schema; safe to call more than once"""
+
+    @abstractmethod
+    def add_many(self, leads: Iterable[Dict[str, Any]]) -> List[Optional[int]]:
+        """
+        Insert a batch of leads in one transaction
+        Returns the new lead ids, None where the platform comment_id was already stored
+        """
+
+    @abstractmethod
+    def update_classifications(self, leads: Iterable[Dict[str, Any]]) -> int:
+        """Overwrite priority and ai_response of stored leads matched by comment_id, returns rows updated"""
+
+    @abstractmethod
+    def update_classifications_by_id(self, leads: Iterable[Dict[str, Any]]) -> int:
+        """Like update_classifications, matched by lead id (legacy CSV rows have no comment_id)"""
+
+    @abstractmethod
+    def existing_comment_ids(self, comment_ids: Iterable[str]) -> Set[str]:
+        """Subset of `comment_ids` already stored"""
+
+    @abstractmethod
+    def iter_comment_ids(self, chunk_size: int = 10000) -> Iterator[str]:
+        """Stream every stored platform comment id (seeds the dedup index)"""
+
+    @abstractmethod
+    def list_leads(
+        self,
+        limit: int = 100,
+        cursor: Optional[Tuple[str, int]] = None,
+        source: Optional[str] = None,
+        priority: Optional[str] = None,
+        post_id: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        page_ids: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Return one page of leads, newest first (timestamp DESC, id DESC)
+        `cursor` is the (timestamp, id) of the last lead of the previous page
+        """
+
+    @abstractmethod
+    def list_since(self, since_id: int, limit: int = 100, page_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Return leads stored after `since_id`, oldest first (delta feed)"""
+
+    def iter_pages(self, through_id: int, page_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """Every lead up to and including `through_id`, oldest first, one list_since page at a time"""
+        since_id = 0
+        while since_id < through_id:
+            page = [lead for lead in self.list_since(since_id, page_size) if lead["id"] <= through_id]
+            if not page:
+                return
+            since_id = page[-1]["id"]
+            yield page
+
+    @abstractmethod
+    def count(self) -> int:
+        """Total number of stored leads"""
+
+    @abstractmethod
+    def last_id(self) -> int:
+        """Highest lead id stored, 0 when empty"""
+
+    @abstractmethod
+    def aggregate_counts(self, page_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Full recount for rebuilding LeadStats: totals and counts by source/priority/post/hour"""
+
+    @abstractmethod
+    def import_csv(self, csv_path: str) -> int:
+        """One-time import of a legacy leads CSV file, returns rows imported"""
+
+    def close(self):
+        pass
+
+
+class SQLiteLeadStore(LeadStore):
+    """Embedded SQLite store (WAL mode) shared by the worker pool and the API"""
+
+    def __init__(self, db_path: str = "leads.db"):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        # One connection shared across worker threads, serialized by a lock
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn = conn
+        return self._conn
+
+    def init(self):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS leads (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        timestamp TEXT NOT NULL,
+                        source TEXT NOT NULL,
+                        user_id TEXT NOT NULL,
+                        comment_text TEXT NOT NULL,
+                        post_id TEXT NOT NULL DEFAULT '',
+                        priority TEXT NOT NULL DEFAULT 'Normal',
+                        ai_response TEXT NOT NULL DEFAULT '',
+                        comment_id TEXT NOT NULL DEFAULT '',
+                        page_id TEXT NOT NULL DEFAULT ''
+                    )
+                """)
+                # Stores created before leads carried the platform comment id or their page
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(leads)")}
+                if "comment_id" not in columns:
+                    conn.execute("ALTER TABLE leads ADD COLUMN comment_id TEXT NOT NULL DEFAULT ''")
+                if "page_id" not in columns:
+                    conn.execute("ALTER TABLE leads ADD COLUMN page_id TEXT NOT NULL DEFAULT ''")
+                # Idempotent ingestion: one row per platform comment
+                conn.execute(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS idx_leads_comment_id ON leads (comment_id) WHERE comment_id != ''"
+                )
+                for column in ('timestamp', 'source', 'priority', 'post_id', 'user_id'):
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_leads_{column} ON leads ({column})")
+                # Serves the filtered, newest-first keyset pages of /leads
+                for column in ('source', 'priority', 'post_id', 'page_id'):
+                    conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS idx_leads_{column}_timestamp ON leads ({column}, timestamp, id)"
+                    )
+                # Per-partition delta feed
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_leads_page_id_id ON leads (page_id, id)")
+                conn.execute("CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def add_many(self, leads: Iterable[Dict[str, Any]]) -> List[Optional[int]]:
+        rows = [tuple(lead.get(field) or '' for field in LEAD_FIELDS) for lead in leads]
+        if not rows:
+            return []
+        query = f"INSERT OR IGNORE INTO leads ({', '.join(LEAD_FIELDS)}) VALUES ({', '.join('?' for _ in LEAD_FIELDS)})"
+        ids: List[Optional[int]] = []
+        with self._lock:
+            conn = self._connect()
+            # Still one transaction; per-row execute only to collect the new ids
+            with conn:
+                for row in rows:
+                    cursor = conn.execute(query, row)
+                    ids.append(cursor.lastrowid if cursor.rowcount else None)
+        return ids
+
+    def update_classifications(self, leads: Iterable[Dict[str, Any]]) -> int:
+        return self._update_classifications("comment_id", leads)
+
+    def update_classifications_by_id(self, leads: Iterable[Dict[str, Any]]) -> int:
+        return self._update_classifications("id", leads)
+
+    def _update_classifications(self, key: str, leads: Iterable[Dict[str, Any]]) -> int:
+        rows = [
+            (lead.get("priority") or "Normal", lead.get("ai_response") or "", lead[key])
+            for lead in leads if lead.get(key)
+        ]
+        if not rows:
+            return 0
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                before = conn.total_changes
+                conn.executemany(f"UPDATE leads SET priority = ?, ai_response = ? WHERE {key} = ?", rows)
+                return conn.total_changes - before
+
+    def existing_comment_ids(self, comment_ids: Iterable[str]) -> Set[str]:
+        wanted = [comment_id for comment_id in set(comment_ids) if comment_id]
+        found: Set[str] = set()
+        with self._lock:
+            conn = self._connect()
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(wanted), 500):
+                chunk = wanted[start:start + 500]
+                found.update(row[0] for row in conn.execute(
+                    f"SELECT comment_id FROM leads WHERE comment_id IN ({', '.join('?' for _ in chunk)})",
+                    chunk
+                ))
+        return found
+
+    def iter_comment_ids(self, chunk_size: int = 10000) -> Iterator[str]:
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._connect().execute(
+                    "SELECT id, comment_id FROM leads WHERE id > ? AND comment_id != '' ORDER BY id LIMIT ?",
+                    (last_id, chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            for row in rows:
+                yield row[1]
+
+    def list_leads(
+        self,
+        limit: int = 100,
+        cursor: Optional[Tuple[str, int]] = None,
+        source: Optional[str] = None,
+        priority: Optional[str] = None,
+        post_id: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        page_ids: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        if page_ids is not None and len(page_ids) != 1:
+            return merge_newest((
+                self.list_leads(limit, cursor, source, priority, post_id, start, end, [page_id])
+                for page_id in page_ids
+            ), limit)
+        page_id = page_ids[0] if page_ids else None
+        clauses = []
+        params: List[Any] = []
+        for column, value in (('source', source), ('priority', priority), ('post_id', post_id), ('page_id', page_id)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("timestamp < ?")
+            params.append(end)
+        if cursor is not None:
+            # Keyset pagination: seek past the previous page instead of OFFSET scanning
+            clauses.append("(timestamp < ? OR (timestamp = ? AND id < ?))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+
+        query = f"SELECT id, {', '.join(LEAD_FIELDS)} FROM leads"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._connect().execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_since(self, since_id: int, limit: int = 100, page_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        if page_ids is not None:
+            with self._lock:
+                conn = self._connect()
+                pages = [
+                    [dict(row) for row in conn.execute(
+                        f"SELECT id, {', '.join(LEAD_FIELDS)} FROM leads WHERE page_id = ? AND id > ? ORDER BY id LIMIT ?",
+                        (page_id, since_id, limit)
+                    )]
+                    for page_id in page_ids
+                ]
+            return merge_oldest(pages, limit)
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT id, {', '.join(LEAD_FIELDS)} FROM leads WHERE id > ? ORDER BY id LIMIT ?",
+                (since_id, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+
+    def last_id(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COALESCE(MAX(id), 0) FROM leads").fetchone()[0]
+
+    def aggregate_counts(self, page_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        partition: List[str] = []
+        params: List[Any] = []
+        if page_ids is not None:
+            partition.append(f"page_id IN ({', '.join('?' for _ in page_ids)})")
+            params.extend(page_ids)
+        with self._lock:
+            conn = self._connect()
+            where = " WHERE " + " AND ".join(partition) if partition else ""
+            total, ai_responses = conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(TRIM(ai_response) != ''), 0) FROM leads{where}", params
+            ).fetchone()
+            aggregates: Dict[str, Any] = {"total": total, "ai_responses": ai_responses}
+            for name, expression in (
+                ("by_source", "source"),
+                ("by_priority", "priority"),
+                ("by_post", "post_id"),
+                ("by_hour", "substr(timestamp, 1, 13)"),
+            ):
+                clauses = partition + (["post_id != ''"] if name == "by_post" else [])
+                where = " WHERE " + " AND ".join(clauses) if clauses else ""
+                aggregates[name] = dict(conn.execute(
+                    f"SELECT {expression}, COUNT(*) FROM leads{where} GROUP BY {expression}", params
+                ).fetchall())
+        return aggregates
+
+    def import_csv(self, csv_path: str) -> int:
+        if not os.path.exists(csv_path):
+            return 0
+        marker = f"csv_imported:{os.path.abspath(csv_path)}"
+        with self._lock:
+            conn = self._connect()
+            if conn.execute("SELECT 1 FROM store_meta WHERE key = ?", (marker,)).fetchone():
+                return 0
+            with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+                rows = [tuple(row.get(field) or '' for field in LEAD_FIELDS) for row in csv.DictReader(f)]
+            with conn:
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO leads ({', '.join(LEAD_FIELDS)}) VALUES ({', '.join('?' for _ in LEAD_FIELDS)})",
+                    rows
+                )
+                conn.execute("INSERT INTO store_meta (key, value) VALUES (?, ?)", (marker, str(len(rows))))
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Inserts a batch atomically: skips stored comment ids, assigns ids and maintains indexes and counters
+# (overall under p:leads, and per page partition under p:leads:page:<page_id>)
+_REDIS_ADD_SCRIPT = """
+local p = ARGV[1]
+local fields = cjson.decode(ARGV[2])
+local leads = cjson.decode(ARGV[3])
+local ids = {}
+local function count(base, lead)
+    redis.call('HINCRBY', base .. ':agg', 'total', 1)
+    if string.match(lead.ai_response, '%S') then
+        redis.call('HINCRBY', base .. ':agg', 'ai_responses', 1)
+    end
+    redis.call('HINCRBY', base .. ':agg:source', lead.source, 1)
+    redis.call('HINCRBY', base .. ':agg:priority', lead.priority, 1)
+    redis.call('HINCRBY', base .. ':agg:hour', string.sub(lead.timestamp, 1, 13), 1)
+    if lead.post_id ~= '' then
+        redis.call('HINCRBY', base .. ':agg:post', lead.post_id, 1)
+    end
+end
+for i, lead in ipairs(leads) do
+    local id = 0
+    local comment_id = lead.comment_id
+    if comment_id == '' or redis.call('HEXISTS', p .. ':leads:comment_ids', comment_id) == 0 then
+        id = redis.call('INCR', p .. ':leads:next_id')
+        if comment_id ~= '' then
+            redis.call('HSET', p .. ':leads:comment_ids', comment_id, id)
+        end
+        local values = {}
+        for _, name in ipairs(fields) do
+            table.insert(values, name)
+            table.insert(values, lead[name])
+        end
+        redis.call('HSET', p .. ':lead:' .. id, unpack(values))
+        local member = lead.timestamp .. '|' .. string.format('%020d', id)
+        redis.call('ZADD', p .. ':leads:order', 0, member)
+        redis.call('ZADD', p .. ':leads:source:' .. lead.source, 0, member)
+        redis.call('ZADD', p .. ':leads:priority:' .. lead.priority, 0, member)
+        if lead.post_id ~= '' then
+            redis.call('ZADD', p .. ':leads:post:' .. lead.post_id, 0, member)
+        end
+        count(p .. ':leads', lead)
+        if lead.page_id ~= '' then
+            local partition = p .. ':leads:page:' .. lead.page_id
+            redis.call('ZADD', partition .. ':order', 0, member)
+            redis.call('ZADD', partition .. ':ids', id, id)
+            count(partition, lead)
+        end
+    end
+    ids[i] = id
+end
+return ids
+"""
+
+# Rewrites priority/ai_response by lead id or comment id, moving the lead between priority indexes and counters
+_REDIS_UPDATE_SCRIPT = """
+local p = ARGV[1]
+local updates = cjson.decode(ARGV[2])
+local changed = 0
+local function recount(base, old, update, had_response, has_response)
+    if old[1] ~= update.priority then
+        redis.call('HINCRBY', base .. ':agg:priority', old[1], -1)
+        redis.call('HINCRBY', base .. ':agg:priority', update.priority, 1)
+    end
+    if had_response ~= has_response then
+        redis.call('HINCRBY', base .. ':agg', 'ai_responses', has_response and 1 or -1)
+    end
+end
+for _, update in ipairs(updates) do
+    local id = update.id
+    if id then
+        id = tostring(id)
+        if redis.call('EXISTS', p .. ':lead:' .. id) == 0 then
+            id = nil
+        end
+    else
+        id = redis.call('HGET', p .. ':leads:comment_ids', update.comment_id)
+    end
+    if id then
+        local key = p .. ':lead:' .. id
+        local old = redis.call('HMGET', key, 'priority', 'ai_response', 'timestamp', 'page_id')
+        if old[1] ~= update.priority then
+            local member = old[3] .. '|' .. string.format('%020d', tonumber(id))
+            redis.call('ZREM', p .. ':leads:priority:' .. old[1], member)
+            redis.call('ZADD', p .. ':leads:priority:' .. update.priority, 0, member)
+        end
+        local had_response = string.match(old[2] or '', '%S') ~= nil
+        local has_response = string.match(update.ai_response, '%S') ~= nil
+        recount(p .. ':leads', old, update, had_response, has_response)
+        if old[4] and old[4] ~= '' then
+            recount(p .. ':leads:page:' .. old[4], old, update, had_response, has_response)
+        end
+        redis.call('HSET', key, 'priority', update.priority, 'ai_response', update.ai_response)
+        changed = changed + 1
+    end
+end
+return changed
+"""
+
+
+class RedisLeadStore(LeadStore):
+    """
+    Leads in Redis, shared by every process and node
+
+    Each lead is a hash; lexicographically sorted sets of "timestamp|id" give
+    newest-first keyset pages overall and per source, priority and post, and
+    counter hashes maintained on write serve aggregate_counts without a scan.
+    Each page partition has its own order and id indexes and counters.
+    Writes run as Lua scripts, so concurrent writers never store a comment twice.
+    """
+
+    shared = True
+
+    def __init__(self, client: Any, prefix: str = "lead_agent", batch_size: int = 500):
+        from redis_support import key_prefix
+
+        self._client = client
+        self.prefix = key_prefix(prefix)
+        self.batch_size = batch_size
+        self._add_script = None
+        self._update_script = None
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self.prefix,) + parts)
+
+    def init(self):
+        self._client.ping()
+        self._add_script = self._client.register_script(_REDIS_ADD_SCRIPT)
+        self._update_script = self._client.register_script(_REDIS_UPDATE_SCRIPT)
+
+    def _row(self, lead_id: int, data: Dict[str, str]) -> Dict[str, Any]:
+        row: Dict[str, Any] = {"id": lead_id}
+        for field in LEAD_FIELDS:
+            row[field] = data.get(field, '')
+        return row
+
+    def add_many(self, leads: Iterable[Dict[str, Any]]) -> List[Optional[int]]:
+        rows = [{field: lead.get(field) or '' for field in LEAD_FIELDS} for lead in leads]
+        ids: List[Optional[int]] = []
+        for start in range(0, len(rows), self.batch_size):
+            result = self._add_script(
+                keys=[self._key("leads", "next_id")],
+                args=[self.prefix, json.dumps(LEAD_FIELDS), json.dumps(rows[start:start + self.batch_size])]
+            )
+            ids.extend(int(lead_id) or None for lead_id in result)
+        return ids
+
+    def update_classifications(self, leads: Iterable[Dict[str, Any]]) -> int:
+        return self._update_classifications("comment_id", leads)
+
+    def update_classifications_by_id(self, leads: Iterable[Dict[str, Any]]) -> int:
+        return self._update_classifications("id", leads)
+
+    def _update_classifications(self, key: str, leads: Iterable[Dict[str, Any]]) -> int:
+        updates = [
+            {
+                key: lead[key],
+                "priority": lead.get("priority") or "Normal",
+                "ai_response": lead.get("ai_response") or "",
+            }
+            for lead in leads if lead.get(key)
+        ]
+        changed = 0
+        for start in range(0, len(updates), self.batch_size):
+            changed += int(self._update_script(
+                keys=[self._key("leads", "comment_ids")],
+                args=[self.prefix, json.dumps(updates[start:start + self.batch_size])]
+            ))
+        return changed
+
+    def existing_comment_ids(self, comment_ids: Iterable[str]) -> Set[str]:
+        wanted = [comment_id for comment_id in set(comment_ids) if comment_id]
+        found: Set[str] = set()
+        for start in range(0, len(wanted), self.batch_size):
+            chunk = wanted[start:start + self.batch_size]
+            values = self._client.hmget(self._key("leads", "comment_ids"), chunk)
+            found.update(comment_id for comment_id, lead_id in zip(chunk, values) if lead_id is not None)
+        return found
+
+    def iter_comment_ids(self, chunk_size: int = 10000) -> Iterator[str]:
+        for comment_id, _ in self._client.hscan_iter(self._key("leads", "comment_ids"), count=chunk_size):
+            yield comment_id
+
+    def list_leads(
+        self,
+        limit: int = 100,
+        cursor: Optional[Tuple[str, int]] = None,
+        source: Optional[str] = None,
+        priority: Optional[str] = None,
+        post_id: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        page_ids: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        if page_ids is not None and len(page_ids) != 1:
+            return merge_newest((
+                self.list_leads(limit, cursor, source, priority, post_id, start, end, [page_id])
+                for page_id in page_ids
+            ), limit)
+        # Walk the most selective index; any other filter is checked per lead
+        filters = {"source": source, "priority": priority, "post_id": post_id}
+        if page_ids:
+            # Within a partition every other filter is residual
+            index, indexed = self._key("leads", "page", page_ids[0], "order"), None
+        elif post_id is not None:
+            index, indexed = self._key("leads", "post", post_id), "post_id"
+        elif priority is not None:
+            index, indexed = self._key("leads", "priority", priority), "priority"
+        elif source is not None:
+            index, indexed = self._key("leads", "source", source), "source"
+        else:
+            index, indexed = self._key("leads", "order"), None
+        residual = {field: value for field, value in filters.items() if value is not None and field != indexed}
+
+        # Members are "timestamp|id", so lex bounds give the same order and seek as the SQL keyset query
+        upper_bounds = []
+        if end is not None:
+            upper_bounds.append(end)
+        if cursor is not None:
+            upper_bounds.append(f"{cursor[0]}|{cursor[1]:020d}")
+        upper = "(" + min(upper_bounds) if upper_bounds else "+"
+        lower = "[" + start if start is not None else "-"
+        batch = limit if not residual else max(limit, self.batch_size)
+
+        rows: List[Dict[str, Any]] = []
+        while len(rows) < limit:
+            members = self._client.zrevrangebylex(index, upper, lower, start=0, num=batch)
+            if not members:
+                break
+            pipe = self._client.pipeline(transaction=False)
+            for member in members:
+                pipe.hgetall(self._key("lead", str(int(member.rsplit("|", 1)[1]))))
+            for member, data in zip(members, pipe.execute()):
+                if not data or any(data.get(field) != value for field, value in residual.items()):
+                    continue
+                rows.append(self._row(int(member.rsplit("|", 1)[1]), data))
+                if len(rows) >= limit:
+                    break
+            if len(members) < batch:
+                break
+            upper = "(" + members[-1]
+        return rows
+
+    def list_since(self, since_id: int, limit: int = 100, page_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        if page_ids is not None:
+            pipe = self._client.pipeline(transaction=False)
+            for page_id in page_ids:
+                pipe.zrangebyscore(self._key("leads", "page", page_id, "ids"), f"({since_id}", "+inf", start=0, num=limit)
+            lead_ids = sorted({int(lead_id) for members in pipe.execute() for lead_id in members})[:limit]
+        else:
+            lead_ids = list(range(since_id + 1, min(since_id + limit, self.last_id()) + 1))
+        if not lead_ids:
+            return []
+        pipe = self._client.pipeline(transaction=False)
+        for lead_id in lead_ids:
+            pipe.hgetall(self._key("lead", str(lead_id)))
+        return [self._row(lead_id, data) for lead_id, data in zip(lead_ids, pipe.execute()) if data]
+
+    def count(self) -> int:
+        return int(self._client.hget(self._key("leads", "agg"), "total") or 0)
+
+    def last_id(self) -> int:
+        # Ids are only allocated by successful inserts, so the counter is the highest id
+        return int(self._client.get(self._key("leads", "next_id")) or 0)
+
+    def aggregate_counts(self, page_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        bases = [("leads",)] if page_ids is None else [("leads", "page", page_id) for page_id in page_ids]
+        names = ("agg", "agg:source", "agg:priority", "agg:post", "agg:hour")
+        pipe = self._client.pipeline(transaction=False)
+        for base in bases:
+            for name in names:
+                pipe.hgetall(self._key(*base, name))
+        results = pipe.execute()
+        # Partition counters are summed; a single base is just copied
+        merged: Dict[str, Counter] = {name: Counter() for name in names}
+        for position, mapping in enumerate(results):
+            merged[names[position % len(names)]].update({key: int(value) for key, value in mapping.items()})
+
+        def counts(counter: Counter) -> Dict[str, int]:
+            return {key: value for key, value in counter.items() if value > 0}
+
+        return {
+            "total": merged["agg"]["total"],
+            "ai_responses": merged["agg"]["ai_responses"],
+            "by_source": counts(merged["agg:source"]),
+            "by_priority": counts(merged["agg:priority"]),
+            "by_post": counts(merged["agg:post"]),
+            "by_hour": counts(merged["agg:hour"]),
+        }
+
+    def import_csv(self, csv_path: str) -> int:
+        if not os.path.exists(csv_path):
+            return 0
+        marker = f"csv_imported:{os.path.abspath(csv_path)}"
+        # Claimed first: every process starts with the same CSV, only one may import it
+        if not self._client.hsetnx(self._key("leads", "meta"), marker, "importing"):
+            return 0
+        with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        self.add_many(rows)
+        self._client.hset(self._key("leads", "meta"), marker, str(len(rows)))
+        return len(rows)
+
+    def close(self):
+        self._client.close()
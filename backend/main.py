@@ -1,24 +1,68 @@
 from fastapi import FastAPI, Request, HTTPException, Query
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, List, Iterator, Tuple
 import os
-import csv
-import json
+import sys
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
 from dotenv import load_dotenv
-from groq import Groq
-import requests
+from lead_queue import LeadQueue, RedisLeadQueue, QueueFullError
+from lead_store import SQLiteLeadStore, RedisLeadStore, encode_cursor, decode_cursor
+from lead_events import LeadBroadcaster, follow_store, stream_leads
+from lead_export import EXPORT_MEDIA_TYPES, parquet_available, stream_export
+from lead_record import LeadRecord
+from fast_json import FastJSONResponse, loads
+from webhook_security import SIGNATURE_HEADER, PayloadTooLargeError, matching_secret, read_body
+from lead_stats import LeadStats
+from lead_profiles import LeadProfiles
+from classification_cache import ClassificationCache, RedisClassificationCache, normalize_comment
+from classifier import GroqClassifier
+from near_duplicates import NearDuplicateIndex
+from reclassify import Checkpoint, ReclassifyJob
+from preclassifier import IntentMatcher, load_lexicon
+from dedup import DedupIndex, RedisDedupIndex
+from ingest_log import IngestLog
+from structured_logging import configure_logging, new_request_id, request_id_var
+from metrics import MetricsRegistry, CONTENT_TYPE, by_label
+from reply_dispatcher import ReplyDispatcher, ReplyOutbox, DEFAULT_GRAPH_BASE_URL
+from redis_support import async_client, sync_client
+from tenants import Tenant, load_tenants
 
 # Load environment variables
 load_dotenv()
 
+# Structured logs through a non-blocking queue; webhook payloads only for a sampled share of requests
+log_config = configure_logging(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    json_format=os.getenv("LOG_FORMAT", "text").lower() == "json",
+    queue_size=int(os.getenv("LOG_QUEUE_SIZE", 10000)),
+    payload_sample_rate=float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", 1)),
+    payload_max_chars=int(os.getenv("LOG_PAYLOAD_MAX_CHARS", 2048))
+)
+logger = logging.getLogger("lead_agent")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs once per process: storage setup and workers, then draining on shutdown
+    await start_workers()
+    try:
+        yield
+    finally:
+        await drain_workers()
+
 app = FastAPI(
     title="Comment-to-Lead AI Agent",
     description="Backend service for converting social media comments to leads",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
+# starting -> ready -> draining (or failed); webhooks are only accepted while ready
+app.state.phase = "starting"
+app.state.startup_seconds = None
 
 # Add CORS middleware
 app.add_middleware(
@@ -29,239 +73,792 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Database file path
-LEADS_CSV_FILE = "leads_database.csv"
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    # Every log line of the request carries this id; echoed back for correlation
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
 
-# Initialize Groq client
-groq_client = None
-try:
-    groq_api_key = os.getenv("GROQ_API_KEY")
-    if groq_api_key and groq_api_key != "your_groq_api_key_here":
-        groq_client = Groq(api_key=groq_api_key)
-        print("Groq client initialized successfully")
-    else:
-        print("GROQ_API_KEY not set or still default value - using fallback mode")
-except Exception as e:
-    print(f"Failed to initialize Groq client: {e}")
+# Database file paths (the CSV is only read once, to import legacy leads)
+LEADS_DB_FILE = os.getenv("LEADS_DB_FILE", "leads.db")
+LEADS_CSV_FILE = os.getenv("LEADS_CSV_FILE", "leads_database.csv")
+
+# Shared state: "local" keeps the lead store in SQLite and the dedup index, cache and
+# work queue in this process; "redis" moves all four to Redis so any number of
+# worker processes and nodes can run side by side
+STATE_BACKEND = os.getenv("STATE_BACKEND", "local").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_PREFIX = os.getenv("REDIS_PREFIX", "lead_agent")
+# Worker processes per node (uvicorn reads the same variable)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+if STATE_BACKEND not in ("local", "redis"):
+    raise RuntimeError(f"Unknown STATE_BACKEND {STATE_BACKEND!r}, expected 'local' or 'redis'")
+if WEB_CONCURRENCY > 1 and STATE_BACKEND != "redis":
+    # The ingest log directory, dedup index and queue belong to a single process in local mode
+    raise RuntimeError("WEB_CONCURRENCY > 1 needs STATE_BACKEND=redis")
+redis_client = async_client(REDIS_URL) if STATE_BACKEND == "redis" else None
+lead_store = (
+    RedisLeadStore(sync_client(REDIS_URL), prefix=REDIS_PREFIX) if STATE_BACKEND == "redis"
+    else SQLiteLeadStore(LEADS_DB_FILE)
+)
+
+# Live lead feed for dashboards (Server-Sent Events)
+LEADS_STREAM_BACKLOG = int(os.getenv("LEADS_STREAM_BACKLOG", 500))
+
+# Bulk export: leads read from the store per page while streaming
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", 1000))
+lead_events = LeadBroadcaster()
+
+# Dashboard counters, maintained on write and rebuilt from the store at startup
+# (a shared store keeps its own counters, read per request)
+lead_stats = LeadStats()
+
+# Leads merged per user and per post with a decayed hot score; top-N kept on write, rebuilt at startup
+lead_profiles = LeadProfiles(
+    half_life_hours=float(os.getenv("LEAD_HOT_HALF_LIFE_HOURS", 24)),
+    top_n=int(os.getenv("LEAD_HOT_TOP_N", 100)),
+    max_profiles=int(os.getenv("LEAD_PROFILES_MAX", 100000))
+)
+
+# Cache of AI verdicts keyed on normalized comment text (optional SQLite or shared Redis tier)
+if STATE_BACKEND == "redis":
+    classification_cache = RedisClassificationCache(
+        redis_client,
+        prefix=REDIS_PREFIX,
+        max_entries=int(os.getenv("CLASSIFICATION_CACHE_SIZE", 10000)),
+        ttl_seconds=float(os.getenv("CLASSIFICATION_CACHE_TTL", 86400))
+    )
+else:
+    classification_cache = ClassificationCache(
+        max_entries=int(os.getenv("CLASSIFICATION_CACHE_SIZE", 10000)),
+        ttl_seconds=float(os.getenv("CLASSIFICATION_CACHE_TTL", 86400)),
+        persist_path=os.getenv("CLASSIFICATION_CACHE_DB") or None
+    )
+# Verdicts preloaded from the persistent tier at startup (0 = load lazily on first use)
+CLASSIFICATION_CACHE_WARMUP = int(os.getenv("CLASSIFICATION_CACHE_WARMUP", 0))
+
+# Local intent rules: confident comments skip the LLM entirely
+intent_matcher = IntentMatcher(
+    load_lexicon(os.getenv("INTENT_LEXICON_FILE") or None),
+    threshold=float(os.getenv("PRECLASSIFIER_THRESHOLD", 0.85))
+)
+
+# Async Groq classifier: pooled connections, capped concurrency, deadlines and retries
+classifier = GroqClassifier(
+    api_key=os.getenv("GROQ_API_KEY"),
+    model=os.getenv("GROQ_MODEL", "llama3-8b-8192"),
+    cache=classification_cache,
+    max_concurrency=int(os.getenv("GROQ_MAX_CONCURRENCY", 8)),
+    timeout=float(os.getenv("GROQ_TIMEOUT", 10)),
+    max_retries=int(os.getenv("GROQ_MAX_RETRIES", 3)),
+    retry_budget_ratio=float(os.getenv("GROQ_RETRY_BUDGET", 0.2)),
+    batch_size=int(os.getenv("GROQ_BATCH_SIZE", 10)),
+    batch_wait=float(os.getenv("GROQ_BATCH_WAIT_MS", 50)) / 1000,
+    matcher=intent_matcher,
+    rules_tier=os.getenv("PRECLASSIFIER_ENABLED", "true").lower() == "true",
+    base_url=os.getenv("GROQ_BASE_URL") or None,
+    # GROQ_MAX_CONCURRENCY is shared fairly between tenants, each optionally capped lower
+    tenant_concurrency=lambda tenant_id: tenants.get(tenant_id).llm_concurrency
+)
+if classifier.configured:
+    logger.info("Groq classifier configured")
+else:
+    logger.warning("GROQ_API_KEY not set - using fallback mode")
+
+# Near-duplicate clustering in front of the classifier: one verdict per cluster, spam bursts kept off the LLM
+NEAR_DUPLICATES_ENABLED = os.getenv("NEAR_DUPLICATES_ENABLED", "true").lower() == "true"
+near_duplicates = NearDuplicateIndex(
+    threshold=float(os.getenv("NEAR_DUPLICATE_THRESHOLD", 0.7)),
+    bands=int(os.getenv("NEAR_DUPLICATE_BANDS", 8)),
+    min_length=int(os.getenv("NEAR_DUPLICATE_MIN_LENGTH", 12)),
+    max_clusters=int(os.getenv("NEAR_DUPLICATE_MAX_CLUSTERS", 50000)),
+    burst_window=float(os.getenv("SPAM_BURST_WINDOW_SECONDS", 60)),
+    burst_threshold=int(os.getenv("SPAM_BURST_THRESHOLD", 20))
+)
+
+# Prometheus metrics served at /metrics
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram(
+    "lead_pipeline_stage_seconds",
+    "Time spent per pipeline stage (parse, extract, dedup, log, classify, store, reply)",
+    ["stage"]
+)
+WEBHOOK_DELIVERIES = metrics.counter("webhook_deliveries_total", "Webhook deliveries by outcome", ["status"])
+LEADS_RECEIVED = metrics.counter("leads_received_total", "Comments accepted from webhooks", ["source"])
+LEADS_STORED = metrics.counter("leads_stored_total", "Leads written to the store", ["source", "priority"])
+# The priority label comes from LLM output; anything outside these becomes "other" so series stay bounded
+PRIORITY_LABELS = {"high", "medium", "low"}
+
+def priority_label(priority: Any) -> str:
+    """Metric label for a stored lead's priority: high/medium/low, anything else counts as other"""
+    label = str(priority or "").strip().lower()
+    return label if label in PRIORITY_LABELS else "other"
+
+# Webhook redelivery guard keyed on the platform comment id
+if STATE_BACKEND == "redis":
+    dedup_index = RedisDedupIndex(
+        redis_client,
+        prefix=REDIS_PREFIX,
+        ttl_seconds=float(os.getenv("DEDUP_TTL_HOURS", 168)) * 3600
+    )
+else:
+    dedup_index = DedupIndex(
+        recent_size=int(os.getenv("DEDUP_RECENT_SIZE", 100000)),
+        bloom_capacity=int(os.getenv("DEDUP_BLOOM_CAPACITY", 1000000)),
+        bloom_error_rate=float(os.getenv("DEDUP_BLOOM_ERROR_RATE", 0.001))
+    )
 
 # Facebook Page Access Token
 PAGE_ACCESS_TOKEN = os.getenv("PAGE_ACCESS_TOKEN")
 
-# Lead model
-class Lead(BaseModel):
-    source: str  # "facebook" or "instagram"
-    user_id: str
-    comment_text: str
-    post_id: str
-    timestamp: str
-    priority: str = "Normal"
-    ai_response: str = ""
+# Webhook intake: Meta signs deliveries with the app secret; larger bodies are refused unread
+APP_SECRET = os.getenv("APP_SECRET") or None
+WEBHOOK_MAX_BYTES = int(os.getenv("WEBHOOK_MAX_BYTES", 1024 * 1024))
+
+def optional_env(name: str, cast: Callable[[str], Any]) -> Optional[Any]:
+    value = os.getenv(name)
+    return cast(value) if value else None
+
+# Tenants: the client pages this deployment serves, resolved from entry.id of each webhook entry.
+# Each brings its own tokens, prompt, lead partition and quotas; pages no tenant lists are
+# served by the default tenant built from the settings above, or dropped when strict
+tenants = load_tenants(
+    os.getenv("TENANTS_FILE") or None,
+    Tenant(
+        "default",
+        access_token=PAGE_ACCESS_TOKEN if PAGE_ACCESS_TOKEN != "your_page_access_token_here" else None,
+        verify_token=os.getenv("VERIFY_TOKEN"),
+        app_secret=APP_SECRET
+    ),
+    strict=os.getenv("TENANTS_STRICT", "false").lower() == "true",
+    # Quotas for tenants that do not set their own
+    quotas={
+        "llm_concurrency": optional_env("TENANT_LLM_CONCURRENCY", int),
+        "reply_concurrency": optional_env("TENANT_REPLY_CONCURRENCY", int),
+        "queue_share": optional_env("TENANT_QUEUE_SHARE", float),
+    }
+)
+
+# Outbound replies: persistent outbox drained by an async, per-page rate-limited dispatcher
+AUTO_REPLY_ENABLED = os.getenv("AUTO_REPLY_ENABLED", "false").lower() == "true"
+REPLY_STALE_SECONDS = float(os.getenv("REPLY_TIMEOUT", 10)) * 3
+reply_outbox = ReplyOutbox(os.getenv("REPLY_OUTBOX_DB", LEADS_DB_FILE))
+reply_dispatcher = ReplyDispatcher(
+    reply_outbox,
+    access_token=PAGE_ACCESS_TOKEN,
+    graph_base_url=os.getenv("GRAPH_API_BASE_URL", DEFAULT_GRAPH_BASE_URL),
+    max_concurrency=int(os.getenv("REPLY_MAX_CONCURRENCY", 8)),
+    # Every worker process keeps its own per-page buckets, so they split the page budget
+    page_rate=float(os.getenv("REPLY_PAGE_RATE", 5)) / WEB_CONCURRENCY,
+    page_burst=float(os.getenv("REPLY_PAGE_BURST", 10)),
+    timeout=float(os.getenv("REPLY_TIMEOUT", 10)),
+    max_attempts=int(os.getenv("REPLY_MAX_ATTEMPTS", 6)),
+    usage_threshold=float(os.getenv("REPLY_USAGE_THRESHOLD", 90)),
+    observe=lambda outcome, seconds: STAGE_SECONDS.observe(seconds, stage="reply"),
+    # Sibling processes share the outbox; requeue replies one of them abandoned mid-send
+    requeue_after=REPLY_STALE_SECONDS if WEB_CONCURRENCY > 1 else None,
+    # Per-page tokens and per-tenant caps on replies in flight
+    tenants=tenants
+)
+
+# Write-ahead log: deliveries are durable before they are acknowledged, replayed after a crash
+# (with STATE_BACKEND=redis the Redis stream is the durable queue instead)
+ingest_log = IngestLog(
+    os.getenv("INGEST_LOG_DIR", "ingest_log"),
+    segment_bytes=int(float(os.getenv("INGEST_LOG_SEGMENT_MB", 64)) * 1024 * 1024),
+    flush_interval=float(os.getenv("INGEST_LOG_FLUSH_MS", 5)) / 1000,
+    retention_seconds=float(os.getenv("INGEST_LOG_RETENTION_HOURS", 168)) * 3600,
+    fsync=os.getenv("INGEST_LOG_FSYNC", "true").lower() == "true"
+) if STATE_BACKEND == "local" else None
+
+# Webhook work queue configuration
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 4))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", 30))
+
+def partition(tenant_id: Optional[str]) -> Optional[List[str]]:
+    """Page ids of a tenant's leads, None (every lead) without a tenant"""
+    if tenant_id is None:
+        return None
+    if tenant_id not in tenants.tenants:
+        raise HTTPException(status_code=404, detail=f"Unknown tenant {tenant_id!r}")
+    return list(tenants.tenants[tenant_id].page_ids)
 
 def init_leads_database():
-    """Initialize the leads CSV file with headers if it doesn't exist"""
-    if not os.path.exists(LEADS_CSV_FILE):
-        with open(LEADS_CSV_FILE, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(['timestamp', 'source', 'user_id', 'comment_text', 'post_id', 'priority', 'ai_response'])
-
-def save_lead_to_csv(lead: Lead):
-    """Save a lead to the CSV database"""
-    with open(LEADS_CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            lead.timestamp,
-            lead.source,
-            lead.user_id,
-            lead.comment_text,
-            lead.post_id,
-            lead.priority,
-            lead.ai_response
-        ])
-    print(f"Lead saved: {lead.source} | {lead.user_id} | {lead.priority}")
-    print(f"AI Response: {lead.ai_response}")
-
-def send_facebook_reply(comment_id: str, message: str):
-    """
-    Send a reply to a Facebook comment using the Page Access Token
-    """
-    if not PAGE_ACCESS_TOKEN or PAGE_ACCESS_TOKEN == "your_page_access_token_here":
-        print("Facebook Page Access Token not configured - skipping reply")
-        return False
-    
+    """Create the lead store schema and open the cache's persistent tier; cheap and idempotent"""
+    lead_store.init()
+    classification_cache.init()
+
+def load_startup_state() -> int:
+    """
+    Slow one-time startup work: import the legacy CSV, rebuild stats, seed the dedup index, warm the cache
+    Returns the store's last id, which the profile rebuild and follow_store split the leads at
+    """
+    imported = lead_store.import_csv(LEADS_CSV_FILE)
+    if imported:
+        logger.info("Imported legacy CSV leads", extra={"count": imported, "path": LEADS_CSV_FILE})
+    if not lead_store.shared:
+        # Tenant pages get their own counters, so tenant keys read stats without a store scan
+        tenant_pages = {page_id for tenant in tenants.tenants.values() for page_id in tenant.page_ids}
+        lead_stats.load(
+            lead_store.aggregate_counts(),
+            pages={page_id: lead_store.aggregate_counts([page_id]) for page_id in tenant_pages}
+        )
+    # Profiles are rebuilt up to here in the background; in shared mode follow_store picks up from there
+    last_id = lead_store.last_id()
+    dedup_index.seed(lead_store.iter_comment_ids())
+    classification_cache.purge_expired()
+    warmed = classification_cache.warm(CLASSIFICATION_CACHE_WARMUP)
+    if warmed:
+        logger.info("Warmed the classification cache", extra={"entries": warmed})
+    return last_id
+
+async def rebuild_profiles(through_id: int):
+    """Rebuild the hot-lead profiles from the store without holding up readiness; /leads/hot answers 503 meanwhile"""
+    started = time.perf_counter()
     try:
-        url = f"https://graph.facebook.com/v18.0/{comment_id}/comments"
-        params = {
-            "message": message,
-            "access_token": PAGE_ACCESS_TOKEN
-        }
-        
-        response = requests.post(url, params=params)
-        
-        if response.status_code == 200:
-            print(f"Facebook reply sent successfully to comment {comment_id}")
-            return True
-        else:
-            print(f"Failed to send Facebook reply: {response.status_code} - {response.text}")
-            return False
-            
-    except Exception as e:
-        print(f"Error sending Facebook reply: {e}")
+        fresh = await asyncio.to_thread(lead_profiles.rebuilt, lead_store.iter_pages(through_id))
+    except Exception:
+        logger.exception("Rebuilding lead profiles failed")
+        return
+    # Leads stored during the rebuild were buffered and are applied on top
+    lead_profiles.adopt(fresh)
+    logger.info("Lead profiles loaded", extra={"seconds": round(time.perf_counter() - started, 3), "last_id": lead_profiles.last_id})
+
+def save_leads(leads: List[LeadRecord]) -> List[Dict[str, Any]]:
+    """Save a batch of leads to the lead store in one transaction, returns the newly stored rows"""
+    rows = [lead.to_dict() for lead in leads]
+    stored = []
+    for row, lead_id in zip(rows, lead_store.add_many(rows)):
+        if lead_id is None:
+            # Comment already stored by an earlier delivery
+            continue
+        row["id"] = lead_id
+        stored.append(row)
+        logger.debug("Lead saved", extra={
+            "lead_id": lead_id,
+            "source": row["source"],
+            "user_id": row["user_id"],
+            "priority": row["priority"],
+            "ai_response": row["ai_response"]
+        })
+    logger.info("Leads saved", extra={"stored": len(stored), "skipped": len(rows) - len(stored)})
+    return stored
+
+async def send_facebook_reply(comment_id: str, message: str, page_id: str = "") -> bool:
+    """
+    Send a reply to a Facebook comment right away, outside the outbox
+    Uses the access token of the tenant owning `page_id`
+    """
+    if not reply_dispatcher.configured:
+        logger.warning("Facebook Page Access Token not configured - skipping reply")
         return False
+    return await reply_dispatcher.send_now("facebook", comment_id, message, page_id)
 
-def analyze_comment_with_groq(comment_text: str) -> Dict[str, Any]:
+async def analyze_comment_with_groq(
+    comment_text: str, refresh: bool = False, count: int = 1, tenant: Optional[Tenant] = None
+) -> Dict[str, Any]:
     """
     Analyze comment using Groq API
+    Near-duplicates of an already clustered comment share its verdict;
+    `count` identical copies of the comment arrived in the same batch
+    The call counts against `tenant`'s LLM share and uses its prompt, if it has one
     Returns: {'ai_response_text': str, 'priority_score': str}
     """
-    if not groq_client:
-        # Fallback to placeholder if Groq not available
-        text_lower = comment_text.lower()
-        if any(word in text_lower for word in ["price", "cost", "how much", "info", "information", "details", "contact"]):
-            return {
-                "ai_response_text": "Thanks for your interest! Check your DMs for a special offer with pricing details.",
-                "priority_score": "High"
-            }
-        else:
-            return {
-                "ai_response_text": "Thank you for your comment! We'll get back to you soon.",
-                "priority_score": "Normal"
-            }
-    
-    try:
-        system_prompt = """You are a professional Sales Assistant. Analyze this comment and provide:
-        1. A short, helpful response (max 20 words) if the user is asking about price, location, or availability
-        2. Suggest they check their DMs for a special offer
-        3. Categorize as 'High', 'Medium', or 'Low' priority
-        
-        Format your response as JSON:
-        {
-            "ai_response_text": "your response here",
-            "priority_score": "High/Medium/Low"
-        }"""
-        
-        response = groq_client.chat.completions.create(
-            model="llama3-8b-8192",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Comment: {comment_text}"}
-            ],
-            temperature=0.7,
-            max_tokens=150
+    tenant = tenant or tenants.default
+    def classify(allow_llm: bool):
+        return classifier.classify_with_tier(
+            comment_text, refresh=refresh, allow_llm=allow_llm, tenant=tenant.id, prompt=tenant.prompt
         )
-        
-        # Parse the response
-        result_text = response.choices[0].message.content.strip()
-        
-        # Try to extract JSON from the response
-        try:
-            # Clean up the response if it has markdown code blocks
-            result_text = result_text.replace("```json", "").replace("```", "").strip()
-            result_data = json.loads(result_text)
-            
-            return {
-                "ai_response_text": result_data.get("ai_response_text", "Thank you for your interest!"),
-                "priority_score": result_data.get("priority_score", "Normal")
-            }
-        except:
-            # If JSON parsing fails, use simple logic
-            text_lower = comment_text.lower()
-            if any(word in text_lower for word in ["price", "cost", "how much", "info", "information", "details", "contact"]):
-                return {
-                    "ai_response_text": "Thanks for your interest! Check your DMs for a special offer with pricing details.",
-                    "priority_score": "High"
-                }
-            else:
-                return {
-                    "ai_response_text": "Thank you for your comment! We'll get back to you soon.",
-                    "priority_score": "Normal"
-                }
+    if NEAR_DUPLICATES_ENABLED:
+        ai_result, tier = await near_duplicates.classify(comment_text, classify, refresh, count, scope=tenant.scope)
+    else:
+        ai_result, tier = await classify(True)
+    logger.debug("Comment classified", extra={"tier": tier, "priority": ai_result["priority_score"]})
+    return ai_result
+
+def written_by_page(page_id: str, user_id: str) -> bool:
+    """Whether a comment came from the page itself or another page of its tenant; our own replies come back as webhooks"""
+    return user_id == page_id or user_id in tenants.resolve(page_id).page_ids
+
+def extract_facebook_comments(data: Dict[str, Any]) -> Iterator[LeadRecord]:
+    """Yield every new visitor comment in a (possibly batched) Facebook Page webhook delivery"""
+    if data.get("object") != "page":
+        return
+    
+    # Facebook webhook structure: many entries/changes per delivery under load
+    for entry in data.get("entry", []):
+        for change in entry.get("changes", []):
+            try:
+                if change.get("field") != "feed":
+                    continue
+                value = change.get("value", {})
+                # Only new comments; posts, edits and removals are not leads
+                if value.get("item") != "comment" or value.get("verb") != "add":
+                    continue
                 
-    except Exception as e:
-        print(f"Groq API error: {e}")
-        # Fallback
-        text_lower = comment_text.lower()
-        if any(word in text_lower for word in ["price", "cost", "how much", "info", "information", "details", "contact"]):
-            return {
-                "ai_response_text": "Thanks for your interest! Check your DMs for a special offer with pricing details.",
-                "priority_score": "High"
-            }
-        else:
-            return {
-                "ai_response_text": "Thank you for your comment! We'll get back to you soon.",
-                "priority_score": "Normal"
-            }
+                # Extract data
+                user_id = value.get("from", {}).get("id", "")
+                comment_text = value.get("message", "")
+                post_id = value.get("post_id", "")
+                comment_id = value.get("comment_id", "")
+                
+                if comment_text and user_id and not written_by_page(entry.get("id", ""), user_id):
+                    yield LeadRecord(
+                        source="facebook",
+                        page_id=entry.get("id", ""),
+                        user_id=user_id,
+                        comment_text=comment_text,
+                        post_id=post_id,
+                        comment_id=comment_id,
+                        timestamp=datetime.now().isoformat()
+                    )
+            except Exception as e:
+                # Skip only the malformed change, keep the rest of the batch
+                logger.warning("Error extracting Facebook comment", extra={"error": str(e)})
+
+def extract_instagram_comments(data: Dict[str, Any]) -> Iterator[LeadRecord]:
+    """Yield every visitor comment in a (possibly batched) Instagram webhook delivery"""
+    if data.get("object") != "instagram":
+        return
+    
+    # Instagram webhook structure
+    for entry in data.get("entry", []):
+        for change in entry.get("changes", []):
+            try:
+                if change.get("field") != "comments":
+                    continue
+                value = change.get("value", {})
+                
+                # Extract data
+                user_id = value.get("from", {}).get("id", "")
+                comment_text = value.get("text", "")
+                post_id = value.get("media", {}).get("id", "")
+                comment_id = value.get("id", "")
+                
+                if comment_text and user_id and not written_by_page(entry.get("id", ""), user_id):
+                    yield LeadRecord(
+                        source="instagram",
+                        page_id=entry.get("id", ""),
+                        user_id=user_id,
+                        comment_text=comment_text,
+                        post_id=post_id,
+                        comment_id=comment_id,
+                        timestamp=datetime.now().isoformat()
+                    )
+            except Exception as e:
+                logger.warning("Error extracting Instagram comment", extra={"error": str(e)})
+
+def extract_leads(data: Dict[str, Any]) -> Iterator[LeadRecord]:
+    """Stream all leads from a webhook delivery, whatever the source"""
+    yield from extract_facebook_comments(data)
+    yield from extract_instagram_comments(data)
+
+def routable(lead: LeadRecord, signed_with: Optional[str]) -> bool:
+    """
+    Whether a lead's page is served here and the delivery was signed by its tenant's app
+    """
+    if tenants.strict and not tenants.known(lead.page_id):
+        return False
+    secret = tenants.resolve(lead.page_id).app_secret or tenants.default.app_secret
+    return secret is None or secret == signed_with
+
+async def classify_leads(leads: List[LeadRecord], refresh: bool = False):
+    """Classify a batch in one grouped pass: each distinct normalized comment of a tenant is analyzed once"""
+    groups: Dict[Tuple[str, str], List[LeadRecord]] = {}
+    for lead in leads:
+        groups.setdefault((tenants.resolve(lead.page_id).id, normalize_comment(lead.comment_text)), []).append(lead)
+    
+    # Concurrency against Groq is capped and shared between tenants inside the classifier
+    results = await asyncio.gather(*(
+        analyze_comment_with_groq(members[0].comment_text, refresh, len(members), tenants.get(tenant_id))
+        for (tenant_id, _), members in groups.items()
+    ))
+    for members, ai_result in zip(groups.values(), results):
+        for lead in members:
+            lead.priority = ai_result["priority_score"]
+            lead.ai_response = ai_result["ai_response_text"]
+
+async def enqueue_replies(stored: List[Dict[str, Any]]):
+    """Queue the AI reply for every newly stored comment; the dispatcher sends them in the background"""
+    if not AUTO_REPLY_ENABLED or not reply_dispatcher.configured:
+        return
+    replies = [
+        {
+            "source": row["source"],
+            "page_id": row["page_id"],
+            "comment_id": row["comment_id"],
+            "message": row["ai_response"]
+        }
+        for row in stored
+        if row["comment_id"] and row["ai_response"].strip()
+    ]
+    await reply_dispatcher.enqueue(replies)
 
-def extract_facebook_comment(data: Dict[str, Any]) -> Optional[Lead]:
-    """Extract comment from Facebook Page webhook structure"""
+async def process_leads(job: Tuple[List[LeadRecord], str]):
+    """Worker job: analyze one webhook delivery's leads with AI and save them together"""
+    leads, request_id = job
+    # Workers outlive requests, so restore the delivery's request id for every log line below
+    request_id_var.set(request_id)
     try:
-        if data.get("object") != "page":
-            return None
-        
-        # Facebook webhook structure
-        for entry in data.get("entry", []):
-            for change in entry.get("changes", []):
-                if change.get("field") == "feed":
-                    value = change.get("value", {})
-                    
-                    # Extract data
-                    user_id = value.get("from", {}).get("id", "")
-                    comment_text = value.get("message", "")
-                    post_id = value.get("post_id", "")
-                    
-                    if comment_text and user_id:
-                        return Lead(
-                            source="facebook",
-                            user_id=user_id,
-                            comment_text=comment_text,
-                            post_id=post_id,
-                            timestamp=datetime.now().isoformat()
-                        )
-    except Exception as e:
-        print(f"Error extracting Facebook comment: {e}")
+        with STAGE_SECONDS.time(stage="classify"):
+            await classify_leads(leads)
+        with STAGE_SECONDS.time(stage="store"):
+            stored = await asyncio.to_thread(save_leads, leads)
+    except Exception:
+        # Nothing was committed, so let a redelivery of these comments through
+        dedup_index.forget(lead.comment_id for lead in leads)
+        raise
+    # Count and push to connected dashboards only after the batch is committed
+    lead_stats.record(stored)
+    for row in stored:
+        LEADS_STORED.inc(source=row["source"], priority=priority_label(row["priority"]))
+    if not lead_store.shared:
+        # A shared store is followed by every process instead, see follow_store
+        lead_profiles.record(stored)
+        lead_events.publish(stored)
+    await enqueue_replies(stored)
+
+def decode_delivery(record: Dict[str, Any]) -> Tuple[List[LeadRecord], str]:
+    """Rebuild a worker job from its logged or queued record"""
+    return [LeadRecord.from_dict(lead) for lead in record["leads"]], record.get("request_id", "")
+
+async def recover_deliveries():
+    """Requeue deliveries that were logged but not fully processed before the last shutdown"""
+    recovered = await lead_queue.recover()
+    if recovered:
+        logger.info("Recovered unprocessed deliveries from the ingest log", extra={"count": recovered})
+
+async def replay_ingest_log(start: Optional[float], end: Optional[float], dry_run: bool = False) -> Dict[str, int]:
+    """Reclassify logged deliveries in [start, end) with fresh verdicts and write them back to the store"""
+    init_leads_database()
+    totals = {"deliveries": 0, "leads": 0, "inserted": 0, "updated": 0, "skipped": 0}
+    
+    async def replay(record: Dict[str, Any]):
+        leads = [LeadRecord.from_dict(lead) for lead in record["leads"]]
+        # Bypass cached verdicts, the point of a replay is usually a new prompt or model
+        await classify_leads(leads, refresh=True)
+        totals["deliveries"] += 1
+        totals["leads"] += len(leads)
+        if dry_run:
+            return
+        # Only comment ids are unique in the store; a lead without one would be inserted again on every replay
+        rows = [lead.to_dict() for lead in leads if lead.comment_id]
+        totals["skipped"] += len(leads) - len(rows)
+        inserted = await asyncio.to_thread(lead_store.add_many, rows)
+        updated = await asyncio.to_thread(lead_store.update_classifications, rows)
+        totals["inserted"] += sum(1 for lead_id in inserted if lead_id is not None)
+        totals["updated"] += updated
     
-    return None
+    chunk: List[Dict[str, Any]] = []
+    for _, _, record in ingest_log.read(start=start, end=end):
+        chunk.append(record)
+        if len(chunk) >= WEBHOOK_WORKERS * 8:
+            await asyncio.gather(*(replay(item) for item in chunk))
+            chunk = []
+    await asyncio.gather(*(replay(item) for item in chunk))
+    
+    await classifier.close()
+    lead_store.close()
+    return totals
+
+def run_replay_command(argv: List[str]):
+    """`python main.py replay --start ISO --end ISO [--dry-run]`"""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog=f"{os.path.basename(sys.argv[0])} replay",
+        description="Reprocess logged webhook deliveries in a time range (e.g. after changing the prompt)"
+    )
+    parser.add_argument("--start", help="ISO timestamp, inclusive (default: oldest retained delivery)")
+    parser.add_argument("--end", help="ISO timestamp, exclusive (default: now)")
+    parser.add_argument("--dry-run", action="store_true", help="Classify but do not write to the lead store")
+    args = parser.parse_args(argv)
+    if ingest_log is None:
+        parser.error("replay reads the local ingest log, which is not used with STATE_BACKEND=redis")
+    if not os.path.isdir(ingest_log.directory):
+        print(f"Nothing to replay: no ingest log at {ingest_log.directory}")
+        return
+    start = datetime.fromisoformat(args.start).timestamp() if args.start else None
+    end = datetime.fromisoformat(args.end).timestamp() if args.end else None
+    totals = asyncio.run(replay_ingest_log(start, end, dry_run=args.dry_run))
+    print(
+        f"Replayed {totals['deliveries']} deliveries ({totals['leads']} leads): "
+        f"{totals['inserted']} inserted, {totals['updated']} reclassified, "
+        f"{totals['skipped']} skipped without a comment id"
+        + (" [dry run]" if args.dry_run else "")
+    )
 
-def extract_instagram_comment(data: Dict[str, Any]) -> Optional[Lead]:
-    """Extract comment from Instagram webhook structure"""
+async def reclassify_comment(row: Dict[str, Any], count: int) -> Tuple[Dict[str, Any], str]:
+    """Fresh verdict for the reclassify job; near-duplicates still share one (clusters only hold this run's verdicts)"""
+    tenant = tenants.resolve(row["page_id"])
+    def classify(allow_llm: bool):
+        # Persisted cache entries may predate the prompt or model change
+        return classifier.classify_with_tier(
+            row["comment_text"], refresh=True, allow_llm=allow_llm, tenant=tenant.id, prompt=tenant.prompt
+        )
+    if NEAR_DUPLICATES_ENABLED:
+        return await near_duplicates.classify(row["comment_text"], classify, count=count, scope=tenant.scope)
+    return await classify(True)
+
+async def reclassify_store(args) -> Dict[str, Any]:
+    """Re-run classification over stored leads and write changed verdicts back in bulk"""
+    init_leads_database()
+    
+    def print_progress(report: Dict[str, Any]):
+        eta = f"{report['eta_seconds'] / 60:.1f} min" if report["eta_seconds"] is not None else "unknown"
+        print(
+            f"  id {report['last_id']}/{report['through_id']}: {report.get('scanned', 0)} scanned, "
+            f"{report.get('changed', 0)} changed, {report['leads_per_second']} leads/s, ETA {eta}",
+            flush=True
+        )
+    
+    job = ReclassifyJob(
+        lead_store,
+        reclassify_comment,
+        checkpoint=Checkpoint(args.checkpoint),
+        chunk_size=args.chunk_size,
+        parallel_chunks=args.parallel_chunks,
+        dry_run=args.dry_run,
+        progress=print_progress,
+        # Tenants with their own prompt never share verdicts with others
+        scope=lambda row: tenants.resolve(row["page_id"]).scope
+    )
     try:
-        if data.get("object") != "instagram":
-            return None
-        
-        # Instagram webhook structure
-        for entry in data.get("entry", []):
-            for change in entry.get("changes", []):
-                if change.get("field") == "comments":
-                    value = change.get("value", {})
-                    
-                    # Extract data
-                    user_id = value.get("from", {}).get("id", "")
-                    comment_text = value.get("text", "")
-                    post_id = value.get("media", {}).get("id", "")
-                    
-                    if comment_text and user_id:
-                        return Lead(
-                            source="instagram",
-                            user_id=user_id,
-                            comment_text=comment_text,
-                            post_id=post_id,
-                            timestamp=datetime.now().isoformat()
-                        )
-    except Exception as e:
-        print(f"Error extracting Instagram comment: {e}")
+        return await job.run(from_id=args.from_id, to_id=args.to_id, limit=args.limit, resume=args.resume)
+    finally:
+        await classifier.close()
+        lead_store.close()
+
+def run_reclassify_command(argv: List[str]):
+    """`python main.py reclassify [--dry-run] [--resume] [--limit N] ...`"""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog=f"{os.path.basename(sys.argv[0])} reclassify",
+        description="Re-classify stored leads with the current prompt and model, writing changed verdicts back"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Classify and report, write nothing (not even a checkpoint)")
+    parser.add_argument("--resume", action="store_true", help="Continue from the checkpoint of an interrupted run")
+    parser.add_argument("--checkpoint", default=os.getenv("RECLASSIFY_CHECKPOINT", "reclassify.checkpoint.json"))
+    parser.add_argument("--limit", type=int, help="Stop after this many leads (with --dry-run: a throughput sample)")
+    parser.add_argument("--from-id", type=int, default=0, help="Start after this lead id")
+    parser.add_argument("--to-id", type=int, help="Stop at this lead id (default: the last id when the job starts)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Leads read and written per chunk")
+    parser.add_argument("--parallel-chunks", type=int, default=4, help="Chunks classified at the same time")
+    args = parser.parse_args(argv)
+    if not classifier.configured:
+        parser.error("GROQ_API_KEY is not set, there is no LLM to re-classify with")
     
-    return None
+    try:
+        report = asyncio.run(reclassify_store(args))
+    except KeyboardInterrupt:
+        # Every committed chunk is in the checkpoint already
+        print(f"Interrupted, continue with: reclassify --resume --checkpoint {args.checkpoint}")
+        sys.exit(130)
+    print(
+        f"Reclassified {report.get('scanned', 0)} leads through id {report['last_id']}: "
+        f"{report.get('changed', 0)} changed, {report.get('updated', 0)} written, "
+        f"{report.get('fallbacks', 0)} left as they were (LLM unavailable or throttled)"
+        + (" [dry run]" if args.dry_run else "")
+    )
+    print(
+        f"{report.get('classified', 0)} distinct comments classified, {report.get('memo_hits', 0)} reused; "
+        f"{classifier.requests} Groq requests, {near_duplicates.reused + near_duplicates.coalesced} near-duplicate verdicts"
+    )
+    if report["transitions"]:
+        print("Priority changes: " + ", ".join(f"{key} {count}" for key, count in report["transitions"].items()))
+    if report["leads_per_second"]:
+        total = lead_store.count()
+        print(
+            f"Throughput {report['leads_per_second']} leads/s in {report['elapsed_seconds']} s; "
+            f"the whole store ({total} leads) would take about {total / report['leads_per_second'] / 60:.1f} min"
+        )
+
+if STATE_BACKEND == "redis":
+    # One Redis stream shared by every process and node; WEBHOOK_QUEUE_SIZE caps the cluster-wide backlog
+    lead_queue = RedisLeadQueue(
+        process_leads,
+        redis_client,
+        decode_delivery,
+        prefix=REDIS_PREFIX,
+        max_size=WEBHOOK_QUEUE_SIZE,
+        worker_count=WEBHOOK_WORKERS,
+        drain_timeout=WEBHOOK_DRAIN_TIMEOUT,
+        claim_idle=float(os.getenv("QUEUE_CLAIM_IDLE", 120)),
+        max_deliveries=int(os.getenv("QUEUE_MAX_DELIVERIES", 5))
+    )
+else:
+    lead_queue = LeadQueue(
+        process_leads,
+        max_size=WEBHOOK_QUEUE_SIZE,
+        worker_count=WEBHOOK_WORKERS,
+        drain_timeout=WEBHOOK_DRAIN_TIMEOUT,
+        log=ingest_log,
+        decode=decode_delivery,
+        # A delivery failing this often is dead-lettered (ingest_log/dead_letter.ndjson) and committed
+        max_attempts=int(os.getenv("QUEUE_MAX_DELIVERIES", 5)),
+        # One lane per tenant, served round robin, so a viral page's backlog does not delay the others
+        lane=lambda job: tenants.resolve(job[0][0].page_id).id,
+        lane_max_size=lambda tenant_id: tenants.get(tenant_id).queue_limit(WEBHOOK_QUEUE_SIZE)
+    )
+
+# Values owned by other components are read at scrape time
+metrics.gauge_callback(
+    "lead_profiles", "Merged lead profiles held in memory",
+    lambda: by_label({kind: len(index.profiles) for kind, index in lead_profiles.indexes.items()}), ["kind"]
+)
+metrics.gauge_callback("lead_queue_depth", "Deliveries waiting for a worker", lambda: {(): lead_queue.stats()["depth"]})
+metrics.gauge_callback("lead_queue_in_flight", "Deliveries being processed", lambda: {(): lead_queue.in_flight})
+metrics.counter_callback("lead_queue_rejected_total", "Deliveries refused with 503 (backpressure)", lambda: {(): lead_queue.rejected})
+metrics.counter_callback("lead_queue_failed_total", "Deliveries whose processing raised", lambda: {(): lead_queue.failed})
+metrics.gauge_callback(
+    "startup_seconds", "Seconds from lifespan start until the app was ready",
+    lambda: {(): app.state.startup_seconds} if app.state.startup_seconds is not None else {}
+)
+metrics.gauge_callback(
+    "ingest_log_uncommitted", "Logged deliveries not yet fully processed",
+    lambda: {(): ingest_log.stats()["uncommitted"]} if ingest_log is not None else {}
+)
+metrics.counter_callback("dedup_duplicates_total", "Redelivered comments dropped", lambda: {(): dedup_index.duplicates})
+metrics.counter_callback(
+    "classifier_verdicts_total", "Classification verdicts by tier", lambda: by_label(classifier.tiers), ["tier"]
+)
+metrics.counter_callback(
+    "classifier_fallbacks_total", "Keyword fallbacks by reason", lambda: by_label(classifier.fallbacks), ["reason"]
+)
+metrics.gauge_callback("near_duplicate_clusters", "Comment clusters held by the near-duplicate index", lambda: {(): near_duplicates.stats()["clusters"]})
+metrics.counter_callback(
+    "near_duplicate_verdicts_total", "Comments answered through a near-duplicate cluster, by outcome",
+    lambda: {("reused",): near_duplicates.reused, ("coalesced",): near_duplicates.coalesced, ("throttled",): near_duplicates.throttled},
+    ["outcome"]
+)
+metrics.counter_callback("spam_bursts_total", "Near-duplicate clusters that crossed the spam burst threshold", lambda: {(): near_duplicates.bursts})
+metrics.counter_callback("groq_requests_total", "Groq API calls, including retries", lambda: {(): classifier.requests})
+metrics.counter_callback("groq_retries_total", "Groq API retries", lambda: {(): classifier.retries})
+metrics.counter_callback("groq_rate_limited_total", "Groq 429 responses", lambda: {(): classifier.rate_limited})
+metrics.counter_callback("groq_tokens_total", "LLM tokens used", lambda: by_label(classifier.tokens), ["kind"])
+metrics.counter_callback("classification_cache_hits_total", "Classification cache hits", lambda: {(): classification_cache.hits + classification_cache.persistent_hits})
+metrics.counter_callback("classification_cache_misses_total", "Classification cache misses", lambda: {(): classification_cache.misses})
+metrics.gauge_callback(
+    "reply_outbox_replies", "Replies in the outbox by status", lambda: by_label(reply_outbox.counts()), ["status"]
+)
+metrics.counter_callback("replies_sent_total", "Replies posted to the Graph API", lambda: {(): reply_dispatcher.sent})
+metrics.counter_callback("replies_failed_total", "Replies given up on", lambda: {(): reply_dispatcher.failed})
+metrics.counter_callback("log_records_dropped_total", "Log records dropped because the log queue was full", lambda: {(): log_config.dropped})
+metrics.counter_callback("replies_rate_limited_total", "Graph throttling responses", lambda: {(): reply_dispatcher.rate_limited})
+metrics.gauge_callback(
+    "tenant_queue_depth", "Deliveries waiting for a worker, by tenant",
+    lambda: by_label(lead_queue.stats().get("lanes")), ["tenant"]
+)
+metrics.counter_callback(
+    "tenant_queue_rejected_total", "Deliveries refused because the tenant's queue share was full",
+    lambda: by_label(getattr(lead_queue, "lane_rejected", None)), ["tenant"]
+)
+metrics.gauge_callback(
+    "tenant_llm_in_flight", "Groq calls in flight, by tenant",
+    lambda: by_label({key: usage["in_use"] for key, usage in classifier.limiter.stats()["tenants"].items()}), ["tenant"]
+)
+metrics.gauge_callback(
+    "tenant_llm_waiting", "Groq calls waiting for a fair-share slot, by tenant",
+    lambda: by_label({key: usage["waiting"] for key, usage in classifier.limiter.stats()["tenants"].items()}), ["tenant"]
+)
+metrics.gauge_callback(
+    "tenant_replies_in_flight", "Replies being sent, by tenant", lambda: by_label(reply_dispatcher.tenant_in_flight), ["tenant"]
+)
+
+async def start_workers():
+    """Lifespan startup: only what every request needs, so the process answers /healthz right away"""
+    if not tenants.app_secrets():
+        logger.warning("APP_SECRET is not set, webhook signatures are not verified")
+    if tenants.configured:
+        logger.info("Tenants loaded", extra={"tenants": len(tenants.tenants), "strict": tenants.strict})
+    app.state.started_at = time.perf_counter()
+    await asyncio.to_thread(init_leads_database)
+    # Sibling processes may be mid-send right now; only their stale claims are requeued
+    requeued = reply_outbox.init(stale_after=REPLY_STALE_SECONDS if WEB_CONCURRENCY > 1 else 0.0)
+    if requeued:
+        logger.info("Requeued replies interrupted by the last shutdown", extra={"count": requeued})
+    # Keep a reference so the task is not garbage collected
+    app.state.warmup_task = asyncio.create_task(warm_up())
+
+async def warm_up():
+    """Scans that grow with the data set, then the workers; /readyz turns 200 once this finishes"""
+    try:
+        # Live leads are buffered for the profiles until their rebuild is adopted
+        lead_profiles.start_rebuild()
+        last_id = await asyncio.to_thread(load_startup_state)
+        # Also opens the ingest log in local mode
+        await lead_queue.start()
+        await reply_dispatcher.start()
+        if lead_store.shared:
+            async def load_since(since_id: int) -> List[Dict[str, Any]]:
+                return await asyncio.to_thread(lead_store.list_since, since_id, LEADS_STREAM_BACKLOG)
+            app.state.follow_task = asyncio.create_task(
+                follow_store(lead_events, load_since, last_id, record=lead_profiles.record)
+            )
+        app.state.profiles_task = asyncio.create_task(rebuild_profiles(last_id))
+        app.state.recovery_task = asyncio.create_task(recover_deliveries())
+    except Exception:
+        app.state.phase = "failed"
+        logger.exception("Startup failed")
+        return
+    app.state.startup_seconds = round(time.perf_counter() - app.state.started_at, 3)
+    app.state.phase = "ready"
+    logger.info("Ready", extra={"startup_seconds": app.state.startup_seconds})
 
-# Root route
-@app.get("/")
-async def root():
+async def drain_workers():
+    """Lifespan shutdown"""
+    app.state.phase = "draining"
+    if not app.state.warmup_task.done():
+        app.state.warmup_task.cancel()
+        await asyncio.gather(app.state.warmup_task, return_exceptions=True)
+    profiles_task = getattr(app.state, "profiles_task", None)
+    if profiles_task is not None and not profiles_task.done():
+        profiles_task.cancel()
+        await asyncio.gather(profiles_task, return_exceptions=True)
+    # Finish queued leads before the process exits; unfinished ones are replayed on the next start
+    await lead_queue.stop()
+    if getattr(app.state, "follow_task", None) is not None:
+        app.state.follow_task.cancel()
+    await reply_dispatcher.stop()
+    reply_outbox.close()
+    lead_store.close()
+    await classifier.close()
+    classification_cache.close()
+    if redis_client is not None:
+        await redis_client.aclose()
+
+# Liveness probe
+@app.get("/healthz")
+async def healthz():
+    """
+    The process is up and serving, plus which integrations are configured
+    """
     return {
-        "status": "Active",
+        "status": "ok",
         "service": "AI Agent Backend",
         "version": "1.0.0",
-        "groq_connected": groq_client is not None,
-        "facebook_token_configured": PAGE_ACCESS_TOKEN and PAGE_ACCESS_TOKEN != "your_page_access_token_here"
+        "groq_connected": classifier.configured,
+        "facebook_token_configured": tenants.access_token_configured
     }
 
+# Readiness probe
+@app.get("/readyz")
+async def readyz():
+    """
+    200 once startup scans are done and webhooks are accepted, 503 while starting or draining
+    """
+    ready = app.state.phase == "ready"
+    return FastJSONResponse(
+        {"status": app.state.phase, "startup_seconds": app.state.startup_seconds},
+        status_code=200 if ready else 503
+    )
+
 # GET webhook route for Facebook/Meta verification
 @app.get("/webhook")
 async def verify_webhook(
@@ -272,10 +869,9 @@ async def verify_webhook(
     """
     Facebook/Meta webhook verification endpoint
     Handles the initial verification challenge from Facebook
+    The handshake names no page, so any tenant's verify token is accepted
     """
-    our_verify_token = os.getenv("VERIFY_TOKEN")
-    
-    if hub_verify_token != our_verify_token:
+    if not tenants.verify_token_valid(hub_verify_token):
         raise HTTPException(
             status_code=403,
             detail="Invalid verification token"
@@ -283,7 +879,7 @@ async def verify_webhook(
     
     try:
         challenge = int(hub_challenge)
-        print(f"Verified! Sending challenge: {hub_challenge}")
+        logger.info("Webhook verified, sending challenge")
         return PlainTextResponse(content=str(hub_challenge), status_code=200)
     except ValueError:
         raise HTTPException(
@@ -296,83 +892,122 @@ async def verify_webhook(
 async def receive_webhook(request: Request):
     """
     Receive webhook data from Facebook and Instagram
-    Detects source, analyzes with AI, saves to database, and replies
+    Detects source and queues every lead in the delivery; AI analysis and storage happen in the workers
     """
+    if app.state.phase != "ready":
+        # Still warming up or draining; non-200 makes Meta redeliver later
+        WEBHOOK_DELIVERIES.inc(status="not_ready")
+        raise HTTPException(status_code=503, detail=f"Service {app.state.phase}", headers={"Retry-After": "5"})
     try:
-        # Get the raw body and parse it
-        body = await request.body()
-        if not body:
-            return {"status": "empty", "message": "No data received"}
+        # Read the raw body once, capped, and check its signature before parsing anything
+        try:
+            body = await read_body(request, WEBHOOK_MAX_BYTES)
+        except PayloadTooLargeError as e:
+            WEBHOOK_DELIVERIES.inc(status="too_large")
+            raise HTTPException(status_code=413, detail=str(e))
+        # Forged deliveries stop here, before dedup or any LLM spend
+        signed_with = None
+        secrets = tenants.app_secrets()
+        if secrets:
+            signed_with = matching_secret(body, request.headers.get(SIGNATURE_HEADER), secrets)
+            if signed_with is None:
+                WEBHOOK_DELIVERIES.inc(status="forged")
+                raise HTTPException(status_code=401, detail="Invalid webhook signature")
+        if not body.strip():
+            WEBHOOK_DELIVERIES.inc(status="empty")
+            return FastJSONResponse({"status": "empty", "message": "No data received"})
         
-        # Parse JSON
+        # One parse of the bytes already in hand
+        parse_started = time.perf_counter()
         try:
-            data = await request.json()
-        except:
-            # Fallback: manual parsing
-            body_str = body.decode('utf-8')
-            if not body_str:
-                return {"status": "empty", "message": "Empty body"}
-            data = json.loads(body_str)
+            data = loads(body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            WEBHOOK_DELIVERIES.inc(status="invalid")
+            raise HTTPException(status_code=400, detail="Webhook payload must be a JSON object")
+        STAGE_SECONDS.observe(time.perf_counter() - parse_started, stage="parse")
         
-        print(f"Received webhook: {json.dumps(data, indent=2)}")
+        logger.debug("Received webhook", extra={"bytes": len(body)})
+        if log_config.should_log_payload():
+            logger.info("Webhook payload sample", extra={"payload": log_config.payload(body)})
         
-        # Initialize database if needed
-        init_leads_database()
+        # Meta batches many entries/changes per delivery, so take all of them
+        with STAGE_SECONDS.time(stage="extract"):
+            leads = list(extract_leads(data))
+        if not leads:
+            # If neither source matched
+            WEBHOOK_DELIVERIES.inc(status="ignored")
+            return FastJSONResponse({
+                "status": "ignored",
+                "message": "No valid comment data found",
+                "data": data
+            })
         
-        # Try to extract from Facebook
-        facebook_lead = extract_facebook_comment(data)
-        if facebook_lead:
-            # Analyze with AI
-            ai_result = analyze_comment_with_groq(facebook_lead.comment_text)
-            facebook_lead.priority = ai_result["priority_score"]
-            facebook_lead.ai_response = ai_result["ai_response_text"]
-            
-            # Save to database
-            save_lead_to_csv(facebook_lead)
-            
-            # Try to send Facebook reply (if comment_id is available)
-            # Note: Facebook webhook structure may need comment_id extraction
-            # For now, we'll log the reply that would be sent
-            print(f"Would reply to Facebook comment: {facebook_lead.ai_response}")
-            
-            return {
-                "status": "processed",
-                "source": "facebook",
-                "lead": facebook_lead.model_dump(),
-                "ai_analysis": ai_result,
-                "reply_sent": False  # Will be True when comment_id is available
-            }
+        # entry.id picks the tenant; drop pages not served here or signed by another tenant's app
+        leads = [lead for lead in leads if routable(lead, signed_with)]
+        if not leads:
+            WEBHOOK_DELIVERIES.inc(status="unrouted")
+            return FastJSONResponse({"status": "ignored", "message": "No comments for a page served here"})
         
-        # Try to extract from Instagram
-        instagram_lead = extract_instagram_comment(data)
-        if instagram_lead:
-            # Analyze with AI
-            ai_result = analyze_comment_with_groq(instagram_lead.comment_text)
-            instagram_lead.priority = ai_result["priority_score"]
-            instagram_lead.ai_response = ai_result["ai_response_text"]
-            
-            # Save to database
-            save_lead_to_csv(instagram_lead)
-            
-            print(f"Would reply to Instagram comment: {instagram_lead.ai_response}")
-            
-            return {
-                "status": "processed",
-                "source": "instagram",
-                "lead": instagram_lead.model_dump(),
-                "ai_analysis": ai_result,
-                "reply_sent": False
-            }
+        # Meta retries deliveries it thinks failed; drop comments already accepted before any AI work
+        with STAGE_SECONDS.time(stage="dedup"):
+            is_new = await dedup_index.filter_new([lead.comment_id for lead in leads], lead_store.existing_comment_ids)
+        duplicates = is_new.count(False)
+        leads = [lead for lead, new in zip(leads, is_new) if new]
+        if not leads:
+            WEBHOOK_DELIVERIES.inc(status="duplicate")
+            return FastJSONResponse({"status": "duplicate", "duplicates": duplicates, "message": "All comments already received"})
         
-        # If neither source matched
-        return {
-            "status": "ignored",
-            "message": "No valid comment data found",
-            "data": data
-        }
+        # One job per tenant, so each waits in (and counts against) its own tenant's queue share
+        groups: Dict[str, List[LeadRecord]] = {}
+        for lead in leads:
+            groups.setdefault(tenants.resolve(lead.page_id).id, []).append(lead)
         
+        # Durable before acknowledging (ingest log or Redis stream); AI analysis and storage happen in the workers
+        request_id = request_id_var.get()
+        with STAGE_SECONDS.time(stage="log"):
+            results = await asyncio.gather(*(
+                lead_queue.publish(
+                    {"leads": [lead.to_dict() for lead in group], "request_id": request_id},
+                    (group, request_id)
+                )
+                for group in groups.values()
+            ), return_exceptions=True)
+        queued = []
+        for group, result in zip(groups.values(), results):
+            if isinstance(result, BaseException):
+                # Not acknowledged, so let Meta's redelivery through
+                dedup_index.forget(lead.comment_id for lead in group)
+            else:
+                queued.extend(group)
+        for lead in queued:
+            LEADS_RECEIVED.inc(source=lead.source)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        for error in errors:
+            if not isinstance(error, QueueFullError):
+                raise error
+        if errors:
+            # Refused before anything was logged; non-200 makes Meta redeliver later instead of us dropping the comment
+            # (comments of tenants that were queued are deduplicated on redelivery)
+            WEBHOOK_DELIVERIES.inc(status="rejected")
+            raise HTTPException(status_code=503, detail=str(errors[0]), headers={"Retry-After": "5"})
+        
+        WEBHOOK_DELIVERIES.inc(status="queued")
+        return FastJSONResponse({
+            "status": "queued",
+            "source": leads[0].source,
+            "queued": len(leads),
+            "duplicates": duplicates,
+            "leads": [lead.to_dict() for lead in leads],
+            "reply_sent": False
+        })
+        
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error processing webhook: {e}")
+        WEBHOOK_DELIVERIES.inc(status="error")
+        logger.exception("Error processing webhook")
         raise HTTPException(
             status_code=500,
             detail=f"Error processing webhook: {str(e)}"
@@ -380,31 +1015,273 @@ async def receive_webhook(request: Request):
 
 # Route to view leads database
 @app.get("/leads")
-async def get_leads():
+async def get_leads(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    source: Optional[str] = None,
+    priority: Optional[str] = None,
+    post_id: Optional[str] = None,
+    start: Optional[str] = Query(None, description="ISO timestamp, inclusive"),
+    end: Optional[str] = Query(None, description="ISO timestamp, exclusive"),
+    since: Optional[int] = Query(None, description="Only leads with an id greater than this, oldest first"),
+    tenant: Optional[str] = Query(None, description="Only leads of this tenant's pages")
+):
     """
-    View all leads from the database
+    View leads from the database, newest first, one page at a time
+    Pass the returned next_cursor back as `cursor` to get the following page
+    Pass `since` (highest lead id already seen) to get only newer leads
     """
-    if not os.path.exists(LEADS_CSV_FILE):
-        return {"leads": [], "message": "Database file not found"}
+    page_ids = partition(tenant)
+    if since is not None:
+        # Delta feed: clients pass the highest id they already have
+        leads = await asyncio.to_thread(lead_store.list_since, since, limit, page_ids)
+        return FastJSONResponse({"count": len(leads), "leads": leads, "next_cursor": None})
+    
+    try:
+        position = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Fetch one extra row to know whether another page exists
+    leads = await asyncio.to_thread(
+        lead_store.list_leads,
+        limit=limit + 1,
+        cursor=position,
+        source=source,
+        priority=priority,
+        post_id=post_id,
+        start=start,
+        end=end,
+        page_ids=page_ids
+    )
+    next_cursor = None
+    if len(leads) > limit:
+        leads = leads[:limit]
+        next_cursor = encode_cursor(leads[-1]["timestamp"], leads[-1]["id"])
     
-    leads = []
-    with open(LEADS_CSV_FILE, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            leads.append(row)
+    # Store rows are already plain JSON types, encode them directly
+    return FastJSONResponse({
+        "count": len(leads),
+        "leads": leads,
+        "next_cursor": next_cursor
+    })
+
+# Route to export leads in bulk
+@app.get("/leads/export")
+async def export_leads(
+    format: str = Query("csv", pattern="^(csv|ndjson|parquet)$"),
+    cursor: Optional[str] = Query(None, description="Resume after this lead (a /leads cursor)"),
+    source: Optional[str] = None,
+    priority: Optional[str] = None,
+    post_id: Optional[str] = None,
+    start: Optional[str] = Query(None, description="ISO timestamp, inclusive"),
+    end: Optional[str] = Query(None, description="ISO timestamp, exclusive"),
+    limit: Optional[int] = Query(None, ge=1, description="Stop after this many rows"),
+    tenant: Optional[str] = Query(None, description="Only leads of this tenant's pages")
+):
+    """
+    Stream every matching lead as CSV, NDJSON or Parquet, newest first, in constant memory
+    Same filters as /leads; to resume, pass the cursor of the last row received
+    (base64url of "<timestamp>|<id>", the format of next_cursor)
+    """
+    try:
+        position = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export needs the pyarrow package")
+    page_ids = partition(tenant)
     
+    async def load_page(after: Optional[Tuple[str, int]], size: int) -> List[Dict[str, Any]]:
+        # One short store call per page, so workers and other requests interleave with the export
+        return await asyncio.to_thread(
+            lead_store.list_leads,
+            limit=size,
+            cursor=after,
+            source=source,
+            priority=priority,
+            post_id=post_id,
+            start=start,
+            end=end,
+            page_ids=page_ids
+        )
+    
+    return StreamingResponse(
+        stream_export(load_page, format, cursor=position, limit=limit, page_size=EXPORT_PAGE_SIZE),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="leads.{format}"', "X-Accel-Buffering": "no"}
+    )
+
+# Route to view aggregate lead counters
+@app.get("/leads/stats")
+async def get_lead_stats(
+    hours: int = Query(24, ge=0, le=168, description="Hourly buckets to include"),
+    top_posts: int = Query(10, ge=0, le=100),
+    tenant: Optional[str] = Query(None, description="Only leads of this tenant's pages")
+):
+    """
+    Totals by source, priority, post and hour, served from in-memory counters
+    Per tenant they are summed from the counters of the tenant's pages
+    """
+    if lead_store.shared:
+        # Other processes write too, so read the store's own counters (kept per page as well)
+        stats = LeadStats()
+        stats.load(await asyncio.to_thread(lead_store.aggregate_counts, partition(tenant)))
+        return stats.snapshot(hours=hours, top_posts=top_posts)
+    if tenant is not None:
+        return lead_stats.for_pages(partition(tenant)).snapshot(hours=hours, top_posts=top_posts)
+    return lead_stats.snapshot(hours=hours, top_posts=top_posts)
+
+# Route to rank users or posts by recent engagement
+@app.get("/leads/hot")
+async def get_hot_leads(
+    kind: str = Query("user", pattern="^(user|post)$", description="Rank users or posts"),
+    limit: int = Query(20, ge=1, le=lead_profiles.indexes["user"].top_n)
+):
+    """
+    Hottest users or posts, each merging all of its comments into one profile.
+    Scores are decayed engagement (priority-weighted comments, halved every
+    LEAD_HOT_HALF_LIFE_HOURS) read from the top-N kept on write.
+    """
+    if not lead_profiles.ready:
+        # Profiles are rebuilt from the store in the background after startup
+        raise HTTPException(status_code=503, detail="Lead profiles are still loading", headers={"Retry-After": "5"})
+    profiles = lead_profiles.hot(kind, limit)
+    return FastJSONResponse({
+        "kind": kind,
+        "half_life_hours": lead_profiles.half_life_hours,
+        "count": len(profiles),
+        "profiles": profiles
+    })
+
+# Route to push new leads to dashboards as they are stored
+@app.get("/leads/stream")
+async def stream_new_leads(
+    request: Request,
+    since: Optional[int] = Query(None, description="Replay leads with an id greater than this first"),
+    tenant: Optional[str] = Query(None, description="Only leads of this tenant's pages")
+):
+    """
+    Server-Sent Events feed: one `lead` event per stored lead
+    """
+    page_ids = partition(tenant)
+    # Browsers resend the last seen event id on reconnect
+    last_event_id = request.headers.get("Last-Event-ID")
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    
+    load_backlog = None
+    if since is not None:
+        async def load_backlog():
+            return await asyncio.to_thread(lead_store.list_since, since, LEADS_STREAM_BACKLOG, page_ids)
+    
+    accept = None
+    if page_ids is not None:
+        pages = set(page_ids)
+        accept = lambda lead: lead.get("page_id") in pages
+    
+    return StreamingResponse(
+        stream_leads(lead_events, load_backlog, accept=accept),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Route to inspect the webhook work queue
+@app.get("/queue/stats")
+async def get_queue_stats():
+    """
+    Queue depth, throughput and backpressure counters
+    """
+    return lead_queue.stats()
+
+# Route to inspect the classification cache
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Classification cache hit/miss/eviction counters
+    """
+    return classification_cache.stats()
+
+# Route to inspect the Groq classifier
+@app.get("/classifier/stats")
+async def get_classifier_stats():
+    """
+    Groq request, retry, rate-limit and fallback counters
+    """
+    return classifier.stats()
+
+# Route for Prometheus scrapes
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Pipeline stage latencies, throughput and queue depth in Prometheus text format
+    """
+    return PlainTextResponse(await asyncio.to_thread(metrics.render), media_type=CONTENT_TYPE)
+
+# Route to inspect the write-ahead ingest log
+@app.get("/ingest/stats")
+async def get_ingest_stats():
+    """
+    Write-ahead log offsets and group-commit counters
+    """
+    if ingest_log is None:
+        raise HTTPException(status_code=404, detail="No ingest log with STATE_BACKEND=redis, see /queue/stats")
+    return ingest_log.stats()
+
+# Route to inspect webhook redelivery handling
+@app.get("/dedup/stats")
+async def get_dedup_stats():
+    """
+    Duplicate comment counters for redelivered webhooks
+    """
+    return dedup_index.stats()
+
+# Route to inspect near-duplicate clustering
+@app.get("/near-duplicates/stats")
+async def get_near_duplicate_stats():
+    """
+    Comment clusters, reused verdicts and throttled spam bursts
+    """
+    return near_duplicates.stats()
+
+# Route to inspect outbound replies
+@app.get("/replies/stats")
+async def get_reply_stats():
+    """
+    Reply outbox and Graph dispatch counters
+    """
+    return await asyncio.to_thread(reply_dispatcher.stats)
+
+# Route to inspect tenants and their quotas
+@app.get("/tenants/stats")
+async def get_tenant_stats():
+    """
+    Tenants with their quotas, queued deliveries and LLM and reply slots in use
+    Credentials are only reported as configured or not
+    """
+    lanes = lead_queue.stats().get("lanes") or {}
+    llm = classifier.limiter.stats()["tenants"]
     return {
-        "total_leads": len(leads),
-        "leads": leads
+        "strict": tenants.strict,
+        "tenants": [
+            {
+                **tenant.summary(),
+                "queued": lanes.get(tenant.id, 0),
+                "llm": llm.get(tenant.id),
+                "replies_in_flight": reply_dispatcher.tenant_in_flight[tenant.id],
+            }
+            for tenant in tenants.all()
+        ]
     }
 
 # Route to manually test Facebook reply
 @app.post("/test/facebook-reply")
-async def test_facebook_reply(comment_id: str, message: str):
+async def test_facebook_reply(comment_id: str, message: str, page_id: str = ""):
     """
     Test sending a reply to a Facebook comment
+    Pass `page_id` to reply with that page's tenant token
     """
-    success = send_facebook_reply(comment_id, message)
+    success = await send_facebook_reply(comment_id, message, page_id)
     return {
         "success": success,
         "comment_id": comment_id,
@@ -412,5 +1289,15 @@ async def test_facebook_reply(comment_id: str, message: str):
     }
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "replay":
+        run_replay_command(sys.argv[2:])
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "reclassify":
+        run_reclassify_command(sys.argv[2:])
+        sys.exit(0)
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if WEB_CONCURRENCY > 1:
+        # Worker processes import the app themselves, so pass it by name
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=WEB_CONCURRENCY)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
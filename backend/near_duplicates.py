@@ -0,0 +1,249 @@
+"""
+Near-duplicate comment clustering for the classification path.
+
+Giveaway and bot waves post thousands of comments that differ only by a
+tagged friend, a word or some punctuation. The classification cache only
+catches exact matches after normalization, so each variant would still
+reach the LLM.
+
+Each comment gets a MinHash signature over the character 3-grams of its
+normalized text, with @mentions removed. The signature has 32 minimums,
+taken from one 512-bit blake2b digest per shingle. Two comments are
+near-duplicates when their signatures agree in at least a `threshold`
+share of positions, which estimates the Jaccard similarity of their
+shingle sets.
+
+Candidates come from LSH banding. The signature is cut into `bands`
+slices, each indexed in a hash table, and only clusters sharing a whole
+slice are compared. The chance of that is 1 - (1 - J^rows)^bands: about
+0.9 at Jaccard 0.7 with the default 8 bands of 4, and under 0.05 for
+unrelated comments.
+
+A cluster's first comment (the representative) is classified. Later
+members reuse its verdict, and members arriving while it is in flight
+wait for that one call. A cluster that grows past `burst_threshold`
+members within `burst_window` seconds is a spam burst. Its members never
+reach the LLM: they take the cluster verdict or the keyword rules.
+
+Clusters never span scopes: a tenant with its own prompt only reuses
+verdicts given under that prompt. The index lives in process memory and
+is bounded to `max_clusters` (least recently matched first out).
+"""
+import asyncio
+import hashlib
+import re
+import struct
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from classification_cache import normalize_comment
+
+_MENTION_RE = re.compile(r"@[\w.]+")
+
+NUM_HASHES = 32
+_MINHASHES = struct.Struct(f"<{NUM_HASHES}H")
+
+# classify(allow_llm) -> (verdict, tier), see GroqClassifier.classify_with_tier
+Classify = Callable[[bool], Awaitable[Tuple[Dict[str, Any], str]]]
+
+
+def fingerprint_text(comment_text: str) -> str:
+    """Normalized comment with @mentions removed; tagged friends vary across a giveaway wave"""
+    return " ".join(_MENTION_RE.sub(" ", normalize_comment(comment_text)).split())
+
+
+def shingles(text: str, size: int = 3) -> List[str]:
+    """Distinct character n-grams of `text`"""
+    if len(text) <= size:
+        return [text] if text else []
+    return list({text[i:i + size] for i in range(len(text) - size + 1)})
+
+
+def minhash(features: List[str]) -> Tuple[int, ...]:
+    """Signature: per position, the minimum of that 16-bit slice of each feature's digest"""
+    return tuple(map(min, zip(*(
+        _MINHASHES.unpack(hashlib.blake2b(feature.encode("utf-8"), digest_size=64).digest())
+        for feature in features
+    ))))
+
+
+class Cluster:
+    """Comments whose signature is within the threshold of the representative's"""
+
+    __slots__ = (
+        'id', 'scope', 'signature', 'representative', 'size', 'verdict', 'pending',
+        'window_started', 'window_count', 'bursting',
+    )
+
+    def __init__(self, cluster_id: int, signature: Tuple[int, ...], representative: str, now: float, scope: str = ""):
+        self.id = cluster_id
+        self.scope = scope
+        self.signature = signature
+        self.representative = representative
+        self.size = 0
+        self.verdict: Optional[Dict[str, Any]] = None
+        # The representative's classification while it is in flight
+        self.pending: Optional[asyncio.Future] = None
+        self.window_started = now
+        self.window_count = 0
+        self.bursting = False
+
+
+class NearDuplicateIndex:
+    """Streaming MinHash LSH clustering with verdict reuse and spam-burst throttling"""
+
+    def __init__(
+        self,
+        threshold: float = 0.7,
+        bands: int = 8,
+        min_length: int = 12,
+        max_clusters: int = 50000,
+        burst_window: float = 60.0,
+        burst_threshold: int = 20,
+    ):
+        if NUM_HASHES % bands:
+            raise ValueError(f"bands must divide {NUM_HASHES}")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = NUM_HASHES // bands
+        # Shorter comments carry too few shingles for a stable signature; the exact cache covers them
+        self.min_length = min_length
+        self.max_clusters = max_clusters
+        self.burst_window = burst_window
+        self.burst_threshold = burst_threshold
+        self._clusters: "OrderedDict[int, Cluster]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], List[int]] = {}
+        self._next_id = 1
+
+        self.checked = 0
+        self.clusters_created = 0
+        self.matched = 0
+        self.reused = 0
+        self.coalesced = 0
+        self.throttled = 0
+        self.bursts = 0
+        self.evictions = 0
+
+    def _band_keys(self, signature: Tuple[int, ...], scope: str) -> List[Tuple[str, int, Tuple[int, ...]]]:
+        return [(scope, band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def _find(self, signature: Tuple[int, ...], scope: str) -> Optional[Cluster]:
+        best: Optional[Cluster] = None
+        best_similarity = self.threshold
+        seen = set()
+        for key in self._band_keys(signature, scope):
+            for cluster_id in self._buckets.get(key, ()):
+                if cluster_id in seen:
+                    continue
+                seen.add(cluster_id)
+                cluster = self._clusters[cluster_id]
+                similarity = sum(map(int.__eq__, cluster.signature, signature)) / NUM_HASHES
+                if similarity >= best_similarity:
+                    best, best_similarity = cluster, similarity
+        return best
+
+    def _create(self, signature: Tuple[int, ...], comment_text: str, now: float, scope: str) -> Cluster:
+        cluster = Cluster(self._next_id, signature, comment_text, now, scope)
+        self._next_id += 1
+        self._clusters[cluster.id] = cluster
+        for key in self._band_keys(signature, scope):
+            self._buckets.setdefault(key, []).append(cluster.id)
+        self.clusters_created += 1
+        while len(self._clusters) > self.max_clusters:
+            self._evict()
+        return cluster
+
+    def _evict(self):
+        _, cluster = self._clusters.popitem(last=False)
+        for key in self._band_keys(cluster.signature, cluster.scope):
+            members = self._buckets[key]
+            members.remove(cluster.id)
+            if not members:
+                del self._buckets[key]
+        self.evictions += 1
+
+    def assign(
+        self, comment_text: str, count: int = 1, now: Optional[float] = None, scope: str = ""
+    ) -> Optional[Cluster]:
+        """
+        Cluster for a comment, created if it matches none; None when the comment is too short to fingerprint
+        `count` is how many identical copies arrived together, all counted towards a burst
+        """
+        text = fingerprint_text(comment_text)
+        if len(text) < self.min_length:
+            return None
+        now = time.monotonic() if now is None else now
+        self.checked += 1
+        signature = minhash(shingles(text))
+        cluster = self._find(signature, scope)
+        if cluster is None:
+            cluster = self._create(signature, comment_text, now, scope)
+        else:
+            self.matched += 1
+            self._clusters.move_to_end(cluster.id)
+        cluster.size += count
+        if now - cluster.window_started > self.burst_window:
+            cluster.window_started = now
+            cluster.window_count = 0
+            cluster.bursting = False
+        cluster.window_count += count
+        if not cluster.bursting and cluster.window_count > self.burst_threshold:
+            cluster.bursting = True
+            self.bursts += 1
+        return cluster
+
+    async def classify(
+        self, comment_text: str, classify: Classify, refresh: bool = False, count: int = 1, scope: str = ""
+    ) -> Tuple[Dict[str, Any], str]:
+        """
+        Verdict for a comment, calling `classify` at most once per cluster at a time
+        `refresh` ignores verdicts already held by the cluster (except during a burst), like the classification cache
+        """
+        cluster = self.assign(comment_text, count, scope=scope)
+        if cluster is None:
+            return await classify(True)
+        # Under refresh a burst still reuses: a keyword verdict would be worse than the held LLM one
+        if cluster.verdict is not None and (not refresh or cluster.bursting):
+            self.reused += 1
+            return cluster.verdict, "near_duplicate"
+        if cluster.pending is not None:
+            # shield: one waiter being cancelled must not cancel the representative's call
+            verdict, tier = await asyncio.shield(cluster.pending)
+            if tier != "fallback":
+                self.coalesced += 1
+                return verdict, "near_duplicate"
+        if cluster.bursting:
+            self.throttled += 1
+            return await classify(False)
+        future = asyncio.ensure_future(classify(True))
+        cluster.pending = future
+        future.add_done_callback(lambda done: self._settle(cluster, done))
+        return await asyncio.shield(future)
+
+    @staticmethod
+    def _settle(cluster: Cluster, future: asyncio.Future):
+        cluster.pending = None
+        if future.cancelled() or future.exception() is not None:
+            return
+        verdict, tier = future.result()
+        # Keyword fallbacks (LLM down or unset) are not reused, the next member tries again
+        if tier != "fallback":
+            cluster.verdict = verdict
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clusters": len(self._clusters),
+            "max_clusters": self.max_clusters,
+            "threshold": self.threshold,
+            "bands": self.bands,
+            "checked": self.checked,
+            "clusters_created": self.clusters_created,
+            "matched": self.matched,
+            "reused": self.reused,
+            "coalesced": self.coalesced,
+            "throttled": self.throttled,
+            "bursts": self.bursts,
+            "bursting": sum(1 for cluster in self._clusters.values() if cluster.bursting),
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,152 @@
+"""
+Fast local pre-classifier that runs before the LLM.
+
+Compiled regex intent matchers over a configurable multilingual lexicon
+score each comment. Obvious purchase intent, spam, emoji-only and
+tag-a-friend comments are answered here with no Groq call; only comments
+below the confidence threshold go to the LLM. The same matcher also
+provides the keyword fallback when the LLM is unavailable.
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+# intent -> language -> phrases; extend or override with INTENT_LEXICON_FILE
+DEFAULT_LEXICON: Dict[str, Dict[str, List[str]]] = {
+    "purchase": {
+        "en": ["price", "prices", "pricing", "cost", "how much", "how many dollars", "buy", "order",
+               "purchase", "available", "availability", "in stock", "shipping", "deliver", "delivery",
+               "where can i get", "where to buy", "dm me", "dm price", "pm me"],
+        "es": ["precio", "precios", "cuanto cuesta", "cuánto cuesta", "cuanto vale", "cuánto vale",
+               "comprar", "disponible", "envío", "envio"],
+        "fr": ["prix", "combien", "acheter", "disponible", "livraison", "tarif"],
+        "pt": ["preço", "preco", "quanto custa", "comprar", "disponível", "entrega", "valor"],
+        "de": ["preis", "wie viel", "wieviel", "kaufen", "verfügbar", "lieferung", "kosten"],
+        "it": ["prezzo", "quanto costa", "comprare", "disponibile", "spedizione"],
+        "hi_ur": ["kitne ka", "kitne ki", "kitna", "qeemat", "keemat", "rate kya", "price kya",
+                  "कीमत", "कितने का", "قیمت", "کتنے کا"],
+        "ar": ["السعر", "بكم", "كم السعر", "سعر", "متوفر", "توصيل"],
+    },
+    "info": {
+        "en": ["info", "information", "details", "more details", "contact", "interested", "whatsapp",
+               "number please", "send details", "inbox me"],
+        "es": ["información", "informacion", "detalles", "contacto", "interesado", "interesada"],
+        "fr": ["information", "informations", "détails", "contact", "intéressé", "intéressée"],
+        "pt": ["informação", "informacao", "detalhes", "contato", "interessado", "interessada"],
+        "de": ["info", "informationen", "details", "kontakt", "interessiert"],
+        "it": ["informazioni", "dettagli", "contatto", "interessato", "interessata"],
+        "hi_ur": ["details bhejo", "detail do", "maloomat", "जानकारी", "معلومات"],
+        "ar": ["معلومات", "تفاصيل", "تواصل", "مهتم"],
+    },
+    "spam": {
+        "en": ["follow me", "follow back", "check my profile", "check my page", "visit my page",
+               "free followers", "get followers", "earn money", "make money", "work from home",
+               "crypto", "bitcoin", "forex", "investment opportunity", "click the link", "link in bio",
+               "giveaway winner", "you won", "sub4sub", "f4f", "l4l"],
+        "es": ["sígueme", "sigueme", "gana dinero"],
+        "pt": ["me segue", "siga me", "ganhe dinheiro"],
+        "fr": ["suivez moi", "gagner de l'argent"],
+    },
+    "negative": {
+        "en": ["refund", "scam", "fake", "terrible", "worst", "broken", "never arrived", "complaint",
+               "not working", "disappointed", "too expensive", "overpriced"],
+        "es": ["estafa", "reembolso", "pésimo", "pesimo"],
+        "pt": ["golpe", "reembolso", "péssimo", "pessimo"],
+        "fr": ["arnaque", "remboursement"],
+        "de": ["betrug", "rückerstattung"],
+    },
+}
+
+INTENT_VERDICTS: Dict[str, Dict[str, str]] = {
+    "purchase": {
+        "ai_response_text": "Thanks for your interest! Check your DMs for a special offer with pricing details.",
+        "priority_score": "High",
+    },
+    "info": {
+        "ai_response_text": "Thanks for your interest! Check your DMs for a special offer with pricing details.",
+        "priority_score": "High",
+    },
+    "spam": {"ai_response_text": "", "priority_score": "Low"},
+    "tag_friend": {"ai_response_text": "Thank you for your comment! We'll get back to you soon.", "priority_score": "Low"},
+    "emoji_only": {"ai_response_text": "Thank you for your comment! We'll get back to you soon.", "priority_score": "Low"},
+    "unknown": {"ai_response_text": "Thank you for your comment! We'll get back to you soon.", "priority_score": "Normal"},
+}
+
+_URL_RE = re.compile(r"https?://|www\.|\b\w+\.(?:com|net|ly|io|me)/", re.IGNORECASE)
+_MENTION_RE = re.compile(r"@[\w.]+")
+_WORD_RE = re.compile(r"\w+")
+
+
+def load_lexicon(path: Optional[str] = None) -> Dict[str, Dict[str, List[str]]]:
+    """Default lexicon, extended/overridden per intent and language by a JSON file"""
+    lexicon = {intent: {lang: list(words) for lang, words in langs.items()} for intent, langs in DEFAULT_LEXICON.items()}
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            for intent, langs in json.load(f).items():
+                lexicon.setdefault(intent, {}).update(langs)
+    return lexicon
+
+
+def _compile(phrases: List[str]) -> Optional[re.Pattern]:
+    if not phrases:
+        return None
+    # Longest first so "how much" wins over shorter overlapping phrases
+    ordered = sorted({phrase.casefold() for phrase in phrases}, key=len, reverse=True)
+    return re.compile(r"(?<!\w)(?:" + "|".join(re.escape(phrase) for phrase in ordered) + r")(?!\w)")
+
+
+class IntentMatcher:
+    """Scores a comment's intent with one compiled regex per intent"""
+
+    def __init__(self, lexicon: Optional[Dict[str, Dict[str, List[str]]]] = None, threshold: float = 0.85):
+        self.threshold = threshold
+        lexicon = lexicon if lexicon is not None else load_lexicon()
+        self._patterns = {
+            intent: _compile([phrase for phrases in langs.values() for phrase in phrases])
+            for intent, langs in lexicon.items()
+        }
+
+    def _matches(self, intent: str, text: str) -> int:
+        pattern = self._patterns.get(intent)
+        return len(pattern.findall(text)) if pattern is not None else 0
+
+    def match(self, comment_text: str) -> Dict[str, Any]:
+        """
+        Returns: {'intent': str, 'confidence': float, 'ai_response_text': str, 'priority_score': str}
+        """
+        text = comment_text.casefold().strip()
+        without_mentions = _MENTION_RE.sub(" ", text)
+        words = _WORD_RE.findall(without_mentions)
+
+        if not words:
+            intent = "tag_friend" if _MENTION_RE.search(text) else "emoji_only"
+            return self._verdict(intent, 0.97 if intent == "tag_friend" else 0.99)
+
+        spam_hits = self._matches("spam", text)
+        has_url = bool(_URL_RE.search(text))
+        if spam_hits:
+            return self._verdict("spam", 0.97 if has_url else 0.9)
+
+        purchase_hits = self._matches("purchase", text)
+        info_hits = self._matches("info", text)
+        if purchase_hits or info_hits:
+            intent = "purchase" if purchase_hits >= info_hits else "info"
+            confidence = 0.8
+            if len(words) <= 8:
+                confidence += 0.1
+            if "?" in text or "؟" in text:
+                confidence += 0.05
+            if self._matches("negative", text):
+                # "the price is a scam" is a complaint, let the LLM decide
+                confidence -= 0.3
+            return self._verdict(intent, min(confidence, 0.97))
+
+        if has_url:
+            return self._verdict("spam", 0.7)
+        return self._verdict("unknown", 0.0)
+
+    def _verdict(self, intent: str, confidence: float) -> Dict[str, Any]:
+        return {"intent": intent, "confidence": round(confidence, 2), **INTENT_VERDICTS[intent]}
+
+    def confident(self, result: Dict[str, Any]) -> bool:
+        return result["confidence"] >= self.threshold
@@ -0,0 +1,213 @@
+"""
+Offline re-classification of stored leads, e.g. after a prompt or model change.
+
+The job snapshots the store's last id and walks leads up to it oldest
+first, one list_since page (chunk) at a time. Leads stored later were
+already classified by the live pipeline under the new settings.
+
+Speed comes from not calling the LLM per row:
+- Within a chunk, rows are grouped by normalized comment text (per
+  `scope`, e.g. tenants with their own prompt).
+- Texts already answered (or in flight) in this run are served from a
+  bounded memo.
+- The rest go through `classify` together, so the classifier's
+  micro-batching and concurrency limit apply across the whole chunk.
+- Several chunks are classified at once.
+
+Write-back and checkpoints happen in chunk order. Only rows whose
+priority or reply changed are written, in one bulk update per chunk.
+Keyword fallback verdicts (LLM unavailable, throttled spam bursts) never
+overwrite a stored verdict.
+The checkpoint file records the last written id, so an interrupted run
+resumes where it stopped. A dry run classifies without writing anything
+and reports how many rows would change.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from classification_cache import cache_key
+from lead_store import LeadStore
+
+# (first stored row of a group, copies in this chunk) -> (verdict, tier), see GroqClassifier.classify_with_tier
+ClassifyComment = Callable[[Dict[str, Any], int], Awaitable[Tuple[Dict[str, Any], str]]]
+
+
+class Checkpoint:
+    """Progress of one job, rewritten atomically after every committed chunk"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, state: Dict[str, Any]):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class ReclassifyJob:
+    """Stream, classify and write back stored leads in id order"""
+
+    def __init__(
+        self,
+        store: LeadStore,
+        classify: ClassifyComment,
+        checkpoint: Optional[Checkpoint] = None,
+        chunk_size: int = 500,
+        parallel_chunks: int = 4,
+        memo_size: int = 100000,
+        dry_run: bool = False,
+        progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+        progress_interval: float = 5.0,
+        scope: Optional[Callable[[Dict[str, Any]], str]] = None,
+    ):
+        self.store = store
+        self.classify = classify
+        # Rows of different scopes never share a verdict, even with the same text
+        self.scope = scope
+        # Dry runs never write, not even their position
+        self.checkpoint = checkpoint if not dry_run else None
+        self.chunk_size = chunk_size
+        self.parallel_chunks = parallel_chunks
+        self.memo_size = memo_size
+        self.dry_run = dry_run
+        self.progress = progress
+        self.progress_interval = progress_interval
+        # Scoped normalized text -> its verdict's future, shared by concurrent chunks
+        self._memo: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+        self.totals: Counter = Counter()
+        self.transitions: Counter = Counter()
+
+    def _verdict(self, key: str, row: Dict[str, Any], count: int) -> asyncio.Future:
+        future = self._memo.get(key)
+        if future is not None:
+            self._memo.move_to_end(key)
+            self.totals["memo_hits"] += 1
+            return future
+        future = asyncio.ensure_future(self.classify(row, count))
+        self._memo[key] = future
+        if len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        self.totals["classified"] += 1
+        return future
+
+    async def _classify_chunk(self, rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+        """Fresh verdicts for a chunk: the rows whose classification changed, and how many rows got a fallback"""
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            scope = self.scope(row) if self.scope is not None else ""
+            groups.setdefault(cache_key(row["comment_text"], scope), []).append(row)
+        verdicts = await asyncio.gather(*(
+            self._verdict(key, members[0], len(members)) for key, members in groups.items()
+        ))
+
+        changed = []
+        fallbacks = 0
+        for members, (verdict, tier) in zip(groups.values(), verdicts):
+            if tier == "fallback":
+                fallbacks += len(members)
+                continue
+            for row in members:
+                priority, ai_response = verdict["priority_score"], verdict["ai_response_text"]
+                if row["priority"] == priority and row["ai_response"] == ai_response:
+                    continue
+                changed.append({"id": row["id"], "priority": priority, "ai_response": ai_response, "previous_priority": row["priority"]})
+        return changed, fallbacks
+
+    async def _commit(self, state: Dict[str, Any], rows: List[Dict[str, Any]], result: Tuple[List[Dict[str, Any]], int]):
+        changed, fallbacks = result
+        if not self.dry_run and changed:
+            self.totals["updated"] += await asyncio.to_thread(self.store.update_classifications_by_id, changed)
+        self.totals["scanned"] += len(rows)
+        self.totals["changed"] += len(changed)
+        self.totals["fallbacks"] += fallbacks
+        for row in changed:
+            self.transitions[(row["previous_priority"], row["priority"])] += 1
+        state["last_id"] = rows[-1]["id"]
+        state["totals"] = dict(self.totals)
+        state["transitions"] = self._transitions()
+        if self.checkpoint is not None:
+            await asyncio.to_thread(self.checkpoint.save, state)
+
+    def report(self, state: Dict[str, Any], elapsed: float) -> Dict[str, Any]:
+        """Progress so far, with rate and a projection for what is left"""
+        scanned = self.totals["scanned"] - state.get("resumed_scanned", 0)
+        rate = scanned / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, state["through_id"] - state["last_id"])
+        return {
+            **dict(self.totals),
+            "last_id": state["last_id"],
+            "through_id": state["through_id"],
+            "elapsed_seconds": round(elapsed, 1),
+            "leads_per_second": round(rate, 1),
+            # Ids are dense, so the id gap approximates the leads left
+            "eta_seconds": round(remaining / rate, 1) if rate else None,
+            "transitions": self._transitions(),
+        }
+
+    def _transitions(self) -> Dict[str, int]:
+        return {f"{old}->{new}": count for (old, new), count in self.transitions.most_common()}
+
+    async def run(
+        self, from_id: int = 0, to_id: Optional[int] = None, limit: Optional[int] = None, resume: bool = False
+    ) -> Dict[str, Any]:
+        state: Optional[Dict[str, Any]] = None
+        if resume and self.checkpoint is not None:
+            state = self.checkpoint.load()
+            if state is not None:
+                self.totals.update(state.get("totals", {}))
+                for key, count in state.get("transitions", {}).items():
+                    old, new = key.split("->", 1)
+                    self.transitions[(old, new)] += count
+                state["resumed_scanned"] = self.totals["scanned"]
+        if state is None:
+            last_id = await asyncio.to_thread(self.store.last_id)
+            state = {
+                "started_at": time.time(),
+                "from_id": from_id,
+                "through_id": min(last_id, to_id) if to_id is not None else last_id,
+                "last_id": from_id,
+                "totals": {},
+            }
+
+        started = time.perf_counter()
+        last_report = started
+        budget = limit
+        in_flight: Deque[Tuple[List[Dict[str, Any]], asyncio.Task]] = deque()
+        cursor = state["last_id"]
+        while True:
+            size = self.chunk_size if budget is None else min(self.chunk_size, budget)
+            rows = []
+            if size > 0 and cursor < state["through_id"]:
+                page = await asyncio.to_thread(self.store.list_since, cursor, size)
+                rows = [row for row in page if row["id"] <= state["through_id"]]
+            if rows:
+                cursor = rows[-1]["id"]
+                if budget is not None:
+                    budget -= len(rows)
+                in_flight.append((rows, asyncio.create_task(self._classify_chunk(rows))))
+            if not in_flight:
+                break
+            # Commit the oldest chunk once the window is full, or drain at the end
+            if len(in_flight) >= self.parallel_chunks or not rows:
+                chunk, task = in_flight.popleft()
+                await self._commit(state, chunk, await task)
+                now = time.perf_counter()
+                if self.progress is not None and now - last_report >= self.progress_interval:
+                    last_report = now
+                    self.progress(self.report(state, now - started))
+
+        state["completed"] = state["last_id"] >= state["through_id"]
+        if self.checkpoint is not None:
+            await asyncio.to_thread(self.checkpoint.save, state)
+        return self.report(state, time.perf_counter() - started)
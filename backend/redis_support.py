@@ -0,0 +1,35 @@
+"""
+Optional Redis connection helpers for multi-process and multi-node mode.
+
+With STATE_BACKEND=redis the lead store, dedup index, classification cache
+and work queue keep their state in one Redis (or Redis-compatible) server,
+so any number of worker processes on any number of nodes share it. The
+`redis` package is imported only in that mode.
+
+Every key starts with a `{prefix}` hash tag, which keeps all keys on one
+slot so multi-key commands and Lua scripts also work on Redis Cluster.
+"""
+from typing import Any
+
+
+def _import_redis():
+    try:
+        import redis
+        import redis.asyncio
+    except ImportError:
+        raise RuntimeError("STATE_BACKEND=redis needs the redis package: pip install 'redis>=5'")
+    return redis
+
+
+def async_client(url: str) -> Any:
+    """redis.asyncio client for components used from the event loop"""
+    return _import_redis().asyncio.Redis.from_url(url, decode_responses=True)
+
+
+def sync_client(url: str) -> Any:
+    """Blocking client for components called through asyncio.to_thread (the lead store)"""
+    return _import_redis().Redis.from_url(url, decode_responses=True)
+
+
+def key_prefix(prefix: str) -> str:
+    return "{" + prefix + "}"
@@ -0,0 +1,608 @@
+"""
+Outbound comment replies through the Graph API.
+
+Replies are written to a persistent SQLite outbox first, so nothing is lost
+if the process restarts, then sent by a background dispatcher over one
+pooled async HTTP client. Each page has its own token bucket, paused when
+Graph usage headers report the page close to its limit or a call is
+throttled. Failed sends are retried with jittered exponential backoff; the
+Graph base URL is configurable so the dispatcher can run against a local
+mock server.
+
+With a tenant registry each page's replies are sent with its tenant's
+token, due replies are claimed taking turns between pages, and a tenant
+may cap how many of its replies are in flight, so one busy page cannot
+hold every send slot.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from tenants import Tenant, TenantRegistry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRAPH_BASE_URL = "https://graph.facebook.com/v18.0"
+
+# Graph error codes that mean "slow down" rather than "this reply is invalid"
+RATE_LIMIT_ERROR_CODES = {4, 17, 32, 613, 80001, 80002, 80005, 80006}
+
+# Graph edge that creates a reply, per source
+REPLY_EDGES = {"facebook": "comments", "instagram": "replies"}
+
+
+class ReplyOutbox:
+    """SQLite outbox of replies waiting to be sent, shared across worker threads"""
+
+    def __init__(self, db_path: str = "replies.db"):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn = conn
+        return self._conn
+
+    def init(self, stale_after: float = 0.0) -> int:
+        """
+        Create the schema and requeue replies that were mid-send at shutdown, returns how many
+        With several processes sharing the outbox, pass `stale_after` so replies other live processes are sending are left alone
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS reply_outbox (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        source TEXT NOT NULL,
+                        page_id TEXT NOT NULL DEFAULT '',
+                        comment_id TEXT NOT NULL,
+                        message TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'pending',
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        next_attempt_at REAL NOT NULL,
+                        last_error TEXT NOT NULL DEFAULT '',
+                        reply_id TEXT NOT NULL DEFAULT '',
+                        created_at REAL NOT NULL,
+                        sent_at REAL,
+                        claimed_at REAL NOT NULL DEFAULT 0
+                    )
+                """)
+                # Outboxes created before claims were timestamped
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(reply_outbox)")}
+                if "claimed_at" not in columns:
+                    conn.execute("ALTER TABLE reply_outbox ADD COLUMN claimed_at REAL NOT NULL DEFAULT 0")
+                # One reply per comment, even if the lead is processed twice
+                conn.execute(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS idx_reply_outbox_comment ON reply_outbox (source, comment_id)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_reply_outbox_due ON reply_outbox (status, next_attempt_at)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_reply_outbox_page_due ON reply_outbox (status, page_id, next_attempt_at)"
+                )
+        return self.requeue_stale(stale_after)
+
+    def requeue_stale(self, older_than: float = 0.0) -> int:
+        """Return replies claimed more than `older_than` seconds ago and never finished to 'pending'"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                return conn.execute(
+                    "UPDATE reply_outbox SET status = 'pending' WHERE status = 'sending' AND claimed_at <= ?",
+                    (time.time() - older_than,)
+                ).rowcount
+
+    def add_many(self, replies: Iterable[Dict[str, Any]]) -> int:
+        """Queue replies ({source, page_id, comment_id, message}), returns how many were new"""
+        now = time.time()
+        rows = [
+            (reply["source"], reply.get("page_id") or "", reply["comment_id"], reply["message"], now, now)
+            for reply in replies
+        ]
+        if not rows:
+            return 0
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                before = conn.total_changes
+                conn.executemany(
+                    "INSERT OR IGNORE INTO reply_outbox (source, page_id, comment_id, message, next_attempt_at, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                return conn.total_changes - before
+
+    def due(self, limit: int, exclude_pages: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """
+        Up to `limit` due replies, taking turns between pages: each page's oldest, then each page's second...
+        A page with a long backlog therefore never pushes another page's replies out of the batch
+        """
+        excluded = list(exclude_pages)
+        page_clause = f" AND page_id NOT IN ({', '.join('?' for _ in excluded)})" if excluded else ""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id, source, page_id, comment_id, message, attempts FROM ("
+                "SELECT *, ROW_NUMBER() OVER (PARTITION BY page_id ORDER BY next_attempt_at, id) AS turn "
+                f"FROM reply_outbox WHERE status = 'pending' AND next_attempt_at <= ?{page_clause}"
+                ") ORDER BY turn, next_attempt_at, id LIMIT ?",
+                [time.time(), *excluded, limit]
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def claim(self, replies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Mark `replies` (from due) as sending, returns the ones still pending"""
+        if not replies:
+            return []
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                # Conditional, so a row another process claimed in the meantime is skipped
+                now = time.time()
+                return [
+                    reply for reply in replies
+                    if conn.execute(
+                        "UPDATE reply_outbox SET status = 'sending', claimed_at = ? WHERE id = ? AND status = 'pending'",
+                        (now, reply["id"])
+                    ).rowcount
+                ]
+
+    def claim_due(self, limit: int, exclude_pages: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """Mark up to `limit` due replies as sending and return them, pages taking turns"""
+        return self.claim(self.due(limit, exclude_pages))
+
+    def next_due_in(self) -> Optional[float]:
+        """Seconds until the next pending reply is due, None if the outbox is empty"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT MIN(next_attempt_at) FROM reply_outbox WHERE status = 'pending'"
+            ).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def mark_sent(self, reply_id: int, graph_id: str):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "UPDATE reply_outbox SET status = 'sent', attempts = attempts + 1, reply_id = ?, "
+                    "last_error = '', sent_at = ? WHERE id = ?",
+                    (graph_id, time.time(), reply_id)
+                )
+
+    def reschedule(self, reply_id: int, delay: float, error: str, count_attempt: bool = True):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "UPDATE reply_outbox SET status = 'pending', attempts = attempts + ?, "
+                    "next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    (1 if count_attempt else 0, time.time() + delay, error[:500], reply_id)
+                )
+
+    def mark_failed(self, reply_id: int, error: str):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "UPDATE reply_outbox SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE id = ?",
+                    (error[:500], reply_id)
+                )
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT status, COUNT(*) FROM reply_outbox GROUP BY status"
+            ).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `capacity`; can be paused for a cool-down"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available (0 means one can be taken now)"""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            delay = self.delay()
+            if delay <= 0:
+                self.tokens -= 1.0
+                return
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    @property
+    def paused(self) -> bool:
+        return time.monotonic() < self.paused_until
+
+
+def usage_pause_seconds(headers, threshold: float = 90.0, default_pause: float = 60.0) -> Optional[float]:
+    """
+    Read Graph usage headers (X-App-Usage, X-Page-Usage, X-Business-Use-Case-Usage)
+    Returns how long to pause when any usage percentage reaches `threshold`, else None
+    """
+    usages: List[Dict[str, Any]] = []
+    for name in ("x-app-usage", "x-page-usage", "x-ad-account-usage"):
+        value = headers.get(name)
+        if value:
+            try:
+                usages.append(json.loads(value))
+            except ValueError:
+                pass
+    business = headers.get("x-business-use-case-usage")
+    if business:
+        try:
+            for entries in json.loads(business).values():
+                usages.extend(entry for entry in entries if isinstance(entry, dict))
+        except (ValueError, AttributeError):
+            pass
+
+    pause = None
+    for usage in usages:
+        if not isinstance(usage, dict):
+            continue
+        peak = max(
+            (float(usage.get(key) or 0) for key in ("call_count", "total_time", "total_cputime")),
+            default=0.0
+        )
+        regain_minutes = float(usage.get("estimated_time_to_regain_access") or 0)
+        if peak >= threshold or regain_minutes > 0:
+            seconds = regain_minutes * 60 if regain_minutes > 0 else default_pause
+            pause = max(pause or 0.0, seconds)
+    return pause
+
+
+class ReplyDispatcher:
+    """Sends outbox replies concurrently with per-page rate limiting and retries"""
+
+    def __init__(
+        self,
+        outbox: ReplyOutbox,
+        access_token: Optional[str],
+        graph_base_url: str = DEFAULT_GRAPH_BASE_URL,
+        max_concurrency: int = 8,
+        page_rate: float = 5.0,
+        page_burst: float = 10.0,
+        timeout: float = 10.0,
+        max_attempts: int = 6,
+        backoff_base: float = 2.0,
+        backoff_cap: float = 600.0,
+        usage_threshold: float = 90.0,
+        poll_interval: float = 1.0,
+        observe: Optional[Callable[[str, float], None]] = None,
+        requeue_after: Optional[float] = None,
+        tenants: Optional[TenantRegistry] = None,
+    ):
+        self.outbox = outbox
+        self.access_token = access_token if access_token and access_token != "your_page_access_token_here" else None
+        # Per-page tokens and per-tenant reply caps; without it every page uses `access_token`
+        self.tenants = tenants
+        self.graph_base_url = graph_base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.page_rate = page_rate
+        self.page_burst = page_burst
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.usage_threshold = usage_threshold
+        self.poll_interval = poll_interval
+        # Called with (outcome, seconds) after every Graph call, e.g. to feed a latency histogram
+        self.observe = observe
+        # With other processes sharing the outbox: requeue their replies stuck in 'sending' this long
+        self.requeue_after = requeue_after
+        self._last_requeue_check = time.monotonic()
+
+        self._client = None
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Tenant id -> its replies claimed and not yet finished
+        self.tenant_in_flight: Counter = Counter()
+
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.errors: Counter = Counter()
+
+    @property
+    def configured(self) -> bool:
+        return self.access_token is not None or (self.tenants is not None and self.tenants.access_token_configured)
+
+    def _tenant(self, page_id: str) -> Optional[Tenant]:
+        return self.tenants.resolve(page_id) if self.tenants is not None else None
+
+    def _token(self, page_id: str) -> Optional[str]:
+        tenant = self._tenant(page_id)
+        token = tenant.access_token if tenant is not None else None
+        return token or self.access_token
+
+    def _tenant_room(self, tenant: Optional[Tenant]) -> bool:
+        if tenant is None or tenant.reply_concurrency is None:
+            return True
+        return self.tenant_in_flight[tenant.id] < tenant.reply_concurrency
+
+    def _get_client(self):
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                ),
+                timeout=self.timeout
+            )
+        return self._client
+
+    def _bucket(self, page_id: str) -> TokenBucket:
+        bucket = self._buckets.get(page_id)
+        if bucket is None:
+            bucket = self._buckets[page_id] = TokenBucket(self.page_rate, self.page_burst)
+        return bucket
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(self.backoff_base, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+
+    def notify(self):
+        """Wake the dispatcher after new replies were added to the outbox"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def enqueue(self, replies: List[Dict[str, Any]]) -> int:
+        added = await asyncio.to_thread(self.outbox.add_many, replies)
+        if added:
+            self.notify()
+        return added
+
+    async def _run(self):
+        while True:
+            # Cleared before claiming so a notify() during the claim is not lost
+            self._wakeup.clear()
+            try:
+                if self.requeue_after and time.monotonic() - self._last_requeue_check >= self.requeue_after:
+                    self._last_requeue_check = time.monotonic()
+                    requeued = await asyncio.to_thread(self.outbox.requeue_stale, self.requeue_after)
+                    if requeued:
+                        logger.warning("Requeued replies abandoned mid-send", extra={"count": requeued})
+                if await self._dispatch_due():
+                    # Due replies are waiting on a tenant cap: a finishing send notifies
+                    delay = None
+                else:
+                    delay = await asyncio.to_thread(self.outbox.next_due_in)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Reply dispatcher error")
+                delay = None
+            wait = self.poll_interval if delay is None else min(max(delay, 0.01), self.poll_interval)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch_due(self) -> bool:
+        """Claim and start due replies while there is room; True when due replies were held back by tenant caps"""
+        while True:
+            free = self.max_concurrency - len(self._tasks)
+            if free <= 0:
+                return False
+            # Skip paused pages, and the listed pages of tenants already at their reply cap
+            excluded = [page for page, bucket in self._buckets.items() if bucket.paused]
+            if self.tenants is not None:
+                excluded.extend(
+                    page_id for tenant in self.tenants.tenants.values() if not self._tenant_room(tenant)
+                    for page_id in tenant.page_ids
+                )
+            # Over-fetch, since rows of a capped default-tenant page can only be skipped here
+            candidates = await asyncio.to_thread(self.outbox.due, free * 2, excluded)
+            picked = []
+            for reply in candidates:
+                tenant = self._tenant(reply["page_id"])
+                if not self._tenant_room(tenant):
+                    continue
+                if tenant is not None:
+                    self.tenant_in_flight[tenant.id] += 1
+                picked.append((reply, tenant))
+                if len(picked) >= free:
+                    break
+            claimed = await asyncio.to_thread(self.outbox.claim, [reply for reply, _ in picked])
+            claimed_ids = {reply["id"] for reply in claimed}
+            for reply, tenant in picked:
+                if reply["id"] not in claimed_ids and tenant is not None:
+                    self._release_tenant(tenant.id)
+            if not claimed:
+                return bool(candidates) and not picked
+            for reply in claimed:
+                task = asyncio.create_task(self._deliver(reply))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                task.add_done_callback(lambda _: self.notify())
+
+    def _release_tenant(self, tenant_id: str):
+        self.tenant_in_flight[tenant_id] -= 1
+        if self.tenant_in_flight[tenant_id] <= 0:
+            del self.tenant_in_flight[tenant_id]
+
+    async def _deliver(self, reply: Dict[str, Any]):
+        try:
+            await self._send(reply)
+        finally:
+            tenant = self._tenant(reply["page_id"])
+            if tenant is not None:
+                self._release_tenant(tenant.id)
+
+    async def _send(self, reply: Dict[str, Any]):
+        bucket = self._bucket(reply["page_id"])
+        try:
+            await bucket.acquire()
+            async with self._semaphore:
+                started = time.perf_counter()
+                outcome, detail, retry_after = await self._post(
+                    reply["source"], reply["comment_id"], reply["message"], bucket, self._token(reply["page_id"])
+                )
+                if self.observe is not None:
+                    self.observe(outcome, time.perf_counter() - started)
+        except Exception as e:
+            # Never leave a claimed reply stuck in 'sending'
+            outcome, detail, retry_after = "retry", f"{type(e).__name__}: {e}", 0.0
+            self.errors[type(e).__name__] += 1
+
+        if outcome == "sent":
+            self.sent += 1
+            await asyncio.to_thread(self.outbox.mark_sent, reply["id"], detail)
+        elif outcome == "throttled":
+            # Not the reply's fault: wait out the page's cool-down without using up an attempt
+            await asyncio.to_thread(self.outbox.reschedule, reply["id"], retry_after, detail, False)
+        elif outcome == "retry" and reply["attempts"] + 1 < self.max_attempts:
+            self.retries += 1
+            await asyncio.to_thread(self.outbox.reschedule, reply["id"], self._backoff(reply["attempts"]), detail)
+        else:
+            self.failed += 1
+            logger.warning("Reply failed permanently", extra={"source": reply["source"], "comment_id": reply["comment_id"], "error": detail})
+            await asyncio.to_thread(self.outbox.mark_failed, reply["id"], detail)
+
+    async def _post(
+        self,
+        source: str,
+        comment_id: str,
+        message: str,
+        bucket: Optional[TokenBucket] = None,
+        access_token: Optional[str] = None,
+    ):
+        """One Graph call; returns (outcome, reply id or error, retry_after) with outcome sent/throttled/retry/fail"""
+        import httpx
+
+        edge = REPLY_EDGES.get(source)
+        if edge is None:
+            return "fail", f"Unsupported source {source!r}", 0.0
+        access_token = access_token or self.access_token
+        if access_token is None:
+            return "fail", "No access token for this page", 0.0
+        url = f"{self.graph_base_url}/{comment_id}/{edge}"
+        try:
+            response = await self._get_client().post(
+                url, data={"message": message, "access_token": access_token}
+            )
+        except httpx.HTTPError as e:
+            self.errors[type(e).__name__] += 1
+            return "retry", f"{type(e).__name__}: {e}", 0.0
+
+        pause = usage_pause_seconds(response.headers, threshold=self.usage_threshold)
+        if pause and bucket is not None:
+            bucket.pause(pause)
+
+        if response.status_code == 200:
+            try:
+                return "sent", str(response.json().get("id", "")), 0.0
+            except ValueError:
+                return "sent", "", 0.0
+
+        try:
+            error = response.json().get("error", {})
+        except ValueError:
+            error = {}
+        code = error.get("code")
+        detail = f"{response.status_code} {error.get('message') or response.text[:200]}"
+        self.errors[str(code or response.status_code)] += 1
+
+        if response.status_code == 429 or code in RATE_LIMIT_ERROR_CODES:
+            self.rate_limited += 1
+            retry_after = pause or float(response.headers.get("retry-after") or 60)
+            if bucket is not None:
+                bucket.pause(retry_after)
+            return "throttled", detail, retry_after
+        if response.status_code >= 500 or error.get("is_transient"):
+            return "retry", detail, 0.0
+        # Deleted comment, bad token, permissions: retrying will not help
+        return "fail", detail, 0.0
+
+    async def send_now(self, source: str, comment_id: str, message: str, page_id: str = "") -> bool:
+        """Send one reply immediately with `page_id`'s token, bypassing the outbox"""
+        if self._token(page_id) is None:
+            return False
+        outcome, detail, _ = await self._post(source, comment_id, message, access_token=self._token(page_id))
+        if outcome != "sent":
+            logger.warning("Reply failed", extra={"source": source, "comment_id": comment_id, "error": detail})
+        return outcome == "sent"
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        if self._tasks:
+            # In-flight sends finish; anything cut off is requeued from 'sending' on next start
+            await asyncio.wait(self._tasks, timeout=self.timeout)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "configured": self.configured,
+            "outbox": self.outbox.counts(),
+            "in_flight": len(self._tasks),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "paused_pages": sorted(page for page, bucket in self._buckets.items() if bucket.paused),
+            "tenants_in_flight": dict(self.tenant_in_flight),
+            "errors": dict(self.errors),
+        }
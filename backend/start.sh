@@ -16,5 +16,11 @@ fi
 pip install -r requirements.txt
 
 # Start the server
+WEB_CONCURRENCY=${WEB_CONCURRENCY:-1}
 echo "Starting FastAPI server on $HOST:$PORT"
-uvicorn main:app --host $HOST --port $PORT --reload
\ No newline at end of file
+if [ "$WEB_CONCURRENCY" -gt 1 ]; then
+    # Several worker processes share state through Redis (STATE_BACKEND=redis)
+    uvicorn main:app --host $HOST --port $PORT --workers $WEB_CONCURRENCY
+else
+    uvicorn main:app --host $HOST --port $PORT --reload
+fi
\ No newline at end of file
@@ -0,0 +1,147 @@
+"""
+Structured JSON logging that never blocks the event loop.
+
+Log records go through a bounded in-memory queue to a background listener
+thread that formats and writes them, so a slow stdout pipe cannot stall
+webhook handling; when the queue is full records are dropped and counted.
+Every record carries the current request id, held in a context variable
+that the webhook handler sets and the workers restore for each delivery.
+Webhook payloads are logged only for a sampled fraction of requests, and
+truncated.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+import uuid
+from typing import Any, Optional
+
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="")
+
+# Attributes every LogRecord has; anything else was passed through `extra=` and is logged as a field
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def truncate(text: str, max_chars: int) -> str:
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... [{len(text) - max_chars} more chars]"
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp the current request id on the record while still in the caller's context"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, request_id, plus any `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", "")
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking or erroring when full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Format the message now; args may not be safe to read later from the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LoggingConfig:
+    """Holds the live handler/listener so the app can report drops and flush on shutdown"""
+
+    def __init__(self, handler: DroppingQueueHandler, listener: logging.handlers.QueueListener,
+                 payload_sample_rate: float, payload_max_chars: int):
+        self.handler = handler
+        self.listener = listener
+        self.payload_sample_rate = payload_sample_rate
+        self.payload_max_chars = payload_max_chars
+        self._stopped = False
+
+    def should_log_payload(self) -> bool:
+        return self.payload_sample_rate > 0 and random.random() < self.payload_sample_rate
+
+    def payload(self, body: Any) -> str:
+        if isinstance(body, bytes):
+            body = body.decode("utf-8", errors="replace")
+        return truncate(str(body), self.payload_max_chars)
+
+    @property
+    def dropped(self) -> int:
+        return self.handler.dropped
+
+    def stop(self):
+        """Flush queued records and stop the writer thread; safe to call more than once"""
+        if not self._stopped:
+            self._stopped = True
+            self.listener.stop()
+
+
+def configure_logging(
+    level: str = "INFO",
+    json_format: bool = True,
+    queue_size: int = 10000,
+    payload_sample_rate: float = 0.0,
+    payload_max_chars: int = 2048,
+    stream: Optional[Any] = None,
+) -> LoggingConfig:
+    """Route the root logger through a non-blocking queue to one stdout writer thread"""
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(
+        JsonFormatter() if json_format
+        else logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+    )
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    listener.start()
+    config = LoggingConfig(handler, listener, payload_sample_rate, payload_max_chars)
+    # Flush whatever is still queued when the process exits
+    atexit.register(config.stop)
+    return config
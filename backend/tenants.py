@@ -0,0 +1,190 @@
+"""
+Tenants: the client pages one deployment serves.
+
+Every Meta webhook entry names the page (or Instagram business account)
+it is about in entry.id, kept on each lead as page_id. A tenant owns one
+or more of those ids and brings its own:
+
+- Graph access token for replies, webhook verify token and app secret
+- API key that reads only its own leads (its storage partition: the
+  leads whose page_id is one of its pages)
+- classification prompt
+- quotas: LLM calls and reply sends in flight, and its share of the
+  webhook queue
+
+Tenants are read from a JSON file (TENANTS_FILE), see tenants.example.json.
+Pages not listed fall to the default tenant built from the global
+settings, or are ignored when the registry is strict.
+"""
+import json
+import math
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+# Settings a tenant entry may leave out, taken from the registry's defaults
+QUOTA_FIELDS = ('llm_concurrency', 'reply_concurrency', 'queue_share')
+
+
+class Tenant:
+    """One client: its pages, credentials, prompt and quotas"""
+
+    __slots__ = (
+        'id', 'name', 'page_ids', 'access_token', 'verify_token', 'app_secret', 'api_key', 'prompt',
+        'llm_concurrency', 'reply_concurrency', 'queue_share',
+    )
+
+    def __init__(
+        self,
+        tenant_id: str,
+        name: str = "",
+        page_ids: Iterable[str] = (),
+        access_token: Optional[str] = None,
+        verify_token: Optional[str] = None,
+        app_secret: Optional[str] = None,
+        api_key: Optional[str] = None,
+        prompt: Optional[str] = None,
+        llm_concurrency: Optional[int] = None,
+        reply_concurrency: Optional[int] = None,
+        queue_share: Optional[float] = None,
+    ):
+        self.id = tenant_id
+        self.name = name or tenant_id
+        self.page_ids = [str(page_id) for page_id in page_ids]
+        self.access_token = access_token or None
+        self.verify_token = verify_token or None
+        self.app_secret = app_secret or None
+        self.api_key = api_key or None
+        # Replaces the instructions part of the classification prompt; the answer format stays fixed
+        self.prompt = prompt or None
+        # None: no cap of its own, only the global limit and fair sharing apply
+        self.llm_concurrency = llm_concurrency
+        self.reply_concurrency = reply_concurrency
+        self.queue_share = queue_share
+
+    @property
+    def scope(self) -> str:
+        """Namespace for shared verdicts: tenants on the default prompt share them, a custom prompt gets its own"""
+        return self.id if self.prompt else ""
+
+    def queue_limit(self, max_size: int) -> int:
+        """Deliveries this tenant may have waiting in a queue of `max_size`"""
+        if self.queue_share is None:
+            return max_size
+        return max(1, math.floor(max_size * self.queue_share))
+
+    def summary(self) -> Dict[str, Any]:
+        """Public view: ids, quotas and which credentials are set, never the credentials themselves"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "page_ids": list(self.page_ids),
+            "access_token_configured": self.access_token is not None,
+            "verify_token_configured": self.verify_token is not None,
+            "app_secret_configured": self.app_secret is not None,
+            "api_key_configured": self.api_key is not None,
+            "custom_prompt": self.prompt is not None,
+            "llm_concurrency": self.llm_concurrency,
+            "reply_concurrency": self.reply_concurrency,
+            "queue_share": self.queue_share,
+        }
+
+
+class TenantRegistry:
+    """Page id -> tenant lookups for the webhook, the workers and the API"""
+
+    def __init__(self, tenants: Iterable[Tenant], default: Tenant, strict: bool = False):
+        self.tenants: Dict[str, Tenant] = {}
+        self._by_page: Dict[str, Tenant] = {}
+        self._by_api_key: Dict[str, Tenant] = {}
+        for tenant in tenants:
+            if tenant.id in self.tenants or tenant.id == default.id:
+                raise ValueError(f"Duplicate tenant id {tenant.id!r}")
+            self.tenants[tenant.id] = tenant
+            for page_id in tenant.page_ids:
+                if page_id in self._by_page:
+                    raise ValueError(f"Page {page_id} belongs to both {self._by_page[page_id].id!r} and {tenant.id!r}")
+                self._by_page[page_id] = tenant
+            if tenant.api_key is not None:
+                if tenant.api_key in self._by_api_key:
+                    raise ValueError(f"Tenants {self._by_api_key[tenant.api_key].id!r} and {tenant.id!r} share an API key")
+                self._by_api_key[tenant.api_key] = tenant
+        self.default = default
+        # Strict: comments on pages no tenant lists are dropped instead of served by the default tenant
+        self.strict = strict
+
+    @property
+    def configured(self) -> bool:
+        """True when tenants are defined, rather than everything running as the default tenant"""
+        return bool(self.tenants)
+
+    def resolve(self, page_id: str) -> Tenant:
+        """Tenant owning `page_id`, the default tenant for unlisted pages"""
+        return self._by_page.get(page_id, self.default)
+
+    def known(self, page_id: str) -> bool:
+        return page_id in self._by_page
+
+    def get(self, tenant_id: str) -> Tenant:
+        """Tenant by id, the default tenant for unknown ids"""
+        return self.tenants.get(tenant_id, self.default)
+
+    def by_api_key(self, api_key: Optional[str]) -> Optional[Tenant]:
+        return self._by_api_key.get(api_key) if api_key else None
+
+    def all(self) -> List[Tenant]:
+        return [self.default, *self.tenants.values()]
+
+    def verify_token_valid(self, token: str) -> bool:
+        """Meta's subscription handshake carries no page id, so any tenant's verify token is accepted"""
+        return any(tenant.verify_token is not None and token == tenant.verify_token for tenant in self.all())
+
+    def app_secrets(self) -> List[str]:
+        """Distinct app secrets a delivery may be signed with"""
+        secrets: List[str] = []
+        for tenant in self.all():
+            if tenant.app_secret is not None and tenant.app_secret not in secrets:
+                secrets.append(tenant.app_secret)
+        return secrets
+
+    @property
+    def access_token_configured(self) -> bool:
+        return any(tenant.access_token is not None for tenant in self.all())
+
+
+def load_tenants(
+    path: Optional[str],
+    default: Tenant,
+    strict: bool = False,
+    quotas: Optional[Dict[str, Any]] = None,
+) -> TenantRegistry:
+    """
+    Registry from a tenants JSON file ({"tenants": [...]}); only the default tenant when `path` is unset
+    `quotas` fill in QUOTA_FIELDS a tenant entry leaves out, and apply to the default tenant once tenants exist
+    """
+    if not path:
+        return TenantRegistry([], default, strict=False)
+    if not os.path.exists(path):
+        raise RuntimeError(f"TENANTS_FILE {path!r} does not exist")
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    quotas = {field: value for field, value in (quotas or {}).items() if value is not None}
+    tenants = []
+    for entry in config.get("tenants", []):
+        if not entry.get("id"):
+            raise ValueError(f"Tenant entry without an id in {path}")
+        settings = {**quotas, **{field: entry[field] for field in QUOTA_FIELDS if entry.get(field) is not None}}
+        tenants.append(Tenant(
+            str(entry["id"]),
+            name=entry.get("name", ""),
+            page_ids=entry.get("page_ids", []),
+            access_token=entry.get("access_token"),
+            verify_token=entry.get("verify_token"),
+            app_secret=entry.get("app_secret"),
+            api_key=entry.get("api_key"),
+            prompt=entry.get("prompt"),
+            **settings
+        ))
+    for field, value in quotas.items():
+        if getattr(default, field) is None:
+            setattr(default, field, value)
+    return TenantRegistry(tenants, default, strict=strict)
@@ -1,6 +1,6 @@
 "use client";
 
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import {
     Home,
     Users,
@@ -23,6 +23,7 @@ import {
 } from 'lucide-react';
 
 interface Lead {
+    id?: number;
     timestamp: string;
     source: string;
     user_id: string;
@@ -35,52 +36,75 @@ interface Lead {
 interface Stats {
     totalLeads: number;
     highPriority: number;
+    mediumPriority: number;
+    lowPriority: number;
     aiResponses: number;
 }
 
+const EMPTY_STATS: Stats = { totalLeads: 0, highPriority: 0, mediumPriority: 0, lowPriority: 0, aiResponses: 0 };
+
 // Get backend URL from environment
 const BACKEND_URL = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://localhost:8000';
 const API_KEY = process.env.NEXT_PUBLIC_API_KEY || 'your-secret-api-key-here';
 
+// How many leads the dashboard keeps in memory
+const MAX_LEADS = 500;
+
 export default function Dashboard() {
     const [leads, setLeads] = useState<Lead[]>([]);
-    const [stats, setStats] = useState<Stats>({ totalLeads: 0, highPriority: 0, aiResponses: 0 });
+    const [stats, setStats] = useState<Stats>(EMPTY_STATS);
     const [loading, setLoading] = useState(true);
     const [lastUpdate, setLastUpdate] = useState<Date | null>(null);
     const [error, setError] = useState<string | null>(null);
     const [activeTab, setActiveTab] = useState('dashboard');
 
-    const fetchLeads = async () => {
-        try {
-            const response = await fetch(`${BACKEND_URL}/leads`, {
-                headers: {
-                    'X-API-Key': API_KEY,
-                },
-            });
+    // Highest lead id received so far, used to ask the backend only for newer leads
+    const lastIdRef = useRef(0);
 
-            if (!response.ok) {
-                if (response.status === 401) {
-                    throw new Error('Invalid API Key');
-                }
-                throw new Error(`HTTP error! status: ${response.status}`);
+    const trackLastId = (leadsData: Lead[]) => {
+        for (const lead of leadsData) {
+            if (lead.id && lead.id > lastIdRef.current) {
+                lastIdRef.current = lead.id;
             }
+        }
+    };
 
-            const data = await response.json();
-            const leadsData = data.leads || [];
+    // Prepend newly arrived leads (oldest first from the backend) without duplicates
+    const mergeLeads = (incoming: Lead[]) => {
+        // Lead ids only grow, so anything at or below the last seen id is a repeat
+        const fresh = incoming.filter(lead => !lead.id || lead.id > lastIdRef.current);
+        if (fresh.length === 0) return;
+        trackLastId(fresh);
+        countLeads(fresh);
+        setLeads(prev => [...fresh.reverse(), ...prev].slice(0, MAX_LEADS));
+        setLastUpdate(new Date());
+    };
 
-            setLeads(leadsData);
+    const fetchFromBackend = async (query: string) => {
+        const response = await fetch(`${BACKEND_URL}/leads?${query}`, {
+            headers: {
+                'X-API-Key': API_KEY,
+            },
+        });
 
-            // Calculate stats
-            const total = leadsData.length;
-            const high = leadsData.filter((lead: Lead) => lead.priority === 'High').length;
-            const aiResp = leadsData.filter((lead: Lead) => lead.ai_response && lead.ai_response.trim() !== '').length;
+        if (!response.ok) {
+            if (response.status === 401) {
+                throw new Error('Invalid API Key');
+            }
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
 
-            setStats({
-                totalLeads: total,
-                highPriority: high,
-                aiResponses: aiResp
-            });
+        const data = await response.json();
+        return (data.leads || []) as Lead[];
+    };
 
+    // Full reload of the most recent page
+    const fetchLeads = async () => {
+        fetchStats();
+        try {
+            const leadsData = await fetchFromBackend(`limit=${MAX_LEADS}`);
+            trackLastId(leadsData);
+            setLeads(leadsData);
             setLastUpdate(new Date());
             setError(null);
         } catch (err) {
@@ -91,13 +115,97 @@ export default function Dashboard() {
         }
     };
 
+    // Fallback when streaming is unavailable: poll for the delta only
+    const fetchNewLeads = async () => {
+        try {
+            mergeLeads(await fetchFromBackend(`since=${lastIdRef.current}&limit=1000`));
+            setError(null);
+        } catch (err) {
+            console.error('Error fetching new leads:', err);
+            setError(err instanceof Error ? err.message : 'Failed to fetch leads');
+        }
+    };
+
+    // Counters are maintained by the backend; the dashboard never scans the lead list
+    const fetchStats = async () => {
+        try {
+            const response = await fetch(`${BACKEND_URL}/leads/stats?hours=0`, {
+                headers: {
+                    'X-API-Key': API_KEY,
+                },
+            });
+            if (!response.ok) return;
+
+            const data = await response.json();
+            const byPriority = data.by_priority || {};
+            setStats({
+                totalLeads: data.total || 0,
+                highPriority: byPriority.High || 0,
+                mediumPriority: byPriority.Medium || 0,
+                lowPriority: byPriority.Low || 0,
+                aiResponses: data.ai_responses || 0
+            });
+        } catch (err) {
+            console.error('Error fetching stats:', err);
+        }
+    };
+
+    // Keep counters current between resyncs as streamed leads arrive
+    const countLeads = (incoming: Lead[]) => {
+        setStats(prev => {
+            const next = { ...prev };
+            for (const lead of incoming) {
+                next.totalLeads += 1;
+                if (lead.priority === 'High') next.highPriority += 1;
+                if (lead.priority === 'Medium') next.mediumPriority += 1;
+                if (lead.priority === 'Low') next.lowPriority += 1;
+                if (lead.ai_response && lead.ai_response.trim() !== '') next.aiResponses += 1;
+            }
+            return next;
+        });
+    };
+
     useEffect(() => {
-        fetchLeads();
+        let source: EventSource | null = null;
+        let interval: ReturnType<typeof setInterval> | null = null;
+        let cancelled = false;
+
+        // Periodic resync of the (few hundred byte) counters
+        const statsInterval = setInterval(fetchStats, 60000);
 
-        // Auto-refresh every 5 seconds
-        const interval = setInterval(fetchLeads, 5000);
+        const startPolling = () => {
+            if (!interval) {
+                interval = setInterval(fetchNewLeads, 5000);
+            }
+        };
+
+        fetchLeads().then(() => {
+            if (cancelled) return;
+            if (typeof EventSource === 'undefined') {
+                startPolling();
+                return;
+            }
+
+            // Server pushes each lead as it is stored; the browser reconnects with Last-Event-ID
+            const params = new URLSearchParams({ api_key: API_KEY, since: String(lastIdRef.current) });
+            source = new EventSource(`${BACKEND_URL}/leads/stream?${params}`);
+            source.addEventListener('lead', (event) => {
+                mergeLeads([JSON.parse((event as MessageEvent).data)]);
+            });
+            source.onerror = () => {
+                // Closed for good (e.g. rejected): fall back to delta polling
+                if (source && source.readyState === EventSource.CLOSED) {
+                    startPolling();
+                }
+            };
+        });
 
-        return () => clearInterval(interval);
+        return () => {
+            cancelled = true;
+            source?.close();
+            if (interval) clearInterval(interval);
+            clearInterval(statsInterval);
+        };
     }, []);
 
     const getSourceIcon = (source: string) => {
@@ -241,7 +349,7 @@ export default function Dashboard() {
                                 </tr>
                             ) : (
                                 leads.map((lead, index) => (
-                                    <tr key={index} className="hover:bg-gray-50 transition-colors">
+                                    <tr key={lead.id ?? index} className="hover:bg-gray-50 transition-colors">
                                         <td className="px-6 py-4">
                                             <div className="flex items-center space-x-2">
                                                 {getSourceIcon(lead.source)}
@@ -291,7 +399,7 @@ export default function Dashboard() {
                 ) : (
                     <div className="space-y-3">
                         {leads.map((lead, index) => (
-                            <div key={index} className="border border-gray-200 rounded-xl p-4 hover:shadow-md transition-all bg-gradient-to-r from-gray-50 to-white">
+                            <div key={lead.id ?? index} className="border border-gray-200 rounded-xl p-4 hover:shadow-md transition-all bg-gradient-to-r from-gray-50 to-white">
                                 <div className="flex items-center justify-between mb-2">
                                     <div className="flex items-center gap-3">
                                         {getSourceIcon(lead.source)}
@@ -350,15 +458,15 @@ export default function Dashboard() {
                     <div className="space-y-3">
                         <div className="bg-white/10 rounded-lg p-4">
                             <div className="text-sm opacity-80 mb-1">Hot Leads</div>
-                            <div className="text-3xl font-black">{leads.filter(l => l.priority === 'High').length}</div>
+                            <div className="text-3xl font-black">{stats.highPriority}</div>
                         </div>
                         <div className="bg-white/10 rounded-lg p-4">
                             <div className="text-sm opacity-80 mb-1">Warm Leads</div>
-                            <div className="text-3xl font-black">{leads.filter(l => l.priority === 'Medium').length}</div>
+                            <div className="text-3xl font-black">{stats.mediumPriority}</div>
                         </div>
                         <div className="bg-white/10 rounded-lg p-4">
                             <div className="text-sm opacity-80 mb-1">Cold Leads</div>
-                            <div className="text-3xl font-black">{leads.filter(l => l.priority === 'Low').length}</div>
+                            <div className="text-3xl font-black">{stats.lowPriority}</div>
                         </div>
                     </div>
                 </div>